@@ -3,11 +3,13 @@ import os
 import logging
 import httpx
 import asyncio
+import threading
 import logging.handlers
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime
-from typing import List, Tuple, Optional, Dict, Any
+from typing import List, Tuple, Optional, Dict, Any, Callable
 from uuid import uuid4
 from nicegui import ui, app
 from transformers import T5ForConditionalGeneration, T5Tokenizer, pipeline as hf_pipeline, AutoModelForSequenceClassification, AutoTokenizer
@@ -18,7 +20,15 @@ from utils.cache_loader import (
     cargar_documentos_word_desde_sharepoint,
 )
 from utils.embedding_index import DocumentIndexer, IndexConfig
-from utils.web_search import buscar_normativa_web
+from utils.response_cache import ResponseCache, ResponseCacheConfig
+from utils.semantic_cache import SemanticCache
+from utils.inference_scheduler import InferenceScheduler, SchedulerConfig
+from utils.model_inference import clasificar_lote, responder_qa_pretokenizado_lote, generar_t5_lote
+from utils.loop_monitor import EventLoopLagMonitor
+from utils.replica_pool import ReplicaPool
+from utils.fast_classifier import ClasificadorRapido
+from utils.normativa_local import NormativaLocal, NormativaLocalConfig
+from utils.web_search import buscar_normativa_web, establecer_normativa_local
 from utils.transforms import (
     calcular_dias_pendientes_vacaciones,
     calcular_valor_ultima_consignacion,
@@ -29,8 +39,9 @@ from utils.transforms import (
     obtener_retencion_fuente,
     calcular_total_pagado_acumulado,
     get_transform_keywords,
-    get_transform_by_keyword
+    get_transform_keyword_groups
 )
+from utils.keyword_matcher import KeywordMatcher, ResultadoRuteo
 import torch
 
 # Cargar variables de entorno (descomentado)
@@ -91,6 +102,62 @@ FEEDBACK_DIR = BASE_DIR / "feedback"
 FEEDBACK_DIR.mkdir(exist_ok=True)
 FEEDBACK_FILE = FEEDBACK_DIR / "feedback_incorrecto.txt"
 
+# Caché persistente de respuestas generales
+RESPONSE_CACHE_FILE = BASE_DIR / ".response_cache" / "respuestas.sqlite3"
+
+# Palabras clave de normativa. El grupo "contexto" solo se usa al clasificar
+KEYWORDS_NORMATIVA = {
+    "normativa": [
+        "ley", "decreto", "resolución", "norma", "reglamento", "estatuto",
+        "código", "artículo", "parágrafo", "literal", "inciso", "jurídico",
+        "legal", "normativo", "legislación", "derecho", "obligación", "deber"
+    ],
+    "contexto": [
+        "acoso", "laboral", "trabajo", "contrato", "empleado", "empleador",
+        "salud", "seguridad", "riesgo", "prevención", "protección"
+    ]
+}
+
+# Cabeza lineal de clasificación rápida (se entrena con las decisiones de BERT)
+CLASIFICADOR_RAPIDO_FILE = BASE_DIR / ".clasificador_rapido" / "cabeza_lineal.npz"
+
+# Dataset de entrenamiento (JSONL, un {"question", "answer"} por línea): se indexa con los
+# documentos y alimenta las respuestas exactas de `_responder_pregunta`
+TRAINING_DATASET_FILE = Path(os.getenv("TRAINING_DATASET_PATH", str(BASE_DIR / "dataset" / "dataset_entrenamiento.jsonl")))
+
+# Espejo local de la normativa laboral (HTML, texto de PDF o DOCX) que consulta la búsqueda de normativa
+NORMATIVA_DIR = Path(os.getenv("NORMATIVA_DIR", str(BASE_DIR / "normativa_local")))
+
+# Prefijos de las respuestas de error o de baja calidad, que nunca se cachean
+PREFIJOS_RESPUESTA_FALLIDA = ("Lo siento", "No se pudo", "Error")
+
+
+class ConsultaCancelada(Exception):
+    """Se lanza cuando el usuario cancela una consulta en curso."""
+
+
+class EmbeddingConsulta:
+    """
+    Embedding de la pregunta calculado como máximo una vez por solicitud, y solo si
+    alguna etapa lo necesita (clasificación rápida, caché semántico, recuperación).
+    """
+
+    def __init__(self, funcion: Callable[[str], Any], pregunta: str):
+        self._funcion = funcion
+        self._pregunta = pregunta
+        self._valor = None
+        self._calculado = False
+
+    def __call__(self):
+        """Retorna el embedding, o None si no se pudo calcular."""
+        if not self._calculado:
+            self._calculado = True
+            try:
+                self._valor = self._funcion(self._pregunta)
+            except Exception as e:
+                logger.error(f"Error calculando el embedding de la pregunta: {e}")
+        return self._valor
+
 class ChatNominaApp:
 
     def __init__(self):
@@ -123,6 +190,7 @@ class ChatNominaApp:
         self.bert_model: Optional[AutoModelForSequenceClassification] = None
         self.bert_tokenizer: Optional[AutoTokenizer] = None
         self.qa_pipeline = None
+        self.replica_pool: Optional[ReplicaPool] = None
         
         # Categorías de preguntas y transformaciones
         self.transform_keywords = get_transform_keywords()
@@ -131,6 +199,15 @@ class ChatNominaApp:
             "general_info": ["qué", "cómo", "cuándo", "dónde", "por qué"],
             "document_qa": ["normativa", "ley", "decreto", "resolucion", "articulo"]
         }
+
+        # Buscador compilado con todas las tablas de palabras clave de ruteo.
+        # Las interrogativas de general_info solo coinciden con tilde ("qué" y no "que")
+        self.keyword_matcher = (
+            KeywordMatcher()
+            .agregar_tabla("normativa", KEYWORDS_NORMATIVA)
+            .agregar_tabla("transformaciones", get_transform_keyword_groups())
+            .agregar_tabla("categorias", self.question_categories, respetar_acentos=["general_info"])
+        )
         
         # Mapeo de funciones de transformación
         self.transform_functions = {
@@ -153,8 +230,50 @@ class ChatNominaApp:
         self.app = PublicClientApplication(client_id=self.CLIENT_ID, authority=self.AUTHORITY)
         
         # Initialize DocumentIndexer (sin cargar modelos aún)
-        indexer_config = IndexConfig(model_name="hiiamsid/sentence_similarity_spanish_es")
+        dataset_entrenamiento = None
+        if TRAINING_DATASET_FILE.exists():
+            dataset_entrenamiento = str(TRAINING_DATASET_FILE)
+        else:
+            logger.warning(
+                f"No existe el dataset de entrenamiento {TRAINING_DATASET_FILE} (TRAINING_DATASET_PATH): "
+                "se indexarán solo los documentos y no habrá respuestas exactas"
+            )
+        indexer_config = IndexConfig(
+            model_name="hiiamsid/sentence_similarity_spanish_es",
+            qa_tokenizer_name=self.MODELO_DIR,
+            training_dataset_path=dataset_entrenamiento
+        )
         self.indexer = DocumentIndexer(config=indexer_config)
+
+        # Espejo local de normativa, con el mismo modelo de embeddings; se sincroniza al iniciar
+        self.normativa_local: Optional[NormativaLocal] = None
+        try:
+            self.normativa_local = NormativaLocal(
+                NormativaLocalConfig(directorio=str(NORMATIVA_DIR)),
+                modelo_embeddings=self.indexer.modelo_embeddings
+            )
+            establecer_normativa_local(self.normativa_local)
+        except Exception as e:
+            logger.error(f"No se pudo abrir el espejo local de normativa: {e}")
+
+        # Caché de respuestas generales (RAG / T5), nunca de datos personales
+        self.response_cache = ResponseCache(ResponseCacheConfig(db_path=str(RESPONSE_CACHE_FILE)))
+        self.semantic_cache = SemanticCache(self.indexer.calcular_embedding_consulta)
+        self.clasificador_rapido = ClasificadorRapido(str(CLASIFICADOR_RAPIDO_FILE))
+
+        # Planificador que agrupa en lotes la inferencia de todas las sesiones
+        self.scheduler = InferenceScheduler(SchedulerConfig(
+            max_batch_size=int(os.getenv("INFERENCIA_MAX_BATCH", "8")),
+            max_wait_ms=float(os.getenv("INFERENCIA_MAX_ESPERA_MS", "5"))
+        ))
+
+        # El pipeline de respuesta corre fuera del event loop de NiceGUI
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("INFERENCIA_WORKERS", "4")),
+            thread_name_prefix="respuesta"
+        )
+        self._consultas_activas: Dict[str, threading.Event] = {}
+        self.monitor_loop = EventLoopLagMonitor(umbral_ms=50.0)
         logger.info("ChatNominaApp inicializada (sin modelos).")
 
     async def cargar_modelos(self):
@@ -163,6 +282,10 @@ class ChatNominaApp:
             logger.info("Los modelos ya están cargados.")
             return True
 
+        num_replicas = int(os.getenv("INFERENCIA_REPLICAS", "0"))
+        if num_replicas > 0:
+            return await self._cargar_replicas(num_replicas)
+
         logger.info("Iniciando carga de modelos...")
         try:
             # Cargar modelo T5 con configuración específica para CPU
@@ -214,6 +337,8 @@ class ChatNominaApp:
                 torch_dtype=torch.float32
             )
             
+            self._registrar_modelos_scheduler()
+
             logger.info("Todos los modelos cargados exitosamente")
             self.modelos_cargados = True
             return True
@@ -222,10 +347,57 @@ class ChatNominaApp:
             logger.error(f"Error al cargar los modelos: {e}", exc_info=True)
             return False
 
+    async def _cargar_replicas(self, num_replicas: int) -> bool:
+        """
+        Inicia procesos réplica de inferencia en lugar de cargar los modelos en este
+        proceso; el planificador envía cada lote a la réplica menos cargada.
+        """
+        logger.info(f"Iniciando {num_replicas} réplicas de inferencia desde: {self.MODELO_DIR}...")
+        try:
+            self.replica_pool = ReplicaPool(
+                self.MODELO_DIR,
+                num_replicas,
+                max_length=self.MAX_LENGTH,
+                timeout_lote=float(os.getenv("INFERENCIA_TIMEOUT_LOTE_S", "120"))
+            )
+            loop = asyncio.get_running_loop()
+            if not await loop.run_in_executor(None, self.replica_pool.iniciar):
+                logger.error("Ninguna réplica de inferencia pudo cargar los modelos")
+                return False
+
+            for tarea in ("clasificador", "qa", "t5"):
+                self.scheduler.registrar_modelo(
+                    tarea,
+                    lambda lote, tarea=tarea: self.replica_pool.ejecutar_lote(tarea, lote),
+                    concurrencia=num_replicas
+                )
+            self.modelos_cargados = True
+            return True
+        except Exception as e:
+            logger.error(f"Error al iniciar las réplicas de inferencia: {e}", exc_info=True)
+            return False
+
+    def _registrar_modelos_scheduler(self):
+        """Registra en el planificador la inferencia por lotes de cada modelo cargado."""
+        self.scheduler.registrar_modelo(
+            "clasificador",
+            lambda preguntas: clasificar_lote(self.bert_model, self.bert_tokenizer, preguntas)
+        )
+        self.scheduler.registrar_modelo(
+            "qa",
+            lambda entradas: responder_qa_pretokenizado_lote(
+                self.qa_pipeline.model, self.qa_pipeline.tokenizer, entradas, max_answer_len=150
+            )
+        )
+        self.scheduler.registrar_modelo(
+            "t5",
+            lambda prompts: generar_t5_lote(self.model_t5, self.tokenizer_t5, prompts, self.MAX_LENGTH)
+        )
+
     def _generar_respuesta_t5(self, prompt: str) -> str:
         """Genera una respuesta usando el modelo T5."""
         try:
-            if not self.model_t5 or not self.tokenizer_t5:
+            if not self.scheduler.tiene_modelo("t5"):
                 logger.error("Modelo T5 o tokenizer no están cargados")
                 return "No se pudo generar la respuesta porque el modelo no está cargado."
 
@@ -237,46 +409,14 @@ Contexto: Esta es una pregunta sobre nómina y recursos humanos de la Universida
 Instrucciones: Genera una respuesta específica y útil. Si no tienes información suficiente, indica que necesitas más detalles.
 Respuesta:"""
 
-            # Tokenizar con configuración específica
-            inputs = self.tokenizer_t5(
-                prompt,
-                max_length=self.MAX_LENGTH,
-                truncation=True,
-                return_tensors="pt",
-                padding=True,
-                add_special_tokens=True
-            )
-
-            # Generar respuesta con parámetros optimizados
-            with torch.no_grad():
-                try:
-                    outputs = self.model_t5.generate(
-                        inputs["input_ids"],
-                        max_length=min(self.MAX_LENGTH, 512),
-                        min_length=100,  # Aumentado para respuestas más completas
-                        num_beams=5,     # Aumentado para mejor calidad
-                        length_penalty=2.0,  # Aumentado para favorecer respuestas más largas
-                        early_stopping=True,
-                        do_sample=True,  # Habilitado para mejor diversidad
-                        temperature=0.7,  # Reducido para más coherencia
-                        top_k=50,        # Ajustado para mejor calidad
-                        top_p=0.9,       # Ajustado para mejor calidad
-                        repetition_penalty=1.2,  # Ajustado para evitar repeticiones
-                        no_repeat_ngram_size=3,
-                        forced_bos_token_id=self.tokenizer_t5.bos_token_id,
-                        forced_eos_token_id=self.tokenizer_t5.eos_token_id,
-                        pad_token_id=self.tokenizer_t5.pad_token_id,
-                        num_return_sequences=1
-                    )
-                except RuntimeError as e:
-                    if "out of memory" in str(e):
-                        logger.error("Error de memoria al generar respuesta")
-                        return "Lo siento, hubo un error de memoria al procesar tu pregunta. Por favor, intenta con una pregunta más corta."
-                    raise
-
-            # Decodificar y limpiar la respuesta
-            respuesta = self.tokenizer_t5.decode(outputs[0], skip_special_tokens=True)
-            respuesta = respuesta.strip()
+            # Generar la respuesta en el lote compartido del planificador
+            try:
+                respuesta = self.scheduler.ejecutar("t5", prompt)
+            except RuntimeError as e:
+                if "out of memory" in str(e):
+                    logger.error("Error de memoria al generar respuesta")
+                    return "Lo siento, hubo un error de memoria al procesar tu pregunta. Por favor, intenta con una pregunta más corta."
+                raise
             
             # Limpiar la respuesta de prefijos comunes y contenido no deseado
             for prefix in ["Pregunta:", "Contexto:", "Instrucciones:", "Respuesta:"]:
@@ -324,51 +464,67 @@ Respuesta:"""
             logger.error(f"Error generando respuesta con T5: {e}", exc_info=True)
             return "No se pudo generar una respuesta en este momento. Por favor, intenta reformular tu pregunta."
 
-    def _clasificar_pregunta(self, pregunta: str) -> Tuple[str, float]:
-        """Clasifica la pregunta usando múltiples estrategias y retorna la categoría y su confianza."""
-        pregunta_lower = pregunta.lower().strip()
+    def _rutear_pregunta(self, pregunta: str) -> ResultadoRuteo:
+        """Busca en una sola pasada todas las palabras clave de ruteo de la pregunta."""
+        ruteo = self.keyword_matcher.buscar(pregunta.strip())
+        logger.debug(f"Ruteo por palabras clave: {ruteo.grupos}")
+        return ruteo
+
+    def _transformacion_de(self, ruteo: ResultadoRuteo) -> Optional[Dict[str, Any]]:
+        """Retorna la transformación de mayor prioridad encontrada en el ruteo."""
+        nombre = ruteo.primer_grupo("transformaciones")
+        return self.transform_keywords[nombre] if nombre else None
+
+    def _clasificar_pregunta(
+        self,
+        pregunta: str,
+        embedding: Optional[EmbeddingConsulta] = None,
+        ruteo: Optional[ResultadoRuteo] = None
+    ) -> Tuple[str, float]:
+        """
+        Clasifica la pregunta usando múltiples estrategias y retorna la categoría y su
+        confianza. BERT solo se usa si la cabeza lineal sobre el embedding no es confiable.
+        """
+        if ruteo is None:
+            ruteo = self._rutear_pregunta(pregunta)
         
         # 1. Verificar si es una pregunta de normativa primero
-        keywords_normativa = [
-            "ley", "decreto", "resolución", "norma", "reglamento", "estatuto",
-            "código", "artículo", "parágrafo", "literal", "inciso", "jurídico",
-            "legal", "normativo", "legislación", "derecho", "obligación", "deber",
-            "acoso", "laboral", "trabajo", "contrato", "empleado", "empleador",
-            "salud", "seguridad", "riesgo", "prevención", "protección"
-        ]
-        if any(keyword in pregunta_lower for keyword in keywords_normativa):
+        if ruteo.tiene("normativa"):
             logger.debug("Pregunta clasificada como 'document_qa' por contenido normativo")
             return "document_qa", 0.9
         
         # 2. Verificar palabras clave específicas
-        transform_info = get_transform_by_keyword(pregunta_lower)
+        transform_info = self._transformacion_de(ruteo)
         if transform_info:
             logger.debug(f"Pregunta clasificada como '{transform_info['category']}' por palabra clave específica")
             return transform_info['category'], 0.9
         
         # 3. Verificar palabras clave generales
-        for categoria, keywords in self.question_categories.items():
-            if any(keyword in pregunta_lower for keyword in keywords):
-                logger.debug(f"Pregunta clasificada como '{categoria}' por palabras clave generales")
-                return categoria, 0.8
+        categoria = ruteo.primer_grupo("categorias")
+        if categoria:
+            logger.debug(f"Pregunta clasificada como '{categoria}' por palabras clave generales")
+            return categoria, 0.8
         
-        # 4. Usar BERT para clasificación
+        # 4. Cabeza lineal sobre el embedding de la pregunta
+        vector = None
+        if embedding is not None:
+            try:
+                vector = embedding()
+                prediccion = self.clasificador_rapido.clasificar(vector) if vector is not None else None
+                if prediccion:
+                    logger.debug(f"Pregunta clasificada como '{prediccion[0]}' por el clasificador rápido")
+                    return prediccion
+            except Exception as e:
+                logger.warning(f"Error en clasificador rápido: {e}")
+
+        # 5. Usar BERT para clasificación
         try:
-            if self.bert_model and self.bert_tokenizer:
-                inputs = self.bert_tokenizer(
-                    pregunta,
-                    return_tensors="pt",
-                    truncation=True,
-                    max_length=512
-                )
-                
-                with torch.no_grad():
-                    outputs = self.bert_model(**inputs)
-                    predictions = torch.softmax(outputs.logits, dim=1)
-                    confianza, categoria_idx = torch.max(predictions, dim=1)
-                    
-                categorias = ["specific_data", "general_info", "document_qa"]
-                return categorias[categoria_idx.item()], confianza.item()
+            if self.scheduler.tiene_modelo("clasificador"):
+                categoria, confianza = self.scheduler.ejecutar("clasificador", pregunta)
+                if vector is not None:
+                    # Cada decisión de BERT entrena la cabeza lineal
+                    self.clasificador_rapido.agregar_ejemplo(vector, categoria)
+                return categoria, confianza
         except Exception as e:
             logger.error(f"Error en clasificación BERT: {e}")
         
@@ -378,12 +534,7 @@ Respuesta:"""
 
     def _es_pregunta_normativa(self, pregunta: str) -> bool:
         """Determina si una pregunta está relacionada con normativa."""
-        keywords_normativa = [
-            "ley", "decreto", "resolución", "norma", "reglamento", "estatuto",
-            "código", "artículo", "parágrafo", "literal", "inciso", "jurídico",
-            "legal", "normativo", "legislación", "derecho", "obligación", "deber"
-        ]
-        return any(keyword in pregunta.lower() for keyword in keywords_normativa)
+        return self.keyword_matcher.buscar(pregunta).tiene("normativa", "normativa")
 
     def _verificar_documento_en_cache(self, documento: str) -> bool:
         """Verifica si el documento existe en el contenido de los archivos."""
@@ -416,8 +567,17 @@ Respuesta:"""
             logger.error(f"Error al verificar documento en caché: {e}")
             return False
 
-    def _responder_pregunta(self, pregunta_texto: str) -> str:
-        """Orquesta la lógica para responder una pregunta del usuario."""
+    @staticmethod
+    def _verificar_cancelacion(cancelacion: Optional[threading.Event]):
+        """Interrumpe el pipeline entre etapas si la consulta fue cancelada."""
+        if cancelacion is not None and cancelacion.is_set():
+            raise ConsultaCancelada()
+
+    def _responder_pregunta(self, pregunta_texto: str, cancelacion: Optional[threading.Event] = None) -> str:
+        """
+        Orquesta la lógica para responder una pregunta del usuario. Es bloqueante
+        (inferencia, Chroma, búsqueda en archivos): debe ejecutarse en `self.executor`.
+        """
         logger.info(f"Procesando pregunta: \"{pregunta_texto}\"")
         logger.info(f"Estado actual - Documento usuario: {self.documento_usuario}, Documentos cargados: {self.documentos_cargados}")
         logger.info(f"Estado de caché - TXT: {len(self.txt_cache)}, Word: {len(self.word_docs)}")
@@ -434,18 +594,29 @@ Respuesta:"""
             logger.warning("No hay documento de usuario registrado")
             return "Por favor, ingresa tu número de documento primero para que pueda ayudarte mejor."
 
+        # --- PASO 1b: Respuesta curada del dataset para una pregunta idéntica ---
+        # Solo requiere el índice (se carga al iniciar): no se clasifica, busca ni genera
+        respuesta_exacta = self.indexer.respuesta_exacta(pregunta_texto)
+        if respuesta_exacta:
+            logger.info("Respuesta obtenida del dataset de entrenamiento (coincidencia exacta)")
+            return respuesta_exacta
+
         # --- PASO 2: Verificar documentos y modelos cargados ---
         if not self.documentos_cargados or not self.modelos_cargados:
             logger.warning("Los documentos o modelos no están completamente cargados")
             return "Los documentos aún se están procesando. Por favor, espera un momento antes de hacer preguntas."
 
         # --- PASO 3: Clasificar la pregunta ---
-        categoria, confianza = self._clasificar_pregunta(pregunta_texto)
+        embedding = EmbeddingConsulta(self.indexer.calcular_embedding_consulta, pregunta_texto)
+        ruteo = self._rutear_pregunta(pregunta_texto)
+        categoria, confianza = self._clasificar_pregunta(pregunta_texto, embedding, ruteo)
         logger.info(f"Pregunta clasificada como: {categoria} (confianza: {confianza:.2f})")
+        self._verificar_cancelacion(cancelacion)
         
         # --- PASO 4: Funciones de transformación directa (keywords) ---
         if categoria == "specific_data" and confianza > 0.7:
-            transform_info = get_transform_by_keyword(pregunta_texto)
+            # Se reutiliza el ruteo de la clasificación en lugar de volver a buscar
+            transform_info = self._transformacion_de(ruteo)
             logger.info(f"Transformación encontrada: {transform_info}")
             if transform_info:
                 try:
@@ -461,48 +632,67 @@ Respuesta:"""
                 except Exception as e:
                     logger.error(f"Error en transformación directa para {transform_info['transform_func']}: {e}")
         
-        # --- PASO 5: Búsqueda Semántica (RAG) para preguntas generales o de normativa ---
-        if categoria in ["document_qa", "general_info"] and self.indexer and self.qa_pipeline and self.indexer.esta_indexacion_completa():
+        # --- PASO 5: Caché de respuestas generales ---
+        # Las preguntas de datos específicos dependen del empleado y nunca se cachean
+        cacheable = categoria != "specific_data"
+        generacion = self.indexer.generacion_indice
+        if cacheable:
+            respuesta_cache = self.response_cache.obtener(pregunta_texto, generacion)
+            if respuesta_cache:
+                logger.info(f"Respuesta obtenida del caché (generación {generacion})")
+                return respuesta_cache
+            try:
+                respuesta_cache = self.semantic_cache.buscar(pregunta_texto, generacion, embedding=embedding())
+            except Exception as e:
+                logger.warning(f"Error consultando el caché semántico: {e}")
+            if respuesta_cache:
+                logger.info(f"Respuesta obtenida del caché semántico (generación {generacion})")
+                return respuesta_cache
+
+        # --- PASO 6: Búsqueda Semántica (RAG) para preguntas generales o de normativa ---
+        self._verificar_cancelacion(cancelacion)
+        if categoria in ["document_qa", "general_info"] and self.indexer and self.scheduler.tiene_modelo("qa") and self.indexer.esta_indexacion_completa():
             logger.debug("Intentando RAG mejorado (Búsqueda Semántica + QA Pipeline)...")
             
             # Buscar en todos los documentos indexados
-            fragmentos_semanticos = self.indexer.buscar_pregunta_semantica(
+            # Con una clasificación confiable solo se consultan las particiones de esa categoría
+            fragmentos = self.indexer.buscar_fragmentos(
                 pregunta_texto,
-                top_k=5
+                top_k=5,
+                embedding_consulta=embedding(),
+                categoria=categoria if confianza >= 0.8 else None
             )
             
-            if isinstance(fragmentos_semanticos, str) and "No se encontraron fragmentos relevantes" not in fragmentos_semanticos:
+            if fragmentos:
+                # Los fragmentos ya vienen tokenizados desde la indexación; si no, se envía el texto
+                entradas_qa = []
+                for fragmento in fragmentos:
+                    tokens = self.indexer.tokens_fragmento(fragmento["id"], fragmento["texto"])
+                    entradas_qa.append((pregunta_texto, tokens if tokens is not None else fragmento["texto"]))
+
+                self._verificar_cancelacion(cancelacion)
+                # Todos los fragmentos se envían juntos para que compartan lote en el modelo QA
                 fragmentos_procesados = []
-                for fragmento in fragmentos_semanticos.split("\n\n"):
-                    if not fragmento.strip():
+                resultados_qa = self.scheduler.ejecutar_varios("qa", entradas_qa)
+                for resultado_qa in resultados_qa:
+                    if isinstance(resultado_qa, Exception):
+                        logger.error(f"Error en QA pipeline para fragmento: {resultado_qa}")
                         continue
-                        
-                    texto_fragmento = fragmento
-                    if "📝 Fragmento:" in fragmento:
-                        texto_fragmento = fragmento.split("📝 Fragmento:", 1)[1].split("\n")[0].strip()
-                    
-                    try:
-                        resultado_qa = self.qa_pipeline(
-                            question=pregunta_texto,
-                            context=texto_fragmento,
-                            max_answer_len=150,
-                            handle_impossible_answer=True
-                        )
-                        
-                        if resultado_qa and resultado_qa.get('answer') and resultado_qa['answer'].strip():
-                            score = resultado_qa.get('score', 0)
-                            if score > 0.4:  # Umbral para capturar respuestas relevantes
-                                fragmentos_procesados.append((score, resultado_qa['answer']))
-                    except Exception as e:
-                        logger.error(f"Error en QA pipeline para fragmento: {e}")
+                    if resultado_qa and resultado_qa.get('answer') and resultado_qa['answer'].strip():
+                        score = resultado_qa.get('score', 0)
+                        if score > 0.4:  # Umbral para capturar respuestas relevantes
+                            fragmentos_procesados.append((score, resultado_qa['answer']))
 
                 if fragmentos_procesados:
                     fragmentos_procesados.sort(reverse=True)
                     mejor_respuesta = fragmentos_procesados[0][1]
                     logger.info(f"Mejor respuesta RAG: {mejor_respuesta}")
+                    if cacheable:
+                        self._guardar_en_caches(pregunta_texto, generacion, mejor_respuesta, embedding)
                     return mejor_respuesta
         
-        # --- PASO 6: Generación directa con T5 ---
+        # --- PASO 7: Generación directa con T5 ---
+        self._verificar_cancelacion(cancelacion)
         try:
             # Mejorar el prompt para preguntas sobre procedimientos y reglamento
             prompt = f"""Pregunta: {pregunta_texto}
@@ -515,6 +705,8 @@ Respuesta:"""
             
             if respuesta_t5 and len(respuesta_t5) > 10:
                 logger.info(f"Respuesta generada por T5: {respuesta_t5}")
+                if cacheable and not respuesta_t5.startswith(PREFIJOS_RESPUESTA_FALLIDA):
+                    self._guardar_en_caches(pregunta_texto, generacion, respuesta_t5, embedding)
                 return respuesta_t5
                 
         except Exception as e:
@@ -523,6 +715,70 @@ Respuesta:"""
         logger.warning(f"No se encontró respuesta adecuada para: \"{pregunta_texto}\"")
         return respuesta_final
 
+    async def responder_pregunta_async(self, pregunta_texto: str, sesion_id: str) -> Optional[str]:
+        """
+        Ejecuta `_responder_pregunta` en el executor de inferencia sin bloquear el event
+        loop. Retorna None si la consulta fue cancelada.
+        """
+        cancelacion = threading.Event()
+        self._consultas_activas[sesion_id] = cancelacion
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, self._responder_pregunta, pregunta_texto, cancelacion)
+        except ConsultaCancelada:
+            logger.info(f"Consulta cancelada por la sesión {sesion_id}: \"{pregunta_texto}\"")
+            return None
+        except asyncio.CancelledError:
+            # La tarea se canceló (p. ej. desconexión): detener el pipeline en la siguiente etapa
+            cancelacion.set()
+            raise
+        finally:
+            if self._consultas_activas.get(sesion_id) is cancelacion:
+                del self._consultas_activas[sesion_id]
+            logger.debug(f"Retraso del event loop: {self.monitor_loop.estadisticas()}")
+
+    def cancelar_consulta(self, sesion_id: str) -> bool:
+        """Solicita la cancelación de la consulta en curso de una sesión."""
+        cancelacion = self._consultas_activas.get(sesion_id)
+        if cancelacion is None:
+            return False
+        cancelacion.set()
+        return True
+
+    async def sincronizar_normativa(self):
+        """Indexa los archivos nuevos o modificados del espejo local de normativa."""
+        if self.normativa_local is None:
+            return
+        try:
+            await self.normativa_local.sincronizar()
+        except Exception as e:
+            logger.error(f"Error sincronizando la normativa local: {e}")
+
+    def detener(self):
+        """Libera el executor de inferencia, las réplicas y los indexadores al cerrar la aplicación."""
+        self.executor.shutdown(wait=False)
+        if self.replica_pool:
+            self.replica_pool.detener()
+        # Un reentrenamiento en curso termina de guardar la cabeza antes de salir
+        self.clasificador_rapido.esperar_reentrenamiento(timeout=10)
+        self.indexer.cerrar()
+        if self.normativa_local:
+            self.normativa_local.indexer.cerrar()
+
+    def _guardar_en_caches(
+        self,
+        pregunta: str,
+        generacion: str,
+        respuesta: str,
+        embedding: Optional[EmbeddingConsulta] = None
+    ):
+        """Guarda una respuesta general en el caché exacto y en el semántico."""
+        self.response_cache.guardar(pregunta, generacion, respuesta)
+        try:
+            self.semantic_cache.guardar(pregunta, respuesta, generacion, embedding=embedding() if embedding else None)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la respuesta en el caché semántico: {e}")
+
     async def cargar_documentos(self, container: ui.element = None):
         if self.documentos_cargados:
             logger.info("Los documentos ya están cargados. No se realizará una nueva carga.")
@@ -711,11 +967,14 @@ Respuesta:"""
                     if progress_label:
                         progress_label.set_text('Indexando documentos...')
                     
-                    # Usar el indexador para procesar los documentos
+                    # Reconstruir el índice en una versión nueva; las consultas usan la
+                    # anterior hasta que la nueva queda completa
                     logger.info("Iniciando indexación de documentos...")
-                    await self.indexer.indexar_documentos(self.word_docs)
+                    await self.indexer.reconstruir_indice(self.word_docs)
                     self.documentos_cargados = True
                     logger.info("Documentos indexados correctamente")
+                    # Las respuestas cacheadas de versiones anteriores de los documentos ya no aplican
+                    self.response_cache.invalidar(self.indexer.generacion_indice)
                     
                     if progress_label:
                         progress_label.set_text('Indexación completada')
@@ -803,14 +1062,21 @@ Respuesta:"""
                         logger.info(f"- TXT Cache keys: {list(self.txt_cache.keys()) if self.txt_cache else 'Vacío'}")
                         logger.info(f"- Word Cache keys: {list(self.word_docs.keys()) if self.word_docs else 'Vacío'}")
                         
-                        respuesta_bot_texto = self._responder_pregunta(pregunta_actual)
+                        respuesta_bot_texto = await self.responder_pregunta_async(pregunta_actual, user_id)
+                        if respuesta_bot_texto is None:
+                            respuesta_bot_texto = "Consulta cancelada."
                 
                 self.messages.append(("system", avatar_system, respuesta_bot_texto, datetime.now().strftime('%H:%M')))
                 self.chat_messages_area.refresh()
 
             asyncio.create_task(get_and_display_bot_response())
 
+        def cancelar_consulta_actual():
+            if self.cancelar_consulta(user_id):
+                ui.notify("Cancelando consulta...", type='info')
+
         user_id = str(uuid4())
+        ui.context.client.on_disconnect(lambda: self.cancelar_consulta(user_id))
         avatar_user = f'https://robohash.org/{user_id}?bgset=bg2'
         avatar_system = f'https://images.emojiterra.com/microsoft/fluent-emoji/15.1/128px/1f916_color.png'
 
@@ -838,12 +1104,16 @@ Respuesta:"""
                     .props('rounded outlined input-class=mx-3') \
                     .classes('flex-grow')
                 ui.button(icon='send', on_click=send_message_and_process).props('round dense')
+                ui.button(icon='stop', on_click=cancelar_consulta_actual).props('round dense flat').tooltip('Cancelar consulta')
         
         ui.run_javascript('window.scrollTo(0, document.body.scrollHeight)')
 
     def manejar_feedback(self, pregunta: str, respuesta: str, es_util: bool):
         """Maneja el feedback del usuario sobre las respuestas."""
         if not es_util:
+            # Si la respuesta vino del caché semántico, se registra como falso acierto
+            self.semantic_cache.registrar_falso_acierto(pregunta)
+            logger.info(f"Métricas caché semántico: {self.semantic_cache.estadisticas()}")
             with ui.dialog() as dialog, ui.card():
                 ui.label("Por favor, ingresa más detalles sobre la respuesta")
                 detalles = ui.textarea()
@@ -908,6 +1178,10 @@ if __name__ in {'__main__', '__mp_main__'}:
     
     app_instance = ChatNominaApp()
     ui.page('/')(app_instance.main_page)
+    app.on_startup(app_instance.monitor_loop.iniciar)
+    app.on_startup(app_instance.sincronizar_normativa)
+    app.on_shutdown(app_instance.monitor_loop.detener)
+    app.on_shutdown(app_instance.detener)
     ui.run(
         title='ChatNomina',
         native=True,
@@ -0,0 +1,129 @@
+"""
+Calibración del umbral de similitud de `SemanticCache`.
+
+Un acierto del caché semántico sirve la respuesta de otra pregunta, así que el
+umbral debe separar dos tipos de pares:
+
+- paráfrasis: la misma pregunta reformulada (prefijo de cortesía, minúsculas, sin
+  signos, artículo cambiado), que debe acertar;
+- otra entidad: la misma plantilla con otro cargo, otra dependencia u otro tema,
+  cuya respuesta es distinta y que nunca debe acertar.
+
+Los pares salen de las plantillas de `bench_recuperacion.py`. Para el modelo
+indicado se reportan los percentiles de similitud de cada grupo, el menor umbral
+sin falsos aciertos sobre los pares de otra entidad (con un margen) y qué
+fracción de las paráfrasis acierta con él y con el umbral configurado, y los
+aciertos del propio `SemanticCache` (umbral más control de términos). El valor
+por defecto de `SemanticCacheConfig.similarity_threshold` debe salir de esta
+corrida sobre el modelo en producción.
+
+Uso:
+    python benchmarks/bench_cache_semantico.py --modelo hiiamsid/sentence_similarity_spanish_es
+    python benchmarks/bench_cache_semantico.py --hash   # modelo determinista, sin descargas
+"""
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_recuperacion import CARGOS, DEPENDENCIAS, PREFIJOS_CONSULTA, TEMAS, TEMAS_DATASET, EmbedderHash  # noqa: E402
+from utils.semantic_cache import SemanticCache, SemanticCacheConfig  # noqa: E402
+
+PLANTILLAS = [pregunta for _, _, pregunta, _ in TEMAS] + [pregunta for pregunta, _ in TEMAS_DATASET]
+
+
+def _parafrasis(pregunta: str, rng: random.Random) -> str:
+    reformulada = pregunta.strip("¿?").lower()
+    if rng.random() < 0.5:
+        reformulada = reformulada.replace(" un ", " el ", 1)
+    return f"{rng.choice(PREFIJOS_CONSULTA)} {reformulada}" if rng.random() < 0.5 else reformulada
+
+
+def construir_pares(cantidad: int, semilla: int = 0):
+    """Pares (pregunta guardada, pregunta nueva) de paráfrasis y de otra entidad."""
+    rng = random.Random(semilla)
+    parafrasis, otra_entidad = [], []
+    for _ in range(cantidad):
+        plantilla = rng.choice(PLANTILLAS)
+        campos = {"cargo": rng.choice(CARGOS), "dependencia": rng.choice(DEPENDENCIAS), "n": rng.randint(1, 40)}
+        pregunta = plantilla.format(**campos)
+        parafrasis.append((pregunta, _parafrasis(pregunta, rng)))
+
+        cambio = rng.choice(["cargo", "dependencia", "tema"])
+        otros = dict(campos)
+        if cambio == "tema":
+            otra = rng.choice([p for p in PLANTILLAS if p != plantilla]).format(**otros)
+        else:
+            otros[cambio] = rng.choice([v for v in (CARGOS if cambio == "cargo" else DEPENDENCIAS) if v != campos[cambio]])
+            otra = plantilla.format(**otros)
+        otra_entidad.append((pregunta, otra))
+    return parafrasis, otra_entidad
+
+
+def embeddings(modelo, pares):
+    guardadas = np.asarray(modelo.encode([a for a, _ in pares]), dtype=np.float32)
+    nuevas = np.asarray(modelo.encode([b for _, b in pares]), dtype=np.float32)
+    guardadas /= np.linalg.norm(guardadas, axis=1, keepdims=True)
+    nuevas /= np.linalg.norm(nuevas, axis=1, keepdims=True)
+    return guardadas, nuevas
+
+
+def aciertos_cache(pares, guardadas, nuevas) -> float:
+    """Fracción de pares en que `SemanticCache` (configuración por defecto) sirve la respuesta guardada."""
+    aciertos = 0
+    for (guardada, nueva), e_guardada, e_nueva in zip(pares, guardadas, nuevas):
+        cache = SemanticCache(lambda pregunta: None, SemanticCacheConfig(max_entries=1))
+        cache.guardar(guardada, "respuesta", "bench", embedding=e_guardada)
+        aciertos += cache.buscar(nueva, "bench", embedding=e_nueva) is not None
+    return aciertos / len(pares)
+
+
+def _percentiles(valores: np.ndarray) -> dict:
+    return {f"p{p}": round(float(np.percentile(valores, p)), 4) for p in (1, 5, 50, 95, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modelo", default="hiiamsid/sentence_similarity_spanish_es")
+    parser.add_argument("--hash", action="store_true", help="Usar el modelo determinista por hashing")
+    parser.add_argument("--pares", type=int, default=500)
+    parser.add_argument("--margen", type=float, default=0.01, help="Margen sobre la mayor similitud de otra entidad")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.hash:
+        modelo = EmbedderHash()
+    else:
+        from sentence_transformers import SentenceTransformer
+        modelo = SentenceTransformer(args.modelo, device="cpu")
+
+    parafrasis, otra_entidad = construir_pares(args.pares, args.semilla)
+    e_parafrasis = embeddings(modelo, parafrasis)
+    e_otra = embeddings(modelo, otra_entidad)
+    s_parafrasis = np.sum(e_parafrasis[0] * e_parafrasis[1], axis=1)
+    s_otra = np.sum(e_otra[0] * e_otra[1], axis=1)
+    umbral = float(np.ceil((s_otra.max() + args.margen) * 100) / 100)
+    configurado = SemanticCacheConfig.similarity_threshold
+
+    print(json.dumps({
+        "modelo": "hash" if args.hash else args.modelo,
+        "pares": args.pares,
+        "similitud_parafrasis": _percentiles(s_parafrasis),
+        "similitud_otra_entidad": _percentiles(s_otra),
+        "umbral_sin_falsos_aciertos": umbral,
+        "aciertos_parafrasis_con_ese_umbral": round(float(np.mean(s_parafrasis >= umbral)), 4),
+        "umbral_configurado": configurado,
+        "aciertos_parafrasis_configurado": round(float(np.mean(s_parafrasis >= configurado)), 4),
+        "falsos_aciertos_configurado": round(float(np.mean(s_otra >= configurado)), 4),
+        "cache_aciertos_parafrasis": round(aciertos_cache(parafrasis, *e_parafrasis), 4),
+        "cache_falsos_aciertos": round(aciertos_cache(otra_entidad, *e_otra), 4),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Informe de compresión de embeddings: memoria ahorrada frente a recall@k perdido.
+
+Para cada combinación de dimensión PCA y cuantización (float32, float16, int8)
+construye un `FaissVectorStore` flat con los vectores proyectados y mide:
+
+- bytes por vector del índice y de la matriz en disco,
+- recall@k frente a la búsqueda exacta con los embeddings originales en float32.
+
+Además (salvo con --escala-indexador 0) mide el efecto de extremo a extremo: indexa
+el corpus etiquetado de `bench_recuperacion.py` con `DocumentIndexer` para cada
+combinación y reporta el recall@k de `buscar_fragmentos` (que aplica los umbrales
+de similitud de `IndexConfig`) frente al índice sin comprimir. Así se ve la
+pérdida que los umbrales absolutos pueden causar y que la búsqueda exacta en el
+espacio comprimido no muestra.
+
+Por defecto usa vectores sintéticos con estructura de bajo rango (parecidos a los
+embeddings de oraciones reales); con --modelo y --corpus se codifican los textos
+de un archivo, una línea por fragmento.
+
+Uso:
+    python benchmarks/bench_compresion_embeddings.py --vectores 20000 --dimensiones 384,256,128,64
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.pca_projection import ProyeccionPCA  # noqa: E402
+from utils.vector_store import CUANTIZACIONES, FaissVectorStore  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_recuperacion import EmbedderHash, medir_escala  # noqa: E402
+
+
+def normalizar(vectores: np.ndarray) -> np.ndarray:
+    return (vectores / np.maximum(np.linalg.norm(vectores, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+
+def datos_sinteticos(cantidad: int, consultas: int, dimension: int, rango: int = 48, semilla: int = 0):
+    rng = np.random.default_rng(semilla)
+    mezcla = rng.standard_normal((rango, dimension)) * np.linspace(1.0, 0.1, rango)[:, None]
+    base = normalizar(rng.standard_normal((cantidad, rango)) @ mezcla + 0.05 * rng.standard_normal((cantidad, dimension)))
+    elegidos = rng.integers(0, cantidad, consultas)
+    q = normalizar(base[elegidos] + 0.05 * rng.standard_normal((consultas, dimension)))
+    return base, q
+
+
+def datos_corpus(ruta: str, modelo_nombre: str, consultas: int, semilla: int = 0):
+    from sentence_transformers import SentenceTransformer
+
+    textos = [linea.strip() for linea in open(ruta, encoding="utf-8") if linea.strip()]
+    modelo = SentenceTransformer(modelo_nombre, device="cpu")
+    base = normalizar(modelo.encode(textos, batch_size=64, convert_to_numpy=True))
+    rng = np.random.default_rng(semilla)
+    elegidos = rng.integers(0, len(textos), consultas)
+    q = normalizar(base[elegidos] + 0.05 * rng.standard_normal((consultas, base.shape[1])))
+    return base, q
+
+
+def vecinos_exactos(base: np.ndarray, consultas: np.ndarray, k: int) -> np.ndarray:
+    return np.argpartition(-(consultas @ base.T), k - 1, axis=1)[:, :k]
+
+
+def evaluar(base, consultas, exactos, k, dimension, cuantizacion, directorio) -> dict:
+    proyeccion = None
+    if dimension < base.shape[1]:
+        proyeccion = ProyeccionPCA.ajustar(base, dimension)
+        base, consultas = proyeccion.proyectar(base), proyeccion.proyectar(consultas)
+
+    ruta = Path(directorio) / f"pca{dimension}_{cuantizacion}"
+    almacen = FaissVectorStore(str(ruta), tipo="flat", cuantizacion=cuantizacion)
+    almacen.add(
+        documents=[""] * len(base),
+        embeddings=base,
+        metadatas=[{"origen": "bench"}] * len(base),
+        ids=[str(i) for i in range(len(base))],
+    )
+    almacen.guardar()
+
+    aciertos = 0
+    resultado = almacen.query(query_embeddings=consultas, n_results=k)
+    for obtenidos, esperados in zip(resultado["ids"], exactos):
+        aciertos += len({int(i) for i in obtenidos} & set(esperados.tolist()))
+    indice = almacen._indice
+    bytes_indice = indice.ntotal * (indice.code_size if hasattr(indice, "code_size") else 4 * indice.d)
+    return {
+        "dimension": dimension,
+        "cuantizacion": cuantizacion,
+        "varianza_explicada": round(proyeccion.varianza_explicada, 4) if proyeccion else 1.0,
+        "bytes_por_vector_indice": round(bytes_indice / len(base), 1),
+        "bytes_en_disco": almacen.bytes_en_disco(),
+        f"recall@{k}": round(aciertos / (len(consultas) * k), 4),
+    }
+
+
+def evaluar_indexador(args, dimensiones) -> list:
+    """Recall@k de `DocumentIndexer.buscar_fragmentos` por combinación, frente al índice sin comprimir."""
+    if args.modelo:
+        from sentence_transformers import SentenceTransformer
+        modelo = SentenceTransformer(args.modelo, device="cpu")
+    else:
+        modelo = EmbedderHash(dimension=args.dimension)
+    original = modelo.get_sentence_embedding_dimension()
+    opciones_corpus = argparse.Namespace(
+        articulos=args.articulos, pares=args.pares, dataset=None, ks=str(args.k),
+        backend="faiss", faiss_index_type="flat", semilla=0
+    )
+
+    # FaissVectorStore persiste bajo el directorio de trabajo: se usa uno temporal
+    directorio = Path(tempfile.mkdtemp(prefix="bench_compresion_indexador_"))
+    anterior_cwd = os.getcwd()
+    filas = []
+    try:
+        os.chdir(directorio)
+        for dimension in dimensiones:
+            for cuantizacion in CUANTIZACIONES:
+                resultado = asyncio.run(medir_escala(
+                    args.escala_indexador, opciones_corpus, modelo, directorio,
+                    pca_dimension=dimension if dimension < original else None,
+                    embedding_quantization=cuantizacion,
+                ))
+                filas.append({
+                    "dimension": min(dimension, original),
+                    "cuantizacion": cuantizacion,
+                    f"recall@{args.k}": resultado[f"recall@{args.k}"],
+                    "por_fuente": resultado["por_fuente"],
+                    "p50_ms": resultado["p50_ms"],
+                })
+    finally:
+        os.chdir(anterior_cwd)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    referencia = next((f for f in filas if f["dimension"] == original and f["cuantizacion"] == "float32"), None)
+    if referencia:
+        clave = f"recall@{args.k}"
+        for fila in filas:
+            fila["recall_perdido"] = round(referencia[clave] - fila[clave], 4)
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectores", type=int, default=20000)
+    parser.add_argument("--consultas", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384, help="Dimensión de los vectores sintéticos")
+    parser.add_argument("--dimensiones", default="384,256,128,64", help="Dimensiones PCA a evaluar")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modelo", default=None)
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--escala-indexador", type=int, default=10,
+                        help="Escala del corpus de bench_recuperacion indexado con DocumentIndexer (0 lo omite)")
+    parser.add_argument("--articulos", type=int, default=60, help="Artículos etiquetados del corpus del indexador")
+    parser.add_argument("--pares", type=int, default=40, help="Pares del dataset sintético del indexador")
+    args = parser.parse_args()
+
+    if args.corpus:
+        base, consultas = datos_corpus(args.corpus, args.modelo or "hiiamsid/sentence_similarity_spanish_es", args.consultas)
+    else:
+        base, consultas = datos_sinteticos(args.vectores, args.consultas, args.dimension)
+    exactos = vecinos_exactos(base, consultas, args.k)
+
+    directorio = tempfile.mkdtemp(prefix="bench_compresion_")
+    filas = []
+    try:
+        for dimension in (int(d) for d in args.dimensiones.split(",")):
+            for cuantizacion in CUANTIZACIONES:
+                filas.append(evaluar(base, consultas, exactos, args.k, min(dimension, base.shape[1]), cuantizacion, directorio))
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    referencia = next(
+        (f for f in filas if f["dimension"] == base.shape[1] and f["cuantizacion"] == "float32"), None
+    )
+    clave = f"recall@{args.k}"
+    for fila in filas:
+        memoria_base = 4 * base.shape[1]
+        fila["memoria_ahorrada"] = round(1 - fila["bytes_por_vector_indice"] / memoria_base, 4)
+        if referencia:
+            fila["recall_perdido"] = round(referencia[clave] - fila[clave], 4)
+
+    salida = {
+        "vectores": len(base),
+        "dimension_original": base.shape[1],
+        "consultas": len(consultas),
+        "k": args.k,
+        "resultados": filas,
+    }
+    if args.escala_indexador > 0:
+        salida["indexador"] = {
+            "escala": args.escala_indexador,
+            "resultados": evaluar_indexador(args, [int(d) for d in args.dimensiones.split(",")]),
+        }
+    print(json.dumps(salida, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark de los backends del modelo de embeddings: torch (SentenceTransformer),
+ONNX y ONNX cuantizado a int8.
+
+Para cada backend mide embeddings por segundo al codificar lotes de fragmentos
+(como en la indexación) y la latencia de consultas individuales (como cada
+pregunta del chat). Los backends ONNX se comparan con torch: coseno entre los
+embeddings de cada texto y diferencia máxima entre las matrices de similitud.
+
+El modelo se exporta a ONNX la primera vez en --directorio (o en uno temporal).
+
+Uso:
+    python benchmarks/bench_embedder_onnx.py --fragmentos 512 --consultas 200
+"""
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.onnx_embedder import BACKENDS_EMBEDDINGS, ORACIONES_VERIFICACION, EmbedderONNX, verificar_equivalencia  # noqa: E402
+
+PALABRAS = (
+    "el trabajador tendrá derecho a quince días hábiles de vacaciones remuneradas por cada año "
+    "de servicio la empresa liquidará la prima de servicios en junio y diciembre conforme al "
+    "artículo del reglamento interno de trabajo y al procedimiento de liquidación de nómina"
+).split()
+
+
+def textos_sinteticos(cantidad: int, minimo: int, maximo: int, semilla: int = 0):
+    rng = random.Random(semilla)
+    return [
+        " ".join(rng.choice(PALABRAS) for _ in range(rng.randint(minimo, maximo)))
+        for _ in range(cantidad)
+    ]
+
+
+def cargar_modelo(backend: str, modelo: str, directorio: str):
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(modelo, device="cpu")
+    # Se mide aunque no alcance el coseno mínimo del indexador: la equivalencia se reporta aparte
+    return EmbedderONNX.cargar_o_exportar(modelo, directorio, cuantizado=backend == "onnx_int8", coseno_minimo=-1.0)
+
+
+def medir_lotes(modelo, fragmentos, lote: int) -> dict:
+    modelo.encode(fragmentos[:lote], batch_size=lote, convert_to_numpy=True)  # calentamiento
+    inicio = time.perf_counter()
+    modelo.encode(fragmentos, batch_size=lote, convert_to_numpy=True, show_progress_bar=False)
+    duracion = time.perf_counter() - inicio
+    return {"embeddings_por_s": round(len(fragmentos) / duracion, 1)}
+
+
+def medir_consultas(modelo, consultas) -> dict:
+    modelo.encode(consultas[0], convert_to_numpy=True)  # calentamiento
+    latencias = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        modelo.encode(consulta, convert_to_numpy=True)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    latencias = np.array(latencias)
+    return {
+        "consultas_por_s": round(1000 / float(latencias.mean()), 1),
+        "p50_ms": round(float(np.percentile(latencias, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencias, 95)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modelo", default="hiiamsid/sentence_similarity_spanish_es")
+    parser.add_argument("--fragmentos", type=int, default=512)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--lote", type=int, default=32)
+    parser.add_argument("--backends", default=",".join(BACKENDS_EMBEDDINGS))
+    parser.add_argument("--directorio", default=None, help="Directorio del modelo exportado a ONNX")
+    args = parser.parse_args()
+
+    fragmentos = textos_sinteticos(args.fragmentos, 20, 300)
+    consultas = textos_sinteticos(args.consultas, 4, 15, semilla=1)
+    verificacion = ORACIONES_VERIFICACION + fragmentos[:32] + consultas[:32]
+
+    directorio = args.directorio or tempfile.mkdtemp(prefix="bench_onnx_")
+    resultados, modelos = {}, {}
+    try:
+        for backend in args.backends.split(","):
+            try:
+                modelos[backend] = cargar_modelo(backend, args.modelo, directorio)
+            except ImportError as e:
+                resultados[backend] = f"no disponible: {e}"
+                continue
+            resultados[backend] = {
+                "lotes": medir_lotes(modelos[backend], fragmentos, args.lote),
+                "consultas": medir_consultas(modelos[backend], consultas),
+            }
+            if backend != "torch" and "torch" in modelos:
+                resultados[backend]["equivalencia"] = verificar_equivalencia(
+                    modelos["torch"], modelos[backend], verificacion
+                )
+    finally:
+        if args.directorio is None:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    print(json.dumps({
+        "modelo": args.modelo,
+        "fragmentos": len(fragmentos),
+        "consultas": len(consultas),
+        "lote": args.lote,
+        "resultados": resultados,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark de fragmentos por segundo al calcular embeddings durante la indexación.
+
+Compara la estrategia anterior (un `encode` por texto repartido en un
+ThreadPoolExecutor creado por lote) con `DocumentIndexer._calcular_embeddings`
+(un `encode` por lote, ordenado por longitud, solo para los textos sin cache).
+
+Uso:
+    python benchmarks/bench_embeddings_indexacion.py --fragmentos 512
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentence_transformers import SentenceTransformer  # noqa: E402
+
+from utils.embedding_index import DocumentIndexer, IndexConfig  # noqa: E402
+
+PALABRAS = (
+    "el trabajador tendrá derecho a quince días hábiles de vacaciones remuneradas por cada año "
+    "de servicio la empresa liquidará la prima de servicios en junio y diciembre conforme al "
+    "artículo del reglamento interno de trabajo y al procedimiento de liquidación de nómina"
+).split()
+
+
+def fragmentos_sinteticos(cantidad: int, semilla: int = 0):
+    rng = random.Random(semilla)
+    return [
+        " ".join(rng.choice(PALABRAS) for _ in range(rng.randint(20, 300)))
+        for _ in range(cantidad)
+    ]
+
+
+def indexador_sin_coleccion(config: IndexConfig, modelo) -> DocumentIndexer:
+    """Indexador con solo el modelo y un cache vacío en un directorio temporal; no necesita ChromaDB."""
+    indexer = DocumentIndexer.__new__(DocumentIndexer)
+    indexer.config = config
+    indexer.modelo_embeddings = modelo
+    indexer.config.cache_dir = tempfile.mkdtemp(prefix="bench_embeddings_")
+    indexer._load_embedding_cache()
+    return indexer
+
+
+def por_texto(modelo, textos, lote, hilos):
+    """Estrategia anterior: un encode por texto, un executor nuevo por lote."""
+    for i in range(0, len(textos), lote):
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            list(executor.map(lambda t: modelo.encode(t, convert_to_numpy=True), textos[i:i + lote]))
+
+
+def por_lote(indexer, textos, lote):
+    for i in range(0, len(textos), lote):
+        indexer._calcular_embeddings(textos[i:i + lote])
+
+
+def medir(funcion, cantidad, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    mejor = min(tiempos)
+    return {"segundos": round(mejor, 4), "fragmentos_por_segundo": round(cantidad / mejor, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modelo", default=IndexConfig.model_name)
+    parser.add_argument("--fragmentos", type=int, default=512)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    config = IndexConfig(model_name=args.modelo)
+    modelo = SentenceTransformer(args.modelo, device="cpu")
+    textos = fragmentos_sinteticos(args.fragmentos)
+    modelo.encode(textos[:8])  # calentamiento
+
+    antes = medir(lambda: por_texto(modelo, textos, config.batch_size, config.max_workers), len(textos), args.repeticiones)
+
+    def lote_sin_cache():
+        indexer = indexador_sin_coleccion(config, modelo)
+        por_lote(indexer, textos, config.batch_size)
+
+    despues = medir(lote_sin_cache, len(textos), args.repeticiones)
+    resultado = {
+        "modelo": args.modelo,
+        "fragmentos": len(textos),
+        "batch_size": config.batch_size,
+        "antes_por_texto": antes,
+        "despues_por_lote": despues,
+        "aceleracion": round(antes["segundos"] / despues["segundos"], 2),
+    }
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Suite de calidad y latencia de la recuperación de `DocumentIndexer`.
+
+Construye un conjunto etiquetado de preguntas con su fragmento relevante:
+
+- un reglamento y un procedimiento sintéticos, con artículos que contienen un
+  hecho único (la oración que debe recuperarse) y preguntas parafraseadas sobre él;
+- pares del dataset de entrenamiento (--dataset, JSONL) o, sin él, pares
+  sintéticos, consultados con la pregunta reformulada para que no coincida
+  exactamente con la original.
+
+Un resultado es relevante si su texto contiene la oración del hecho (o la
+pregunta del par), así que la evaluación no depende de cómo se fragmenta el texto
+y sirve para comparar cambios en la fragmentación, los umbrales de
+`IndexConfig` o la fusión de puntajes.
+
+Para cada escala del corpus (1x, 10x, 100x: los documentos crecen con artículos
+distractores del mismo vocabulario) indexa con `reconstruir_indice` y reporta
+recall@k, MRR y latencias p50/p95/p99 de `buscar_fragmentos`. Por defecto usa
+un modelo de embeddings determinista por hashing de palabras y trigramas, sin
+red ni descargas; con --modelo se usa un SentenceTransformer.
+
+El resultado es JSON (con el commit actual); --comparar agrega la diferencia con
+un resultado anterior para detectar regresiones entre commits.
+
+Uso:
+    python benchmarks/bench_recuperacion.py --escalas 1,10,100 --salida resultados.json
+    python benchmarks/bench_recuperacion.py --comparar resultados.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.embedding_index import ORIGENES_INSTITUCIONALES, DocumentIndexer, IndexConfig  # noqa: E402
+from utils.helpers import plegar_acentos  # noqa: E402
+
+REGLAMENTO, PROCEDIMIENTO = ORIGENES_INSTITUCIONALES
+
+CARGOS = [
+    "auxiliar administrativo", "docente de planta", "docente de cátedra", "analista de nómina",
+    "coordinador académico", "técnico de laboratorio", "profesional de bienestar", "asistente contable",
+    "jefe de departamento", "secretaria de facultad", "monitor académico", "investigador asociado",
+    "director de programa", "auxiliar de biblioteca", "profesional de compras", "operario de mantenimiento",
+]
+DEPENDENCIAS = [
+    "la Facultad de Ingeniería", "la Facultad de Derecho", "la Escuela de Ciencias de la Salud",
+    "la Dirección Financiera", "la Oficina de Gestión Humana", "el Centro de Idiomas",
+    "la Biblioteca", "la Dirección de Investigaciones", "la Rectoría", "el Departamento de Deportes",
+]
+# (título, hecho, pregunta, documento); los campos se completan con cargo, dependencia y números
+TEMAS = [
+    ("VACACIONES", "El {cargo} de {dependencia} con {n} años de servicio disfruta de {m} días hábiles de vacaciones.",
+     "¿Cuántos días de vacaciones tiene un {cargo} de {dependencia} con {n} años de servicio?", REGLAMENTO),
+    ("JORNADA LABORAL", "La jornada del {cargo} de {dependencia} es de {m} horas semanales desde el año {n}.",
+     "¿Cuántas horas a la semana trabaja el {cargo} en {dependencia}?", REGLAMENTO),
+    ("PERMISOS", "El {cargo} de {dependencia} puede solicitar hasta {m} permisos remunerados cada {n} meses.",
+     "¿Cuántos permisos remunerados puede pedir un {cargo} de {dependencia}?", REGLAMENTO),
+    ("HORAS EXTRA", "Las horas extra del {cargo} de {dependencia} se liquidan con un recargo del {m} por ciento tras {n} horas.",
+     "¿Qué recargo tienen las horas extra de un {cargo} en {dependencia}?", PROCEDIMIENTO),
+    ("NOVEDADES DE NÓMINA", "Las novedades del {cargo} de {dependencia} se reportan a nómina antes del día {m} con {n} días de anticipación.",
+     "¿Hasta qué día se reportan las novedades de nómina de un {cargo} de {dependencia}?", PROCEDIMIENTO),
+    ("AUXILIOS", "El auxilio de alimentación del {cargo} de {dependencia} equivale a {m} mil pesos por {n} días laborados.",
+     "¿De cuánto es el auxilio de alimentación de un {cargo} de {dependencia}?", PROCEDIMIENTO),
+]
+RELLENO = [
+    "Esta disposición se aplica conforme a lo establecido en el Código Sustantivo del Trabajo.",
+    "La Oficina de Gestión Humana verificará el cumplimiento de este artículo.",
+    "Cualquier excepción deberá ser aprobada por escrito por el jefe inmediato.",
+    "Los casos no previstos serán resueltos por el comité de personal de la universidad.",
+    "El incumplimiento de esta norma podrá dar lugar a las sanciones previstas en el reglamento.",
+    "La liquidación correspondiente se incluirá en el periodo de nómina siguiente.",
+]
+# Pares (pregunta, respuesta) del dataset sintético, sobre trámites distintos de los artículos
+TEMAS_DATASET = [
+    ("¿Cómo solicita un {cargo} de {dependencia} el certificado laboral?",
+     "El {cargo} de {dependencia} descarga el certificado laboral del portal de empleados; tarda {m} días hábiles."),
+    ("¿Cuándo se consignan las cesantías de un {cargo} de {dependencia}?",
+     "Las cesantías del {cargo} de {dependencia} se consignan al fondo elegido antes del {m} de febrero."),
+    ("¿Quién paga la incapacidad de un {cargo} de {dependencia}?",
+     "Los primeros {m} días de incapacidad del {cargo} de {dependencia} los paga la universidad y luego la EPS."),
+    ("¿Cómo se liquida la prima de servicios de un {cargo} de {dependencia}?",
+     "La prima de servicios del {cargo} de {dependencia} equivale a {m} días de salario por semestre."),
+]
+PREFIJOS_CONSULTA = ["Quisiera saber", "Me puedes decir", "Necesito confirmar", "Una consulta"]
+
+
+class EmbedderHash:
+    """
+    Modelo de embeddings determinista para correr sin red: suma de vectores
+    aleatorios (por hash) de las palabras sin tildes y de sus trigramas de
+    caracteres. Textos que comparten vocabulario quedan cerca, como con un modelo real.
+
+    Los modelos de oraciones reales dan similitudes altas incluso entre textos no
+    relacionados del mismo dominio; `anisotropia` agrega esa componente común
+    (coseno = anisotropia + (1 - anisotropia) · coseno de los rasgos) para que los
+    umbrales absolutos de `IndexConfig` filtren en un rango parecido.
+    """
+
+    def __init__(self, dimension: int = 384, anisotropia: float = 0.5):
+        self.dimension = dimension
+        self.anisotropia = anisotropia
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _vector(self, texto: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for palabra in plegar_acentos(texto).split():
+            palabra = palabra.strip(".,;:¿?¡!()\"'")
+            if not palabra:
+                continue
+            rasgos = [palabra] + [palabra[i:i + 3] for i in range(max(1, len(palabra) - 2))]
+            for rasgo in rasgos:
+                h = zlib.crc32(rasgo.encode("utf-8"))
+                vector[1 + h % (self.dimension - 1)] += 1.0 if (h >> 16) & 1 else -1.0
+        vector *= np.sqrt(1 - self.anisotropia) / max(float(np.linalg.norm(vector)), 1e-12)
+        # La primera dimensión es la componente común a todos los textos
+        vector[0] = np.sqrt(self.anisotropia)
+        return vector
+
+    def encode(self, textos, batch_size=32, convert_to_numpy=True, show_progress_bar=False):
+        if isinstance(textos, str):
+            return self._vector(textos)
+        return np.stack([self._vector(t) for t in textos]) if textos else np.zeros((0, self.dimension), np.float32)
+
+
+def _articulos(cantidad: int, rng: random.Random, reservados: set, reservar: bool = True):
+    """
+    Artículos (documento, texto, hecho, pregunta). Con `reservar`, cada tema, cargo y
+    dependencia se usa una sola vez (la pregunta tiene una única respuesta); si
+    no, solo se evitan los reservados, para los distractores.
+    """
+    articulos = []
+    while len(articulos) < cantidad:
+        titulo, hecho, pregunta, documento = rng.choice(TEMAS)
+        campos = {
+            "cargo": rng.choice(CARGOS),
+            "dependencia": rng.choice(DEPENDENCIAS),
+            "n": rng.randint(1, 40),
+            "m": rng.randint(2, 60),
+        }
+        clave = (titulo, campos["cargo"], campos["dependencia"])
+        if clave in reservados:
+            continue
+        if reservar:
+            reservados.add(clave)
+        hecho = hecho.format(**campos)
+        relleno = " ".join(rng.sample(RELLENO, 3))
+        texto = f"{titulo}\n\n{hecho} {relleno}"
+        articulos.append((documento, texto, hecho, pregunta.format(**campos)))
+    return articulos
+
+
+def construir_corpus(articulos_base: int, escala: int, semilla: int = 0):
+    """
+    Documentos sintéticos y consultas etiquetadas. Las consultas son siempre las de
+    los `articulos_base` artículos etiquetados; la escala agrega distractores.
+    """
+    rng = random.Random(semilla)
+    reservados = set()
+    etiquetados = _articulos(articulos_base, rng, reservados)
+    distractores = _articulos(articulos_base * (escala - 1), random.Random(semilla + escala), reservados, reservar=False)
+    todos = etiquetados + distractores
+    random.Random(semilla).shuffle(todos)
+
+    textos = {REGLAMENTO: [], PROCEDIMIENTO: []}
+    for numero, (documento, texto, _, _) in enumerate(todos, start=1):
+        textos[documento].append(f"ARTÍCULO {numero}.\n\n{texto}")
+    documentos = {nombre: "\n\n".join(partes) for nombre, partes in textos.items()}
+    consultas = [
+        {"pregunta": pregunta, "relevante": hecho, "fuente": "documentos"}
+        for _, _, hecho, pregunta in etiquetados
+    ]
+    return documentos, consultas
+
+
+def pares_dataset(ruta, cantidad: int, semilla: int = 0):
+    if ruta:
+        from utils.training_dataset import RespuestasExactas, leer_pares_qa
+        # Igual que la ingesta: de las preguntas repetidas solo se indexa la primera
+        unicas = RespuestasExactas()
+        pares = [(p, r) for p, r in leer_pares_qa(ruta) if unicas.agregar(p, r)]
+    else:
+        rng = random.Random(semilla + 1)
+        pares, preguntas = [], set()
+        while len(pares) < min(cantidad, len(TEMAS_DATASET) * len(CARGOS) * len(DEPENDENCIAS)):
+            pregunta, respuesta = rng.choice(TEMAS_DATASET)
+            campos = {"cargo": rng.choice(CARGOS), "dependencia": rng.choice(DEPENDENCIAS), "m": rng.randint(2, 30)}
+            pregunta = pregunta.format(**campos)
+            if pregunta not in preguntas:
+                preguntas.add(pregunta)
+                pares.append((pregunta, respuesta.format(**campos)))
+    return pares[:cantidad]
+
+
+def consultas_dataset(pares, semilla: int = 0):
+    """Preguntas del dataset reformuladas (minúsculas, sin signos de interrogación y con un prefijo)."""
+    rng = random.Random(semilla)
+    return [
+        {
+            "pregunta": f"{rng.choice(PREFIJOS_CONSULTA)} {pregunta.strip('¿?').lower()}",
+            "relevante": pregunta,
+            "fuente": "dataset",
+        }
+        for pregunta, _ in pares
+    ]
+
+
+def evaluar(indexer: DocumentIndexer, consultas, ks, calentamiento: int = 5) -> dict:
+    k_max = max(ks)
+    # Preguntas distintas de las medidas, para no llenar el LRU de embeddings de consulta
+    for i in range(calentamiento):
+        indexer.buscar_fragmentos(f"consulta de calentamiento {i}", top_k=k_max)
+
+    latencias, rangos = [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultados = indexer.buscar_fragmentos(consulta["pregunta"], top_k=k_max)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        rango = next(
+            (i for i, r in enumerate(resultados, start=1) if consulta["relevante"] in r["texto"]), None
+        )
+        rangos.append(rango)
+
+    latencias = np.array(latencias)
+    por_fuente = {}
+    for fuente in sorted({c["fuente"] for c in consultas}):
+        propios = [r for r, c in zip(rangos, consultas) if c["fuente"] == fuente]
+        por_fuente[fuente] = {f"recall@{k}": round(sum(r is not None and r <= k for r in propios) / len(propios), 4) for k in ks}
+    return {
+        "consultas": len(consultas),
+        **{f"recall@{k}": round(sum(r is not None and r <= k for r in rangos) / len(rangos), 4) for k in ks},
+        f"mrr@{k_max}": round(float(np.mean([1.0 / r if r else 0.0 for r in rangos])), 4),
+        "p50_ms": round(float(np.percentile(latencias, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencias, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencias, 99)), 3),
+        "por_fuente": por_fuente,
+    }
+
+
+async def medir_escala(escala: int, args, modelo, directorio: Path, **opciones) -> dict:
+    """Indexa el corpus de una escala y lo evalúa; `opciones` son campos extra de `IndexConfig`."""
+    documentos, consultas = construir_corpus(args.articulos, escala, args.semilla)
+    pares = pares_dataset(args.dataset, args.pares, args.semilla)
+    ruta_dataset = directorio / f"dataset_{escala}.jsonl"
+    with open(ruta_dataset, "w", encoding="utf-8") as f:
+        for pregunta, respuesta in pares:
+            f.write(json.dumps({"question": pregunta, "answer": respuesta}, ensure_ascii=False) + "\n")
+    consultas += consultas_dataset(pares, args.semilla)
+
+    sufijo = "".join(f"_{valor}" for valor in opciones.values())
+    config = IndexConfig(
+        cache_dir=str(directorio / f"cache_{escala}{sufijo}"),
+        collection_name=f"bench_{escala}x{sufijo}",
+        vector_backend=args.backend,
+        faiss_index_type=args.faiss_index_type,
+        **opciones
+    )
+    indexer = DocumentIndexer(config, modelo_embeddings=modelo)
+    inicio = time.perf_counter()
+    publicado = await indexer.reconstruir_indice(documentos, str(ruta_dataset))
+    construccion = time.perf_counter() - inicio
+    if not publicado:
+        raise RuntimeError(f"La reconstrucción del índice {escala}x no se publicó")
+
+    resultado = evaluar(indexer, consultas, [int(k) for k in args.ks.split(",")])
+    resultado.update({
+        "palabras_corpus": sum(len(t.split()) for t in documentos.values()),
+        "fragmentos": indexer.total_fragmentos(),
+        "construccion_s": round(construccion, 2),
+    })
+    return resultado
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "desconocido"
+
+
+def comparar(actual: dict, anterior: dict) -> dict:
+    """Diferencia (actual - anterior) de las métricas numéricas comunes por escala."""
+    diferencias = {}
+    for escala, metricas in actual["resultados"].items():
+        previas = anterior.get("resultados", {}).get(escala, {})
+        diferencias[escala] = {
+            clave: round(valor - previas[clave], 4)
+            for clave, valor in metricas.items()
+            if isinstance(valor, (int, float)) and isinstance(previas.get(clave), (int, float))
+        }
+    return {"commit_anterior": anterior.get("commit"), "diferencias": diferencias}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", default="1,10,100", help="Multiplicadores del tamaño del corpus")
+    parser.add_argument("--articulos", type=int, default=60, help="Artículos etiquetados (consultas) del corpus 1x")
+    parser.add_argument("--pares", type=int, default=40, help="Pares del dataset de entrenamiento consultados")
+    parser.add_argument("--dataset", default=None, help="Dataset de entrenamiento JSONL (por defecto, sintético)")
+    parser.add_argument("--ks", default="1,3,5")
+    parser.add_argument("--backend", default="faiss", choices=["faiss", "chroma"])
+    parser.add_argument("--faiss-index-type", default="flat")
+    parser.add_argument("--modelo", default=None, help="SentenceTransformer a usar en lugar del modelo por hashing")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", default=None, help="Archivo donde guardar el JSON de resultados")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    if args.modelo:
+        from sentence_transformers import SentenceTransformer
+        modelo = SentenceTransformer(args.modelo, device="cpu")
+    else:
+        modelo = EmbedderHash()
+
+    if args.dataset:
+        args.dataset = str(Path(args.dataset).resolve())
+    # FAISS y Chroma persisten bajo el directorio de trabajo: se usa uno temporal
+    directorio = Path(tempfile.mkdtemp(prefix="bench_recuperacion_"))
+    anterior_cwd = os.getcwd()
+    resultados = {}
+    try:
+        os.chdir(directorio)
+        for escala in (int(e) for e in args.escalas.split(",")):
+            resultados[f"{escala}x"] = asyncio.run(medir_escala(escala, args, modelo, directorio))
+    finally:
+        os.chdir(anterior_cwd)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    salida = {
+        "commit": commit_actual(),
+        "modelo": args.modelo or "hash",
+        "backend": args.backend if args.backend == "chroma" else f"faiss_{args.faiss_index_type}",
+        "articulos": args.articulos,
+        "pares_dataset": args.pares,
+        "resultados": resultados,
+    }
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            salida["comparacion"] = comparar(salida, json.load(f))
+    texto = json.dumps(salida, ensure_ascii=False, indent=2)
+    if args.salida:
+        Path(args.salida).write_text(texto, encoding="utf-8")
+    print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark de recall@k y latencia de búsqueda de los backends vectoriales.
+
+Compara la colección de ChromaDB (si está instalado) con `FaissVectorStore` en sus
+tres tipos de índice (flat, hnsw, ivfpq). La referencia exacta es la búsqueda por
+fuerza bruta con NumPy sobre los mismos vectores normalizados.
+
+Por defecto usa vectores unitarios aleatorios; con --modelo y --corpus se
+codifican los textos de un archivo (una línea por fragmento) y las consultas son
+fragmentos del mismo corpus con ruido.
+
+Uso:
+    python benchmarks/bench_vector_store.py --vectores 50000 --consultas 500 --k 5
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.vector_store import TIPOS_INDICE_FAISS, FaissVectorStore  # noqa: E402
+
+
+def normalizar(vectores: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    return (vectores / np.maximum(normas, 1e-12)).astype(np.float32)
+
+
+def datos_sinteticos(cantidad: int, consultas: int, dimension: int, semilla: int = 0):
+    rng = np.random.default_rng(semilla)
+    base = normalizar(rng.standard_normal((cantidad, dimension)))
+    # Consultas cercanas a vectores del corpus, como preguntas sobre un fragmento
+    elegidos = rng.integers(0, cantidad, consultas)
+    q = normalizar(base[elegidos] + 0.05 * rng.standard_normal((consultas, dimension)))
+    return base, q
+
+
+def datos_corpus(ruta: str, modelo_nombre: str, consultas: int, semilla: int = 0):
+    from sentence_transformers import SentenceTransformer
+
+    textos = [linea.strip() for linea in open(ruta, encoding="utf-8") if linea.strip()]
+    modelo = SentenceTransformer(modelo_nombre, device="cpu")
+    base = normalizar(modelo.encode(textos, batch_size=64, convert_to_numpy=True))
+    rng = np.random.default_rng(semilla)
+    elegidos = rng.integers(0, len(textos), consultas)
+    q = normalizar(base[elegidos] + 0.05 * rng.standard_normal((consultas, base.shape[1])))
+    return base, q
+
+
+def referencia_exacta(base: np.ndarray, consultas: np.ndarray, k: int) -> np.ndarray:
+    similitudes = consultas @ base.T
+    mejores = np.argpartition(-similitudes, k - 1, axis=1)[:, :k]
+    return mejores
+
+
+def cargar(almacen, base: np.ndarray, lote: int = 5000):
+    for inicio in range(0, len(base), lote):
+        fin = min(inicio + lote, len(base))
+        almacen.add(
+            documents=[""] * (fin - inicio),
+            embeddings=base[inicio:fin],
+            metadatas=[{"origen": "bench"}] * (fin - inicio),
+            ids=[str(i) for i in range(inicio, fin)],
+        )
+
+
+def medir(almacen, consultas: np.ndarray, exactos: np.ndarray, k: int) -> dict:
+    latencias, aciertos = [], 0
+    for q, esperados in zip(consultas, exactos):
+        inicio = time.perf_counter()
+        resultado = almacen.query(query_embeddings=[q.tolist()], n_results=k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        obtenidos = {int(i) for i in resultado["ids"][0]}
+        aciertos += len(obtenidos & set(esperados.tolist()))
+    latencias = np.array(latencias)
+    return {
+        f"recall@{k}": round(aciertos / (len(consultas) * k), 4),
+        "p50_ms": round(float(np.percentile(latencias, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencias, 95)), 3),
+    }
+
+
+def bench_faiss(tipo: str, base, consultas, exactos, k, directorio) -> dict:
+    ruta = Path(directorio) / f"faiss_{tipo}"
+    almacen = FaissVectorStore(str(ruta), tipo=tipo)
+    inicio = time.perf_counter()
+    cargar(almacen, base)
+    almacen.guardar()
+    construccion = time.perf_counter() - inicio
+    # Se reabre desde disco para medir la búsqueda con el índice memoria-mapeado
+    almacen = FaissVectorStore(str(ruta), tipo=tipo)
+    almacen.query(query_embeddings=[consultas[0].tolist()], n_results=k)  # calentamiento
+    resultado = medir(almacen, consultas, exactos, k)
+    resultado["construccion_s"] = round(construccion, 2)
+    return resultado
+
+
+def bench_chroma(base, consultas, exactos, k, directorio) -> dict:
+    import chromadb
+
+    cliente = chromadb.PersistentClient(path=str(Path(directorio) / "chroma"))
+    coleccion = cliente.get_or_create_collection(
+        "bench", metadata={"hnsw:space": "cosine", "hnsw:construction_ef": 200, "hnsw:search_ef": 100, "hnsw:M": 64},
+        embedding_function=None
+    )
+    inicio = time.perf_counter()
+    cargar(coleccion, base)
+    construccion = time.perf_counter() - inicio
+    coleccion.query(query_embeddings=[consultas[0].tolist()], n_results=k)
+    resultado = medir(coleccion, consultas, exactos, k)
+    resultado["construccion_s"] = round(construccion, 2)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectores", type=int, default=20000)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modelo", default=None, help="Modelo de embeddings para --corpus")
+    parser.add_argument("--corpus", default=None, help="Archivo de texto, un fragmento por línea")
+    parser.add_argument("--tipos", default=",".join(TIPOS_INDICE_FAISS))
+    args = parser.parse_args()
+
+    if args.corpus:
+        base, consultas = datos_corpus(args.corpus, args.modelo or "sentence-transformers/all-MiniLM-L6-v2", args.consultas)
+    else:
+        base, consultas = datos_sinteticos(args.vectores, args.consultas, args.dimension)
+    exactos = referencia_exacta(base, consultas, args.k)
+
+    directorio = tempfile.mkdtemp(prefix="bench_vector_store_")
+    resultados = {}
+    try:
+        try:
+            resultados["chroma"] = bench_chroma(base, consultas, exactos, args.k, directorio)
+        except ImportError:
+            resultados["chroma"] = "chromadb no instalado"
+        for tipo in args.tipos.split(","):
+            resultados[f"faiss_{tipo}"] = bench_faiss(tipo, base, consultas, exactos, args.k, directorio)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    print(json.dumps({
+        "vectores": len(base),
+        "dimension": base.shape[1],
+        "consultas": len(consultas),
+        "k": args.k,
+        "resultados": resultados,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
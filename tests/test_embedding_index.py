@@ -0,0 +1,180 @@
+"""
+Versiones del índice y deduplicación de fragmentos entre documentos: la
+generación sobrevive a un reinicio, la colección heredada solo se retira al
+publicar una versión, y el canónico compartido se sigue encontrando al filtrar o
+enrutar por cualquiera de sus orígenes. Usa FAISS y un modelo de embeddings
+determinista, sin descargar modelos.
+"""
+import asyncio
+import threading
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+
+from utils.embedding_index import SEPARADOR_ORIGENES, DocumentIndexer, IndexConfig  # noqa: E402
+
+COMPARTIDO = (
+    "El trabajador que falte sin justa causa deberá reponer el tiempo perdido dentro del mes siguiente. "
+    "La reposición se acordará por escrito con el jefe inmediato y quedará registrada en la nómina. "
+    "Las horas repuestas no se consideran trabajo suplementario ni generan recargo alguno. "
+)
+PROPIO_A = (
+    "Los uniformes de dotación se entregan tres veces al año a quienes devenguen hasta dos salarios mínimos. "
+    "La talla se informa a gestión humana durante el primer mes de vinculación con la empresa. "
+    "El uso del uniforme es obligatorio en las sedes que atienden público de lunes a viernes. "
+)
+PROPIO_B = (
+    "El auxilio de transporte se paga a quienes devenguen hasta dos salarios mínimos mensuales vigentes. "
+    "No se reconoce durante las vacaciones ni en los días de incapacidad del trabajador afectado. "
+    "El valor se liquida junto con el salario en cada quincena según los días laborados. "
+)
+PREGUNTA = "cuándo debe reponer el tiempo perdido el trabajador que falte sin justa causa"
+
+
+class EmbedderPalabras:
+    """Suma de vectores aleatorios (por hash) de las palabras: textos con vocabulario común quedan cerca."""
+
+    dimension = 128
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, textos, **kwargs):
+        unico = isinstance(textos, str)
+        matriz = np.zeros((1 if unico else len(textos), self.dimension), dtype=np.float32)
+        for fila, texto in zip(matriz, [textos] if unico else textos):
+            for palabra in texto.lower().split():
+                semilla = zlib.crc32(palabra.strip(".,¿?").encode("utf-8"))
+                fila += np.random.default_rng(semilla).standard_normal(self.dimension).astype(np.float32)
+            fila /= max(float(np.linalg.norm(fila)), 1e-12)
+        return matriz[0] if unico else matriz
+
+
+def _crear_indexador(tmp_path):
+    return DocumentIndexer(
+        IndexConfig(
+            collection_name="prueba",
+            cache_dir=str(tmp_path / "cache"),
+            vector_backend="faiss",
+            faiss_index_type="flat",
+            include_training_data=False,
+            origenes_busqueda=None,
+            chunk_size=3,
+            chunk_overlap=0,
+            min_chunk_words=5,
+            min_similarity_threshold=0.3,
+            chunk_workers=1,
+            pca_dimension=None,
+        ),
+        modelo_embeddings=EmbedderPalabras(),
+    )
+
+
+@pytest.fixture
+def indexador(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    indexador = _crear_indexador(tmp_path)
+    yield indexador
+    indexador.cerrar()
+
+
+def _esperar_eliminaciones():
+    for hilo in threading.enumerate():
+        if hilo.name == "eliminar_versiones":
+            hilo.join(timeout=10)
+
+
+def _origenes(fragmento):
+    return fragmento["metadata"].get("origenes", fragmento["origen"]).split(SEPARADOR_ORIGENES)
+
+
+def _compartido(indexador, origen):
+    resultados = indexador.buscar_fragmentos(PREGUNTA, top_k=3, filtros={"origen": origen})
+    return [r for r in resultados if "reponer el tiempo perdido" in r["texto"] and origen in _origenes(r)]
+
+
+def test_canonico_compartido_se_encuentra_por_cada_origen(indexador):
+    asyncio.run(indexador.reconstruir_indice({"a.docx": COMPARTIDO + PROPIO_A, "b.docx": PROPIO_B + COMPARTIDO}))
+
+    assert indexador.total_fragmentos() == 3
+    assert _compartido(indexador, "a.docx") and _compartido(indexador, "b.docx")
+
+
+def test_eliminar_el_origen_del_canonico_lo_conserva_para_el_otro(indexador):
+    asyncio.run(indexador.reconstruir_indice({"a.docx": COMPARTIDO + PROPIO_A, "b.docx": PROPIO_B + COMPARTIDO}))
+
+    indexador.eliminar_origen("a.docx")
+    restantes = _compartido(indexador, "b.docx")
+    assert restantes and restantes[0]["origen"] == "b.docx"
+    assert indexador.buscar_fragmentos(PREGUNTA, top_k=3, filtros={"origen": "a.docx"}) == []
+
+    # Volver a indexar el documento no choca con el fragmento que cedió
+    asyncio.run(indexador.indexar_documentos({"a.docx": COMPARTIDO + PROPIO_A}))
+    assert _compartido(indexador, "a.docx") and _compartido(indexador, "b.docx")
+    assert indexador.total_fragmentos() == 4
+
+
+def test_no_deduplica_entre_particiones(indexador):
+    reglamento, procedimiento = indexador.config.particiones["reglamento"][0], indexador.config.particiones["procedimiento"][0]
+    asyncio.run(indexador.reconstruir_indice({reglamento: COMPARTIDO + PROPIO_A, procedimiento: COMPARTIDO + PROPIO_B}))
+
+    assert indexador.total_fragmentos() == 4
+    for origen in (reglamento, procedimiento):
+        resultados = indexador.buscar_fragmentos(PREGUNTA, top_k=1, filtros={"origen": origen})
+        assert resultados and resultados[0]["origen"] == origen
+
+
+def test_la_generacion_se_conserva_al_reiniciar(indexador, tmp_path):
+    asyncio.run(indexador.reconstruir_indice({"a.docx": COMPARTIDO + PROPIO_A}))
+    asyncio.run(indexador.indexar_documentos({"b.docx": PROPIO_B}))
+    generacion = indexador.generacion_indice
+
+    reiniciado = _crear_indexador(tmp_path)
+    try:
+        assert reiniciado.generacion_indice == generacion != "vacio"
+        reiniciado.eliminar_origen("b.docx")
+        assert reiniciado.generacion_indice not in (generacion, "vacio")
+    finally:
+        reiniciado.cerrar()
+
+
+def test_la_coleccion_heredada_se_retira_solo_al_publicar(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    heredada = tmp_path / ".faiss" / "prueba"
+    heredada.mkdir(parents=True)
+    indexador = _crear_indexador(tmp_path)
+    try:
+        _esperar_eliminaciones()
+        assert heredada.exists()
+
+        asyncio.run(indexador.reconstruir_indice({"a.docx": COMPARTIDO + PROPIO_A}))
+        _esperar_eliminaciones()
+        assert not heredada.exists()
+    finally:
+        indexador.cerrar()
+
+
+def test_fusion_no_calcula_embeddings_de_los_fragmentos_solo_lexicos(indexador, monkeypatch):
+    asyncio.run(indexador.reconstruir_indice({"a.docx": COMPARTIDO + PROPIO_A, "b.docx": PROPIO_B}))
+    consulta = indexador.calcular_embedding_consulta("auxilio de transporte durante las vacaciones")
+    similitudes = []
+    original = indexador._similitudes_fragmentos
+
+    def espiar(*args):
+        similitudes.append(original(*args))
+        return similitudes[-1]
+
+    def prohibido(*args, **kwargs):
+        raise AssertionError("la búsqueda no debe calcular embeddings de fragmentos")
+
+    monkeypatch.setattr(indexador, "_similitudes_fragmentos", espiar)
+    monkeypatch.setattr(indexador, "_calcular_embeddings", prohibido)
+    indexador.config.k_por_particion = 1
+    resultados = indexador.buscar_fragmentos("auxilio de transporte durante las vacaciones", top_k=1, embedding_consulta=consulta)
+
+    assert similitudes and resultados
@@ -0,0 +1,41 @@
+"""Reentrenamiento en segundo plano del clasificador rápido."""
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from utils.fast_classifier import ClasificadorRapido, FastClassifierConfig  # noqa: E402
+from utils.model_inference import CATEGORIAS_PREGUNTA  # noqa: E402
+
+
+def _ejemplos(cantidad, dimension=16, semilla=0):
+    rng = np.random.default_rng(semilla)
+    centros = rng.standard_normal((len(CATEGORIAS_PREGUNTA), dimension))
+    etiquetas = rng.integers(0, len(CATEGORIAS_PREGUNTA), cantidad)
+    vectores = centros[etiquetas] + 0.1 * rng.standard_normal((cantidad, dimension))
+    return vectores.astype(np.float32), [CATEGORIAS_PREGUNTA[i] for i in etiquetas]
+
+
+def test_agregar_ejemplo_reentrena_fuera_del_hilo_que_llama(tmp_path, monkeypatch):
+    clasificador = ClasificadorRapido(
+        str(tmp_path / "cabeza.npz"), FastClassifierConfig(min_ejemplos=30, reentrenar_cada=30)
+    )
+    hilos = []
+    entrenar = clasificador.entrenar
+
+    def espiar(X, categorias):
+        hilos.append(threading.current_thread())
+        return entrenar(X, categorias)
+
+    monkeypatch.setattr(clasificador, "entrenar", espiar)
+    vectores, categorias = _ejemplos(30)
+    for vector, categoria in zip(vectores, categorias):
+        clasificador.agregar_ejemplo(vector, categoria)
+    clasificador.esperar_reentrenamiento(timeout=30)
+
+    assert hilos and hilos[0] is not threading.current_thread()
+    assert clasificador.esta_entrenado()
+    assert clasificador.predecir(vectores[0])[0] == categorias[0]
+    assert (tmp_path / "cabeza.npz").exists() and not (tmp_path / "cabeza.tmp").exists()
@@ -0,0 +1,90 @@
+"""
+Retraso del event loop medido con `EventLoopLagMonitor` mientras se atiende una
+consulta: el trabajo bloqueante (embeddings, búsqueda, lectura de archivos,
+escritura del índice) debe correr fuera del loop y el retraso quedar bajo el
+objetivo de 50 ms.
+"""
+import asyncio
+import time
+
+from utils import normativa_local as modulo_normativa
+from utils import web_search
+from utils.loop_monitor import EventLoopLagMonitor
+from utils.normativa_local import NormativaLocal, NormativaLocalConfig
+from utils.web_search import WebSearchConfig, buscar_normativa_web_async
+
+OBJETIVO_MS = 50.0
+BLOQUEO_S = 0.2  # Lo que tarda cada paso lento simulado
+
+
+async def _medir(corrutina):
+    """Ejecuta la corrutina con el monitor activo y retorna su resultado y el retraso máximo (ms)."""
+    monitor = EventLoopLagMonitor(intervalo_s=0.01, umbral_ms=OBJETIVO_MS)
+    await monitor.iniciar()
+    await asyncio.sleep(0.05)
+    try:
+        resultado = await corrutina
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.detener()
+    return resultado, monitor.estadisticas()["max_ms"]
+
+
+def test_el_monitor_detecta_un_bloqueo():
+    async def bloqueante():
+        time.sleep(BLOQUEO_S)
+
+    _, retraso = asyncio.run(_medir(bloqueante()))
+    assert retraso >= BLOQUEO_S * 1000 * 0.8
+
+
+def test_consulta_a_la_normativa_local_no_bloquea_el_loop(monkeypatch):
+    class NormativaLenta:
+        def buscar(self, pregunta, top_k=5):
+            time.sleep(BLOQUEO_S)  # Embedding de la consulta y búsqueda en el índice
+            return [{"id": "1", "origen": "decreto.html", "texto": "quince días hábiles de vacaciones"}]
+
+    def mejor_respuesta(pregunta, textos, top_n=8, preclasificados=False):
+        time.sleep(BLOQUEO_S)  # Modelo QA
+        return next(iter(textos)), "quince días hábiles", 0.9
+
+    monkeypatch.setattr(web_search, "mejor_respuesta", mejor_respuesta)
+    consulta = buscar_normativa_web_async("vacaciones", WebSearchConfig(usar_web=False), NormativaLenta())
+    respuesta, retraso = asyncio.run(_medir(consulta))
+
+    assert "quince días hábiles" in respuesta
+    assert retraso < OBJETIVO_MS
+
+
+def test_sincronizar_la_normativa_no_bloquea_el_loop(tmp_path, monkeypatch):
+    class IndexadorLento:
+        indexacion_completa = False
+
+        def eliminar_origen(self, origen):
+            time.sleep(BLOQUEO_S)
+
+        def guardar_indices(self):
+            time.sleep(BLOQUEO_S)
+
+        async def indexar_documentos(self, documentos):
+            await asyncio.sleep(0)
+
+    def leer_lento(ruta):
+        time.sleep(BLOQUEO_S)  # Extraer el texto de un DOCX o un HTML grande
+        return ruta.read_text(encoding="utf-8")
+
+    directorio = tmp_path / "normativa"
+    directorio.mkdir()
+    (directorio / "decreto.txt").write_text("Artículo 1. Texto del decreto.", encoding="utf-8")
+    monkeypatch.setattr(modulo_normativa, "leer_documento_normativa", leer_lento)
+    # Sin construir el indexador real: solo interesa el recorrido de `sincronizar`
+    normativa = NormativaLocal.__new__(NormativaLocal)
+    normativa.config = NormativaLocalConfig(directorio=str(directorio), cache_dir=str(tmp_path))
+    normativa.indexer = IndexadorLento()
+    normativa._ruta_manifiesto = tmp_path / "manifiesto_normativa.json"
+    normativa._manifiesto = {"retirado.txt": "huella"}
+
+    resumen, retraso = asyncio.run(_medir(normativa.sincronizar()))
+
+    assert resumen == {"agregados": 1, "actualizados": 0, "retirados": 1}
+    assert retraso < OBJETIVO_MS
@@ -0,0 +1,77 @@
+"""
+Equivalencia del modelo de embeddings exportado a ONNX (float32 e int8) con el
+SentenceTransformer original, sobre similitudes de coseno. Requiere onnxruntime,
+torch y sentence-transformers; el modelo se descarga y exporta una sola vez.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+from sentence_transformers import SentenceTransformer  # noqa: E402
+
+from utils.onnx_embedder import ORACIONES_VERIFICACION, EmbedderONNX, similitudes_coseno, verificar_equivalencia  # noqa: E402
+
+MODELO = os.getenv("ONNX_TEST_MODEL", "hiiamsid/sentence_similarity_spanish_es")
+
+TEXTOS = ORACIONES_VERIFICACION + [
+    "Artículo 12. " + "El trabajador deberá presentar la incapacidad dentro de los tres días hábiles siguientes. " * 30,
+    "nómina",
+]
+
+
+@pytest.fixture(scope="module")
+def exportado(tmp_path_factory):
+    directorio = tmp_path_factory.mktemp("onnx")
+    EmbedderONNX.exportar(MODELO, str(directorio))
+    return str(directorio)
+
+
+@pytest.fixture(scope="module")
+def original():
+    return SentenceTransformer(MODELO, device="cpu")
+
+
+@pytest.mark.parametrize("cuantizado, coseno_minimo, diferencia_maxima", [(False, 0.9999, 1e-3), (True, 0.99, 0.05)])
+def test_embeddings_equivalentes_al_original(exportado, original, cuantizado, coseno_minimo, diferencia_maxima):
+    embedder = EmbedderONNX.cargar_o_exportar(MODELO, exportado, cuantizado=cuantizado)
+    resultado = verificar_equivalencia(original, embedder, TEXTOS)
+
+    assert resultado["coseno_minimo"] >= coseno_minimo
+    assert resultado["diferencia_similitud_maxima"] <= diferencia_maxima
+
+
+def test_ranking_de_similitudes_se_conserva(exportado, original):
+    embedder = EmbedderONNX.cargar_o_exportar(MODELO, exportado, cuantizado=False)
+    consulta, documentos = TEXTOS[0], TEXTOS[1:]
+    referencia = similitudes_coseno(original.encode([consulta]), original.encode(documentos))[0]
+    obtenidas = similitudes_coseno(embedder.encode([consulta]), embedder.encode(documentos))[0]
+
+    assert list(np.argsort(-obtenidas)) == list(np.argsort(-referencia))
+
+
+def test_forma_y_tipo_como_sentence_transformers(exportado, original):
+    embedder = EmbedderONNX.cargar_o_exportar(MODELO, exportado)
+
+    assert embedder.encode(TEXTOS[0]).shape == (original.get_sentence_embedding_dimension(),)
+    lote = embedder.encode(TEXTOS, batch_size=4)
+    assert lote.shape == (len(TEXTOS), original.get_sentence_embedding_dimension())
+    assert lote.dtype == np.float32
+
+
+def test_exportacion_por_debajo_del_umbral_se_rechaza(exportado):
+    with pytest.raises(ValueError):
+        EmbedderONNX.cargar_o_exportar(MODELO, exportado, cuantizado=True, coseno_minimo=1.01)
+
+
+def test_verificacion_guardada_en_la_configuracion(exportado):
+    with open(os.path.join(exportado, "embedder.json"), encoding="utf-8") as f:
+        configuracion = json.load(f)
+
+    assert {"equivalencia", "equivalencia_int8"} <= set(configuracion)
+    assert not os.path.exists(os.path.join(exportado, "embedder.json.tmp"))
@@ -0,0 +1,40 @@
+"""
+Carga de pesos .safetensors como memoria mapeada: los tensores alineados son
+vistas del archivo y los desalineados se toman de una copia privada.
+"""
+import json
+import struct
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+
+from utils.replica_pool import cargar_state_dict_mmap  # noqa: E402
+
+
+def _escribir_safetensors(ruta, tensores):
+    """Escribe los tensores (nombre, dtype, forma, bytes) contiguos, sin relleno entre ellos."""
+    encabezado, datos = {}, b""
+    for nombre, dtype, forma, contenido in tensores:
+        encabezado[nombre] = {"dtype": dtype, "shape": forma, "data_offsets": [len(datos), len(datos) + len(contenido)]}
+        datos += contenido
+    texto = json.dumps(encabezado).encode("utf-8")
+    texto += b" " * (-len(texto) % 8)
+    ruta.write_bytes(struct.pack("<Q", len(texto)) + texto + datos)
+
+
+def test_tensores_alineados_y_desalineados(tmp_path):
+    ruta = tmp_path / "pesos.safetensors"
+    _escribir_safetensors(ruta, [
+        ("alineado", "F32", [2], struct.pack("<2f", 1.5, -2.0)),
+        ("bandera", "U8", [1], b"\x07"),
+        # Empieza en el byte 9 de los datos: no es múltiplo de 4
+        ("desalineado", "F32", [2], struct.pack("<2f", 3.25, 4.0)),
+    ])
+
+    tensores = cargar_state_dict_mmap(str(ruta))
+
+    assert tensores["alineado"].tolist() == [1.5, -2.0]
+    assert tensores["bandera"].tolist() == [7]
+    assert tensores["desalineado"].tolist() == [3.25, 4.0]
@@ -0,0 +1,62 @@
+"""
+Umbral del caché semántico: una reformulación de la pregunta acierta y la misma
+pregunta sobre otra entidad (otro cargo, otra dependencia) no, aunque sus
+embeddings sean casi idénticos.
+"""
+import zlib
+
+import numpy as np
+
+from utils.helpers import plegar_acentos
+from utils.semantic_cache import SemanticCache, SemanticCacheConfig
+
+GUARDADA = "¿Cuántos días de vacaciones tiene un docente de planta de la Facultad de Derecho?"
+
+
+def embedding_palabras(texto, dimension=256, anisotropia=0.5):
+    """
+    Rasgos por hash de palabras y trigramas, con una componente común como la de los
+    modelos de oraciones (textos no relacionados del mismo dominio ya se parecen).
+    """
+    vector = np.zeros(dimension, dtype=np.float32)
+    for palabra in plegar_acentos(texto).split():
+        palabra = palabra.strip(".,;:¿?¡!")
+        for rasgo in [palabra] + [palabra[i:i + 3] for i in range(max(1, len(palabra) - 2))]:
+            h = zlib.crc32(rasgo.encode("utf-8"))
+            vector[1 + h % (dimension - 1)] += 1.0 if (h >> 16) & 1 else -1.0
+    vector *= np.sqrt(1 - anisotropia) / max(float(np.linalg.norm(vector)), 1e-12)
+    vector[0] = np.sqrt(anisotropia)
+    return vector
+
+
+def _cache(**cambios):
+    cache = SemanticCache(embedding_palabras, SemanticCacheConfig(**cambios))
+    cache.guardar(GUARDADA, "Quince días hábiles.", "g1")
+    return cache
+
+
+def test_reformulacion_acierta():
+    cache = _cache()
+    nueva = "Quisiera saber cuántos días de vacaciones tiene el docente de planta de la facultad de derecho"
+
+    assert cache.buscar(nueva, "g1") == "Quince días hábiles."
+
+
+def test_otra_entidad_no_acierta():
+    cache = _cache()
+    for nueva in [
+        "¿Cuántos días de vacaciones tiene un docente de cátedra de la Facultad de Derecho?",
+        "¿Cuántos días de vacaciones tiene un docente de planta de la Facultad de Ingeniería?",
+        "¿Cuántos días de permiso tiene un docente de planta de la Facultad de Derecho?",
+    ]:
+        assert cache.buscar(nueva, "g1") is None
+    assert cache.estadisticas()["hits"] == 0
+
+
+def test_sin_control_de_terminos_el_umbral_no_basta():
+    # Cambiar solo el cargo deja la similitud por encima de cualquier umbral razonable
+    similitud = float(embedding_palabras(GUARDADA) @ embedding_palabras(GUARDADA.replace("planta", "cátedra")))
+    assert similitud > SemanticCacheConfig.similarity_threshold
+
+    cache = _cache(exigir_terminos=False)
+    assert cache.buscar(GUARDADA.replace("planta", "cátedra"), "g1") is not None
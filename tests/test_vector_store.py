@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from utils.vector_store import FaissVectorStore, VectorStore  # noqa: E402
+
+
+def _vectores(cantidad: int, dimension: int, semilla: int = 0) -> np.ndarray:
+    return np.random.default_rng(semilla).standard_normal((cantidad, dimension)).astype(np.float32)
+
+
+def test_add_con_ids_repetidos_en_el_lote_conserva_el_ultimo(tmp_path):
+    almacen = FaissVectorStore(str(tmp_path), tipo="flat")
+    vectores = _vectores(3, 8)
+    almacen.add(
+        documents=["primero", "otro", "segundo"],
+        embeddings=vectores,
+        metadatas=[{"origen": "a"}, {"origen": "b"}, {"origen": "c"}],
+        ids=["x", "y", "x"],
+    )
+
+    assert almacen.count() == 2
+    assert almacen.get(ids=["x"])["documents"] == ["segundo"]
+    resultado = almacen.query(query_embeddings=vectores[2:3], n_results=1)
+    assert resultado["ids"] == [["x"]] and resultado["metadatas"][0][0]["origen"] == "c"
+
+
+def test_filtro_eq_por_origen_y_por_otros_campos(tmp_path):
+    almacen = FaissVectorStore(str(tmp_path), tipo="flat")
+    almacen.add(
+        documents=["uno", "dos", "tres"],
+        embeddings=_vectores(3, 8),
+        metadatas=[{"origen": "a", "chunk_index": 0}, {"origen": "b", "chunk_index": 0}, {"origen": "a", "chunk_index": 1}],
+        ids=["1", "2", "3"],
+    )
+    consulta = _vectores(1, 8, semilla=1)
+
+    por_origen = almacen.query(query_embeddings=consulta, n_results=3, where={"origen": {"$eq": "a"}})
+    assert sorted(por_origen["ids"][0]) == ["1", "3"]
+    por_campo = almacen.query(query_embeddings=consulta, n_results=3, where={"chunk_index": {"$eq": 1}})
+    assert por_campo["ids"][0] == ["3"]
+    assert sorted(almacen.get(where={"origen": {"$eq": "b"}})["ids"]) == ["2"]
+
+
+def test_ivfpq_con_dimension_no_divisible_por_pq_m(tmp_path):
+    # 60 dimensiones (como una salida de PCA) no se dividen en 16 sub-cuantizadores
+    vectores = _vectores(39 * 256, 60)
+    almacen = FaissVectorStore(str(tmp_path), tipo="ivfpq", pq_m=16)
+    almacen.add(
+        documents=[""] * len(vectores),
+        embeddings=vectores,
+        metadatas=[{"origen": "bench"}] * len(vectores),
+        ids=[str(i) for i in range(len(vectores))],
+    )
+    almacen.guardar()
+
+    assert almacen._indice.pq.M == 15
+    resultado = almacen.query(query_embeddings=vectores[:1], n_results=5)
+    assert "0" in resultado["ids"][0]
+
+
+def test_vector_store_es_abstracta():
+    with pytest.raises(TypeError):
+        VectorStore()
+
+    class Incompleto(VectorStore):
+        def count(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        Incompleto()
@@ -0,0 +1,191 @@
+"""
+Búsqueda de normativa contra un servidor HTTP local que hace de buscador y de
+MinTrabajo: descarga concurrente, caché de páginas y revalidación con ETag/TTL.
+"""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+import pytest
+
+from utils import web_search
+from utils.web_search import PageCache, WebSearchConfig, _extraer_enlaces, buscar_normativa_web, buscar_normativa_web_async
+
+PAGINA_VACACIONES = """
+<html><head><script>var x = 1;</script></head><body>
+<nav>Inicio | Normativa</nav>
+<h1>Vacaciones</h1>
+<p>Los trabajadores tienen derecho a quince días hábiles consecutivos de vacaciones remuneradas.</p>
+</body></html>
+"""
+PAGINA_PRIMA = "<html><body><p>La prima de servicios se paga en junio y en diciembre.</p></body></html>"
+
+
+class _Servidor:
+    """Buscador y sitio de normativa en 127.0.0.1; registra cada petición recibida."""
+
+    def __init__(self):
+        self.paginas = {
+            "/vacaciones": ('"v1"', PAGINA_VACACIONES),
+            "/prima": ('"p1"', PAGINA_PRIMA),
+        }
+        self.fallar = set()
+        self.peticiones = []
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                ruta = self.path.split("?", 1)[0]
+                servidor.peticiones.append((ruta, self.headers.get("If-None-Match")))
+                if ruta == "/buscar":
+                    base = f"http://127.0.0.1:{servidor.puerto}"
+                    cuerpo = (
+                        f'<a href="{base}/vacaciones">Vacaciones</a>'
+                        f'<a href="/url?q={quote(base + "/prima")}&sa=U">Prima</a>'
+                        '<a href="http://127.0.0.1.evil.test/phishing">Falso</a>'
+                    )
+                    return self._responder(200, cuerpo)
+                if ruta in servidor.fallar:
+                    return self._responder(500, "error")
+                etag, html = servidor.paginas[ruta]
+                if self.headers.get("If-None-Match") == etag:
+                    return self._responder(304, None)
+                return self._responder(200, html, {"ETag": etag})
+
+            def _responder(self, estado, cuerpo, encabezados=None):
+                self.send_response(estado)
+                for nombre, valor in (encabezados or {}).items():
+                    self.send_header(nombre, valor)
+                datos = cuerpo.encode("utf-8") if cuerpo else b""
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.puerto = self.http.server_address[1]
+        self.hilo = threading.Thread(target=self.http.serve_forever, daemon=True)
+
+    def paginas_pedidas(self):
+        return [p for p in self.peticiones if p[0] != "/buscar"]
+
+
+@pytest.fixture
+def servidor():
+    servidor = _Servidor()
+    servidor.hilo.start()
+    yield servidor
+    servidor.http.shutdown()
+    servidor.http.server_close()
+
+
+@pytest.fixture(autouse=True)
+def qa_falso(monkeypatch):
+    """Sustituye el modelo QA: responde con el texto limpio de la página que habla de vacaciones."""
+    def mejor_respuesta(pregunta, textos, top_n=8, preclasificados=False):
+        url, texto = max(textos.items(), key=lambda item: "vacaciones" in item[1])
+        return url, texto, 0.9
+
+    monkeypatch.setattr(web_search, "mejor_respuesta", mejor_respuesta)
+    monkeypatch.setattr(web_search, "_normativa_local", None)
+
+
+def _config(servidor, tmp_path, **cambios):
+    return WebSearchConfig(
+        url_busqueda=f"http://127.0.0.1:{servidor.puerto}/buscar?q={{consulta}}",
+        dominio="127.0.0.1",
+        cache_dir=str(tmp_path / "cache"),
+        usar_web=True,
+        **cambios
+    )
+
+
+def test_descarga_las_paginas_y_las_sirve_del_cache_dentro_del_ttl(servidor, tmp_path):
+    config = _config(servidor, tmp_path)
+    respuesta = asyncio.run(buscar_normativa_web_async("¿Cuántos días de vacaciones?", config))
+
+    assert "quince días hábiles" in respuesta
+    assert "var x" not in respuesta and "Inicio" not in respuesta
+    assert f"http://127.0.0.1:{servidor.puerto}/vacaciones" in respuesta
+    assert sorted(servidor.paginas_pedidas()) == [("/prima", None), ("/vacaciones", None)]
+
+    servidor.peticiones.clear()
+    asyncio.run(buscar_normativa_web_async("¿Cuántos días de vacaciones?", config))
+    assert servidor.paginas_pedidas() == []
+
+
+def test_revalida_con_etag_cuando_vence_el_ttl(servidor, tmp_path):
+    config = _config(servidor, tmp_path, ttl_seconds=0)
+    asyncio.run(buscar_normativa_web_async("vacaciones", config))
+    url = f"http://127.0.0.1:{servidor.puerto}/vacaciones"
+    descargada = PageCache(config.cache_dir).obtener(url)["descargada"]
+
+    # Sin cambios: petición condicional, 304 y la entrada se renueva
+    servidor.peticiones.clear()
+    respuesta = asyncio.run(buscar_normativa_web_async("vacaciones", config))
+    assert ("/vacaciones", '"v1"') in servidor.paginas_pedidas()
+    assert "quince días hábiles" in respuesta
+    entrada = PageCache(config.cache_dir).obtener(url)
+    assert entrada["etag"] == '"v1"' and entrada["descargada"] >= descargada
+
+    # La página cambió: nueva versión y nuevo ETag en el caché
+    servidor.paginas["/vacaciones"] = ('"v2"', PAGINA_VACACIONES.replace("quince", "dieciocho"))
+    respuesta = asyncio.run(buscar_normativa_web_async("vacaciones", config))
+    assert "dieciocho días hábiles" in respuesta
+    assert PageCache(config.cache_dir).obtener(url)["etag"] == '"v2"'
+
+
+def test_usa_la_copia_vencida_si_la_descarga_falla(servidor, tmp_path):
+    config = _config(servidor, tmp_path, ttl_seconds=0)
+    asyncio.run(buscar_normativa_web_async("vacaciones", config))
+
+    servidor.fallar.add("/vacaciones")
+    respuesta = asyncio.run(buscar_normativa_web_async("vacaciones", config))
+    assert "quince días hábiles" in respuesta
+
+
+def test_version_sincrona_dentro_de_un_event_loop(servidor, tmp_path):
+    config = _config(servidor, tmp_path)
+
+    async def handler():
+        return buscar_normativa_web("vacaciones", config)
+
+    assert "quince días hábiles" in asyncio.run(handler())
+    assert "quince días hábiles" in buscar_normativa_web("vacaciones", config)
+
+
+def test_extraer_enlaces_solo_acepta_el_dominio_y_sus_subdominios():
+    html = "".join(f'<a href="{url}">x</a>' for url in [
+        "https://www.mintrabajo.gov.co/normativa/decreto-1072",
+        "https://mintrabajo.gov.co/ley",
+        "https://mintrabajo.gov.co.evil.com/ley",
+        "https://falsomintrabajo.gov.co/ley",
+        "/url?q=https%3A%2F%2Fwww.mintrabajo.gov.co%2Fresolucion&sa=U",
+    ])
+    assert _extraer_enlaces(html, "mintrabajo.gov.co", 10) == [
+        "https://www.mintrabajo.gov.co/normativa/decreto-1072",
+        "https://mintrabajo.gov.co/ley",
+        "https://www.mintrabajo.gov.co/resolucion",
+    ]
+
+
+def test_busqueda_local_fuera_del_event_loop(servidor, tmp_path):
+    hilos = []
+
+    class NormativaFalsa:
+        def buscar(self, pregunta, top_k=5):
+            hilos.append(threading.current_thread())
+            return [{"id": "1", "origen": "decreto.html", "texto": "quince días de vacaciones"}]
+
+    async def consultar():
+        respuesta = await buscar_normativa_web_async("vacaciones", _config(servidor, tmp_path), NormativaFalsa())
+        return respuesta, threading.current_thread()
+
+    respuesta, hilo_loop = asyncio.run(consultar())
+    assert "normativa local" in respuesta and "decreto.html" in respuesta
+    assert hilos and hilos[0] is not hilo_loop
+    assert servidor.peticiones == []
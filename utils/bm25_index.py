@@ -0,0 +1,219 @@
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from nltk.stem.snowball import SpanishStemmer
+
+from utils.helpers import plegar_acentos
+
+logger = logging.getLogger(__name__)
+
+_PATRON_TERMINO = re.compile(r"\w+")
+_STEMMER = SpanishStemmer()
+
+# Palabras funcionales del español (ya plegadas) que no aportan al ranking
+PALABRAS_VACIAS = frozenset("""
+a al algo ante antes como con contra cual cuales cuando de del desde donde durante e el ella ellas
+ellos en entre era es esa esas ese eso esos esta estan estas este esto estos fue ha hay la las le
+les lo los mas me mi mis muy no nos o para pero por que se segun ser si sin sobre son su sus tambien
+te tiene tu un una unas uno unos y ya
+""".split())
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Pliega tildes y mayúsculas, descarta palabras vacías y aplica stemming (Snowball)."""
+    return [
+        _STEMMER.stem(t) if not t.isdigit() else t
+        for t in _PATRON_TERMINO.findall(plegar_acentos(texto))
+        if t not in PALABRAS_VACIAS
+    ]
+
+
+class BM25Index:
+    """
+    Índice invertido con puntuación BM25 sobre los mismos fragmentos de la colección
+    vectorial. Cada término guarda sus posiciones y frecuencias como arreglos NumPy,
+    de modo que puntuar una consulta son unas pocas sumas vectorizadas. Los
+    fragmentos eliminados se marcan como inactivos y se descartan al compactar.
+    """
+
+    def __init__(self, ruta: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.ruta = Path(ruta) if ruta else None
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._limpiar()
+        if self.ruta and self.ruta.exists():
+            self.cargar()
+
+    def _limpiar(self):
+        self.ids: List[str] = []
+        self.origenes: List[str] = []
+        self._posicion: Dict[str, int] = {}
+        self._largos: List[int] = []
+        self._activos: List[bool] = []
+        # término -> ([posiciones], [frecuencias]) pendientes de congelar en arreglos
+        self._pendientes: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._arr_largos = np.zeros(0, dtype=np.float32)
+        self._arr_activos = np.zeros(0, dtype=bool)
+        self._arr_origenes = np.zeros(0, dtype=object)
+
+    def __len__(self) -> int:
+        return sum(self._activos)
+
+    def agregar(self, ids: Sequence[str], textos: Sequence[str], origenes: Optional[Sequence[str]] = None) -> None:
+        """Agrega (o reemplaza) fragmentos al índice."""
+        origenes = origenes or [""] * len(ids)
+        with self._lock:
+            for fragmento_id, texto, origen in zip(ids, textos, origenes):
+                anterior = self._posicion.get(fragmento_id)
+                if anterior is not None:
+                    self._activos[anterior] = False
+                posicion = len(self.ids)
+                self.ids.append(fragmento_id)
+                self.origenes.append(origen)
+                self._posicion[fragmento_id] = posicion
+                self._activos.append(True)
+                terminos = tokenizar(texto)
+                self._largos.append(len(terminos))
+                conteo: Dict[str, int] = {}
+                for termino in terminos:
+                    conteo[termino] = conteo.get(termino, 0) + 1
+                for termino, tf in conteo.items():
+                    posiciones, frecuencias = self._pendientes.setdefault(termino, ([], []))
+                    posiciones.append(posicion)
+                    frecuencias.append(tf)
+
+    def eliminar_origen(self, origen: str) -> int:
+        """Desactiva todos los fragmentos de un origen. Retorna cuántos se desactivaron."""
+        with self._lock:
+            eliminados = 0
+            for posicion, (fragmento_origen, activo) in enumerate(zip(self.origenes, self._activos)):
+                if activo and fragmento_origen == origen:
+                    self._activos[posicion] = False
+                    self._posicion.pop(self.ids[posicion], None)
+                    eliminados += 1
+            self._arr_activos = np.array(self._activos, dtype=bool)
+            return eliminados
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._limpiar()
+
+    def _congelar(self):
+        """Mueve los postings pendientes a los arreglos NumPy."""
+        if not self._pendientes and len(self._arr_largos) == len(self._largos):
+            return
+        for termino, (posiciones, frecuencias) in self._pendientes.items():
+            nuevas = np.array(posiciones, dtype=np.int32)
+            tf = np.array(frecuencias, dtype=np.float32)
+            if termino in self._postings:
+                viejas, tf_viejas = self._postings[termino]
+                nuevas = np.concatenate([viejas, nuevas])
+                tf = np.concatenate([tf_viejas, tf])
+            self._postings[termino] = (nuevas, tf)
+        self._pendientes = {}
+        self._arr_largos = np.array(self._largos, dtype=np.float32)
+        self._arr_activos = np.array(self._activos, dtype=bool)
+        self._arr_origenes = np.array(self.origenes, dtype=object)
+
+    def buscar(self, consulta: str, top_k: int = 10, origenes: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Retorna hasta `top_k` pares (id, puntaje BM25) con puntaje > 0."""
+        terminos = set(tokenizar(consulta))
+        with self._lock:
+            self._congelar()
+            n_activos = int(self._arr_activos.sum())
+            if not terminos or n_activos == 0:
+                return []
+            largo_medio = max(float(self._arr_largos[self._arr_activos].mean()), 1.0)
+            puntajes = np.zeros(len(self.ids), dtype=np.float32)
+            for termino in terminos:
+                posting = self._postings.get(termino)
+                if posting is None:
+                    continue
+                posiciones, tf = posting
+                df = int(self._arr_activos[posiciones].sum())
+                if df == 0:
+                    continue
+                idf = np.log(1 + (n_activos - df + 0.5) / (df + 0.5))
+                normalizacion = self.k1 * (1 - self.b + self.b * self._arr_largos[posiciones] / largo_medio)
+                puntajes[posiciones] += idf * tf * (self.k1 + 1) / (tf + normalizacion)
+
+            validos = self._arr_activos & (puntajes > 0)
+            if origenes is not None:
+                validos &= np.isin(self._arr_origenes, list(origenes))
+            candidatos = np.flatnonzero(validos)
+            if len(candidatos) > top_k:
+                candidatos = candidatos[np.argpartition(-puntajes[candidatos], top_k - 1)[:top_k]]
+            candidatos = candidatos[np.argsort(-puntajes[candidatos])]
+            return [(self.ids[i], float(puntajes[i])) for i in candidatos]
+
+    def guardar(self) -> None:
+        """Guarda el índice compactado (sin fragmentos inactivos)."""
+        if not self.ruta:
+            return
+        with self._lock:
+            self._congelar()
+            vivos = np.flatnonzero(self._arr_activos)
+            nueva_posicion = np.full(len(self.ids), -1, dtype=np.int32)
+            nueva_posicion[vivos] = np.arange(len(vivos), dtype=np.int32)
+            terminos, offsets, posiciones, frecuencias = [], [0], [], []
+            for termino, (pos, tf) in self._postings.items():
+                mascara = self._arr_activos[pos]
+                if not mascara.any():
+                    continue
+                terminos.append(termino)
+                posiciones.append(nueva_posicion[pos[mascara]])
+                frecuencias.append(tf[mascara])
+                offsets.append(offsets[-1] + int(mascara.sum()))
+            datos = {
+                "ids": np.array([self.ids[i] for i in vivos], dtype=object),
+                "origenes": np.array([self.origenes[i] for i in vivos], dtype=object),
+                "largos": self._arr_largos[vivos],
+                "terminos": np.array(terminos, dtype=object),
+                "offsets": np.array(offsets, dtype=np.int64),
+                "posiciones": np.concatenate(posiciones) if posiciones else np.zeros(0, dtype=np.int32),
+                "frecuencias": np.concatenate(frecuencias) if frecuencias else np.zeros(0, dtype=np.float32),
+            }
+        try:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            # Temporal y reemplazo: una interrupción no deja el índice a medio escribir
+            temporal = self.ruta.with_suffix(".tmp")
+            with open(temporal, "wb") as f:
+                np.savez(f, **datos)
+            os.replace(temporal, self.ruta)
+            logger.info(f"Índice BM25 guardado: {len(datos['ids'])} fragmentos, {len(terminos)} términos")
+        except Exception as e:
+            logger.warning(f"Error al guardar el índice BM25: {e}")
+
+    def cargar(self) -> None:
+        try:
+            with np.load(self.ruta, allow_pickle=True) as datos:
+                ids = datos["ids"].tolist()
+                origenes = datos["origenes"].tolist()
+                largos = datos["largos"]
+                terminos = datos["terminos"].tolist()
+                offsets = datos["offsets"]
+                posiciones = datos["posiciones"]
+                frecuencias = datos["frecuencias"]
+            with self._lock:
+                self._limpiar()
+                self.ids = ids
+                self.origenes = origenes
+                self._posicion = {fragmento_id: i for i, fragmento_id in enumerate(ids)}
+                self._largos = largos.astype(int).tolist()
+                self._activos = [True] * len(ids)
+                for i, termino in enumerate(terminos):
+                    inicio, fin = offsets[i], offsets[i + 1]
+                    self._postings[termino] = (posiciones[inicio:fin], frecuencias[inicio:fin])
+                self._arr_largos = largos.astype(np.float32)
+                self._arr_activos = np.ones(len(ids), dtype=bool)
+                self._arr_origenes = np.array(origenes, dtype=object)
+            logger.info(f"Índice BM25 cargado: {len(ids)} fragmentos")
+        except Exception as e:
+            logger.warning(f"Error al cargar el índice BM25: {e}")
@@ -34,6 +34,33 @@ def cargar_archivos_txt_desde_sharepoint(archivos_json):
                 print(f"❌ Error procesando {nombre}: {e}")
     return cache
 
+def extraer_lineas_docx(ruta, nombre=None):
+    """Retorna las líneas de texto de un .docx: párrafos no vacíos y luego filas de tablas."""
+    nombre = nombre or os.path.basename(ruta)
+    doc = Document(ruta)
+    texto = []
+    total_parrafos = len(doc.paragraphs)
+    total_tablas = len(doc.tables)
+
+    logger.info(f"Procesando {nombre}: {total_parrafos} párrafos, {total_tablas} tablas")
+
+    # Párrafos normales
+    for i, p in enumerate(doc.paragraphs, 1):
+        if p.text.strip():
+            texto.append(p.text.strip())
+            if i % 100 == 0:
+                logger.debug(f"Procesados {i}/{total_parrafos} párrafos en {nombre}")
+
+    # Contenido de tablas
+    for i, tabla in enumerate(doc.tables, 1):
+        for fila in tabla.rows:
+            fila_texto = " | ".join(cell.text.strip() for cell in fila.cells if cell.text.strip())
+            if fila_texto:
+                texto.append(fila_texto)
+        logger.debug(f"Procesada tabla {i}/{total_tablas} en {nombre}")
+
+    return texto
+
 def cargar_documentos_word_desde_sharepoint(archivos_json):
     documentos = {}
     total_archivos = len([a for a in archivos_json if a.get("name", "").endswith((".doc", ".docx"))])
@@ -60,27 +87,7 @@ def cargar_documentos_word_desde_sharepoint(archivos_json):
                     logger.debug(f"Archivo temporal creado: {tmp.name}")
                     
                     try:
-                        doc = Document(tmp.name)
-                        texto = []
-                        total_parrafos = len(doc.paragraphs)
-                        total_tablas = len(doc.tables)
-                        
-                        logger.info(f"Procesando {nombre}: {total_parrafos} párrafos, {total_tablas} tablas")
-
-                        # Párrafos normales
-                        for i, p in enumerate(doc.paragraphs, 1):
-                            if p.text.strip():
-                                texto.append(p.text.strip())
-                                if i % 100 == 0:
-                                    logger.debug(f"Procesados {i}/{total_parrafos} párrafos en {nombre}")
-
-                        # Contenido de tablas
-                        for i, tabla in enumerate(doc.tables, 1):
-                            for fila in tabla.rows:
-                                fila_texto = " | ".join(cell.text.strip() for cell in fila.cells if cell.text.strip())
-                                if fila_texto:
-                                    texto.append(fila_texto)
-                            logger.debug(f"Procesada tabla {i}/{total_tablas} en {nombre}")
+                        texto = extraer_lineas_docx(tmp.name, nombre)
 
                         contenido = "\n".join(texto)
                         if contenido.strip():
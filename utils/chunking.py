@@ -0,0 +1,111 @@
+import re
+from typing import Iterator, List, Tuple
+
+# Patrones compilados una sola vez; el fragmentador los aplica a cada párrafo y oración
+_PATRON_PARRAFOS = re.compile(r'\n\s*\n')
+_PATRON_ESPACIOS = re.compile(r'\s+')
+_PATRON_TITULO = re.compile(r'^[A-Z][A-Z\s]+$')
+_PATRON_ORACIONES = re.compile(r'(?<=[.!?])\s+')
+_PATRON_SUBORACIONES = re.compile(r'(?<=[,;:])\s+')
+_PATRON_LETRA = re.compile(r'[a-zA-ZáéíóúÁÉÍÓÚñÑ]')
+
+
+def generar_fragmentos(
+    texto: str,
+    chunk_size: int = 10,
+    chunk_overlap: int = 3,
+    min_chunk_words: int = 10,
+    max_chunk_words: int = 300
+) -> Iterator[str]:
+    """
+    Divide el texto en fragmentos por párrafos y oraciones, manteniendo los títulos
+    con el párrafo siguiente y un solapamiento de `chunk_overlap` oraciones. Los
+    fragmentos se producen a medida que se completan, ya limpios y filtrados por
+    longitud. El número de palabras de cada oración se cuenta una sola vez.
+    """
+    if not texto or not isinstance(texto, str):
+        return
+
+    # Oraciones del fragmento en curso junto con su número de palabras
+    actual: List[Tuple[str, int]] = []
+    largo_actual = 0
+
+    def cerrar(partes: List[Tuple[str, int]]):
+        palabras = sum(n for _, n in partes)
+        fragmento = " ".join(s for s, _ in partes)
+        # Verificar longitud y contenido significativo
+        if min_chunk_words <= palabras <= max_chunk_words and _PATRON_LETRA.search(fragmento):
+            return fragmento
+        return None
+
+    for parrafo in _PATRON_PARRAFOS.split(texto):
+        parrafo = _PATRON_ESPACIOS.sub(' ', parrafo).strip()
+        if not parrafo:
+            continue
+
+        oraciones = [(s, len(s.split())) for s in _PATRON_ORACIONES.split(parrafo)]
+        # Un título se mantiene junto con la oración siguiente
+        es_titulo = bool(_PATRON_TITULO.match(parrafo)) or sum(n for _, n in oraciones) <= 5
+        if es_titulo and oraciones:
+            titulo, palabras_titulo = oraciones.pop(0)
+            if oraciones:
+                oracion, palabras = oraciones.pop(0)
+                actual.append((f"{titulo} {oracion}", palabras_titulo + palabras))
+                largo_actual += palabras_titulo + palabras
+            else:
+                actual.append((titulo, palabras_titulo))
+                largo_actual += palabras_titulo
+
+        for oracion, palabras in oraciones:
+            if not palabras:
+                continue
+
+            # Una oración muy larga se divide en suboraciones
+            if palabras > max_chunk_words:
+                for sub in _PATRON_SUBORACIONES.split(oracion):
+                    sub = sub.strip()
+                    palabras_sub = len(sub.split())
+                    if palabras_sub < min_chunk_words:
+                        continue
+                    if not actual:
+                        fragmento = cerrar([(sub, palabras_sub)])
+                        if fragmento:
+                            yield fragmento
+                    elif largo_actual + palabras_sub <= max_chunk_words:
+                        actual.append((sub, palabras_sub))
+                        largo_actual += palabras_sub
+                    else:
+                        fragmento = cerrar(actual)
+                        if fragmento:
+                            yield fragmento
+                        actual = [(sub, palabras_sub)]
+                        largo_actual = palabras_sub
+                continue
+
+            if largo_actual + palabras > max_chunk_words:
+                if actual:
+                    fragmento = cerrar(actual)
+                    if fragmento:
+                        yield fragmento
+                actual = [(oracion, palabras)]
+                largo_actual = palabras
+            else:
+                actual.append((oracion, palabras))
+                largo_actual += palabras
+
+            if len(actual) >= chunk_size:
+                fragmento = cerrar(actual)
+                if fragmento:
+                    yield fragmento
+                actual = actual[-chunk_overlap:] if chunk_overlap > 0 else []
+                largo_actual = sum(n for _, n in actual)
+
+    if actual:
+        fragmento = cerrar(actual)
+        if fragmento:
+            yield fragmento
+
+
+def fragmentar_documento(texto: str, parametros: dict) -> List[str]:
+    """Fragmenta un documento completo; punto de entrada para los procesos del pool."""
+    return list(generar_fragmentos(texto, **parametros))
@@ -1,19 +1,34 @@
 from sentence_transformers import SentenceTransformer
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence
 import chromadb
 from chromadb.config import Settings
 import uuid
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 import numpy as np
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import re
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
 from datetime import datetime
-import pickle
 import os
 import json
+import hashlib
+import multiprocessing
+import shutil
+import threading
+from collections import OrderedDict
+
+from utils.bm25_index import BM25Index
+from utils.chunking import fragmentar_documento, generar_fragmentos
+from utils.embedding_store import EmbeddingStore
+from utils.fragment_store import FragmentTokenStore
+from utils.near_duplicates import DetectorDuplicados
+from utils.onnx_embedder import BACKENDS_EMBEDDINGS, EmbedderONNX
+from utils.pca_projection import ProyeccionPCA
+from utils.training_dataset import RespuestasExactas, leer_pares_qa, separar_par_qa, texto_par_qa
+from utils.vector_store import FaissVectorStore, VectorStore
 
 # Configurar logging
 logging.basicConfig(
@@ -22,6 +37,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Documentos institucionales en los que se busca por defecto
+ORIGENES_INSTITUCIONALES = [
+    "REGLAMENTO INTERNO DE TRABAJO - MODIFICACIÓN V2.docx",
+    "Procedimiento Liquidación de nómina.docx"
+]
+
+# Partición que recibe los orígenes sin partición propia
+PARTICION_GENERAL = "otros"
+# Separador de la lista de orígenes de un fragmento canónico en su metadata
+SEPARADOR_ORIGENES = " | "
+# Fragmentos con los que se ajusta la proyección PCA de una versión
+MUESTRA_MAXIMA_PCA = 20_000
+
 @dataclass
 class IndexConfig:
     """Configuración mejorada para el indexador de documentos."""
@@ -31,269 +59,792 @@ class IndexConfig:
     model_name: str = "hiiamsid/sentence_similarity_spanish_es"  # Modelo específico para español
     collection_name: str = "documentos_institucionales"
     cache_dir: str = ".embedding_cache"
-    compression_threshold: int = 1000
     max_workers: int = 4
-    hybrid_search_weight: float = 0.7
+    hybrid_search_weight: float = 0.7  # Peso del ranking denso frente a BM25 en la fusión RRF
+    rrf_k: int = 60  # Constante de reciprocal-rank fusion
+    vector_backend: str = "chroma"  # "chroma" o "faiss"
+    faiss_index_type: str = "hnsw"  # "flat", "hnsw" o "ivfpq"
+    # Compresión de embeddings: PCA ajustado sobre el corpus de cada versión del índice
+    # (None: sin proyección) y cuantización escalar "float16"/"int8" (solo backend faiss)
+    pca_dimension: Optional[int] = None
+    embedding_quantization: str = "float32"
     chunk_overlap: int = 3  # Aumentado para mejor contexto
     min_similarity_threshold: float = 0.55  # Reducido para más flexibilidad
     max_chunk_words: int = 300  # Aumentado para mantener más contexto
     context_window: int = 8  # Aumentado para mejor contexto
-    onnx_providers: List[str] = None  # Nuevo campo para providers de ONNX
+    # Procesos para fragmentar varios documentos en paralelo (1: en el proceso actual)
+    chunk_workers: int = field(default_factory=lambda: min(4, os.cpu_count() or 1))
+    # Inferencia del modelo de embeddings: "torch" (SentenceTransformer), "onnx" o
+    # "onnx_int8" (exportado una vez a cache_dir/onnx y cuantizado dinámicamente)
+    embedding_backend: str = "torch"
+    onnx_providers: List[str] = None  # Providers de ONNX Runtime (por defecto solo CPU)
     training_data_weight: float = 0.8  # Peso para resultados del dataset de entrenamiento
     include_training_data: bool = True  # Incluir dataset de entrenamiento en búsquedas
+    # Dataset de entrenamiento (JSONL, un {"question", "answer"} por línea) de cada reconstrucción
+    training_dataset_path: Optional[str] = None
+    qa_tokenizer_name: Optional[str] = None  # Tokenizer del modelo QA para pre-tokenizar fragmentos
+    embedding_cache_max_entries: int = 100_000  # Presupuesto del cache de embeddings (LRU)
+    query_cache_size: int = 1024  # Embeddings de preguntas recientes en memoria
+    # Orígenes a los que se restringe la búsqueda por defecto (None: toda la colección)
+    origenes_busqueda: Optional[List[str]] = field(default_factory=lambda: list(ORIGENES_INSTITUCIONALES))
+    # Sub-índice propio por fuente; los orígenes no listados van a PARTICION_GENERAL
+    particiones: Dict[str, List[str]] = field(default_factory=lambda: {
+        "reglamento": [ORIGENES_INSTITUCIONALES[0]],
+        "procedimiento": [ORIGENES_INSTITUCIONALES[1]],
+        "dataset": ["dataset_entrenamiento"],
+    })
+    # Particiones consultadas según la categoría de la pregunta
+    rutas_categoria: Dict[str, List[str]] = field(default_factory=lambda: {
+        "document_qa": ["reglamento", "procedimiento", "dataset"],
+        "general_info": ["reglamento", "procedimiento", "dataset"],
+    })
+    k_por_particion: int = 2  # Candidatos pedidos a cada partición, en múltiplos de top_k
+    # Fragmentos casi duplicados (Jaccard estimado con MinHash/LSH) se indexan una sola
+    # vez, con la lista de sus orígenes
+    deduplicar_fragmentos: bool = True
+    umbral_duplicados: float = 0.85
 
     def __post_init__(self):
-        # Configurar ONNX Runtime para usar solo CPU
-        os.environ["ORT_TENSORRT_ENABLED"] = "0"
-        os.environ["ORT_CUDA_ENABLED"] = "0"
-        os.environ["ORT_CPU_ENABLED"] = "1"
-        os.environ["ORT_PROVIDERS"] = "CPUExecutionProvider"
-        os.environ["ORT_DISABLE_ALL"] = "1"
-        self.onnx_providers = ["CPUExecutionProvider"]
+        if self.embedding_backend not in BACKENDS_EMBEDDINGS:
+            raise ValueError(f"embedding_backend debe ser uno de {BACKENDS_EMBEDDINGS}: {self.embedding_backend}")
+        if self.onnx_providers is None:
+            self.onnx_providers = ["CPUExecutionProvider"]
+
+@dataclass
+class Particion:
+    """Sub-índice de una versión: colección vectorial y BM25 de los fragmentos de unas fuentes."""
+    nombre: str  # Nombre de la colección
+    coleccion: object
+    bm25: BM25Index
+
+
+@dataclass
+class VersionIndice:
+    """Una versión del índice, con sus particiones y la huella de lo indexado."""
+    nombre: str
+    numero: int
+    particiones: Dict[str, Particion]
+    huellas: Dict[str, str] = field(default_factory=dict)
+    generacion: str = "vacio"
+    con_dataset: bool = False
+    fragmentos: int = 0  # Fragmentos escritos mientras se construye
+    proyeccion: Optional[ProyeccionPCA] = None  # PCA de documentos y consultas de esta versión
+    respuestas: RespuestasExactas = field(default_factory=RespuestasExactas)  # Preguntas exactas del dataset
+    # Origen -> orígenes cuyos fragmentos canónicos también le pertenecen (deduplicación)
+    compartidos: Dict[str, List[str]] = field(default_factory=dict)
+
+    def conteo(self) -> int:
+        return sum(p.coleccion.count() for p in self.particiones.values())
+
+
+def _origenes_fragmento(metadata: Dict) -> List[str]:
+    """Orígenes de un fragmento: su lista `origenes` si es un canónico compartido, o su `origen`."""
+    if metadata.get("origenes"):
+        return metadata["origenes"].split(SEPARADOR_ORIGENES)
+    return [metadata.get("origen", "")]
+
 
 class DocumentIndexer:
-    def __init__(self, config: Optional[IndexConfig] = None):
-        """Inicializa el indexador de documentos con configuración mejorada."""
+    def __init__(self, config: Optional[IndexConfig] = None, modelo_embeddings: Optional[SentenceTransformer] = None):
+        """
+        Inicializa el indexador de documentos con configuración mejorada. Se puede
+        pasar el modelo de embeddings de otro indexador para no cargarlo dos veces.
+        """
         self.config = config or IndexConfig()
-        self.embedding_cache = {}
+        self.embedding_cache: Optional[EmbeddingStore] = None
         self._setup_directories()
         self.indexacion_completa = False
-        self.training_data_indexed = False
+        self._fragmentos_tokenizados: Optional[FragmentTokenStore] = None
+        # Un solo hilo para el modelo: torch ya paraleliza cada lote internamente
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embeddings")
+        # Pool de fragmentación: se crea en la primera indexación y vive lo que el indexador
+        self._pool_fragmentacion: Optional[ProcessPoolExecutor] = None
+        self._futuros_fragmentacion: set = set()  # Enviados al pool y aún sin terminar
+        self._lock_pool = threading.Lock()
+        self._consultas_recientes: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock_consultas = threading.Lock()
         
         # Inicializar el modelo de embeddings con cache
         try:
-            self.modelo_embeddings = SentenceTransformer(
-                self.config.model_name,
-                device="cpu",
-                cache_folder=self.config.cache_dir
-            )
+            self.modelo_embeddings = modelo_embeddings or self._cargar_modelo_embeddings()
             self._load_embedding_cache()
         except Exception as e:
             logger.error(f"Error al cargar el modelo de embeddings: {e}")
             raise
 
-        # Crear cliente Chroma con persistencia y optimizaciones
+        # Las consultas resuelven la versión activa a través de un alias persistido;
+        # las reconstrucciones se escriben en una versión nueva y se publican al final
+        self.client = None
+        self._ruta_alias = Path(self.config.cache_dir) / f"alias_{self.config.collection_name}.json"
+        self._lock_versiones = threading.Lock()
+        self._particion_por_origen = {
+            origen: particion
+            for particion, origenes in self.config.particiones.items()
+            for origen in origenes
+        }
+        alias = self._leer_alias()
+        self._version_activa = self._abrir_version(alias["activa"], int(alias["version"]))
+        # La huella de los datos se restaura: una generación nueva invalidaría el caché de respuestas
+        self._version_activa.huellas = alias.get("huellas", {})
+        self._version_activa.generacion = alias.get("generacion", "vacio")
+        self._version_activa.con_dataset = alias.get("con_dataset", False)
+        self._version_nueva: Optional[VersionIndice] = None
+        for particion in self._version_activa.particiones.values():
+            if len(particion.bm25) == 0 and particion.coleccion.count() > 0:
+                self._reconstruir_bm25(particion)
+        self._eliminar_en_segundo_plano(self._colecciones_huerfanas(), self._versiones_huerfanas())
+        if self.config.embedding_quantization != "float32" and self.config.vector_backend != "faiss":
+            logger.warning("La cuantización de embeddings solo aplica al backend faiss; Chroma guarda float32")
+        # Las particiones de una consulta se buscan en paralelo
+        self._executor_particiones = ThreadPoolExecutor(
+            max_workers=len(self._version_activa.particiones), thread_name_prefix="particiones"
+        )
+
+    # --- Versiones de la colección ---
+
+    @property
+    def generacion_indice(self) -> str:
+        """Huella de los datos de la versión activa; cambia cada vez que cambian los documentos."""
+        return self._version_activa.generacion
+
+    @property
+    def training_data_indexed(self) -> bool:
+        return self._version_activa.con_dataset
+
+    def _nombre_version(self, numero: int) -> str:
+        # La versión 0 es la colección sin sufijo, anterior a las versiones
+        return self.config.collection_name if numero == 0 else f"{self.config.collection_name}__v{numero}"
+
+    def _leer_alias(self) -> Dict:
+        """Versión activa y la huella de sus datos (generación, documentos y dataset indexados)."""
+        if self._ruta_alias.exists():
+            try:
+                alias = json.loads(self._ruta_alias.read_text(encoding="utf-8"))
+                return {**alias, "activa": alias["activa"], "version": int(alias["version"])}
+            except Exception as e:
+                logger.warning(f"Alias de colección ilegible, se usa la colección base: {e}")
+        return {"activa": self.config.collection_name, "version": 0}
+
+    def _escribir_alias(self, version: VersionIndice):
+        temporal = self._ruta_alias.with_suffix(".tmp")
+        temporal.write_text(json.dumps({
+            "activa": version.nombre,
+            "version": version.numero,
+            "generacion": version.generacion,
+            "huellas": version.huellas,
+            "con_dataset": version.con_dataset
+        }, ensure_ascii=False), encoding="utf-8")
+        os.replace(temporal, self._ruta_alias)
+
+    def _ruta_bm25(self, nombre: str) -> Path:
+        return Path(self.config.cache_dir) / f"bm25_{nombre}.npz"
+
+    def _ruta_proyeccion(self, nombre_version: str) -> Path:
+        return Path(self.config.cache_dir) / f"pca_{nombre_version}.npz"
+
+    def _ruta_respuestas(self, nombre_version: str) -> Path:
+        return Path(self.config.cache_dir) / f"qa_{nombre_version}.json"
+
+    def _ruta_compartidos(self, nombre_version: str) -> Path:
+        return Path(self.config.cache_dir) / f"origenes_{nombre_version}.json"
+
+    def _cargar_compartidos(self, nombre_version: str) -> Dict[str, List[str]]:
+        ruta = self._ruta_compartidos(nombre_version)
+        if not ruta.exists():
+            return {}
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Orígenes compartidos ilegibles en {ruta}: {e}")
+            return {}
+
+    def _ruta_faiss(self, nombre: str) -> Path:
+        return Path.cwd() / ".faiss" / nombre
+
+    def _abrir_version(self, nombre: str, numero: int) -> VersionIndice:
+        particiones = {}
+        for particion in [*self.config.particiones, PARTICION_GENERAL]:
+            nombre_coleccion = f"{nombre}__{particion}"
+            if self.config.vector_backend == "faiss":
+                coleccion = FaissVectorStore(
+                    str(self._ruta_faiss(nombre_coleccion)),
+                    tipo=self.config.faiss_index_type,
+                    cuantizacion=self.config.embedding_quantization
+                )
+                logger.info(f"Colección '{nombre_coleccion}' inicializada en FAISS ({self.config.faiss_index_type})")
+            else:
+                coleccion = self._inicializar_chroma(nombre_coleccion)
+            particiones[particion] = Particion(
+                nombre_coleccion, coleccion, BM25Index(str(self._ruta_bm25(nombre_coleccion)))
+            )
+        return VersionIndice(
+            nombre, numero, particiones,
+            proyeccion=ProyeccionPCA.cargar(str(self._ruta_proyeccion(nombre))),
+            respuestas=RespuestasExactas.cargar(str(self._ruta_respuestas(nombre))),
+            compartidos=self._cargar_compartidos(nombre)
+        )
+
+    def _particion_de(self, origen: str) -> str:
+        return self._particion_por_origen.get(origen, PARTICION_GENERAL)
+
+    @staticmethod
+    def _colecciones(version: VersionIndice) -> List[str]:
+        return [p.nombre for p in version.particiones.values()]
+
+    def total_fragmentos(self) -> int:
+        """Fragmentos en la versión activa, sumando todas sus particiones."""
+        return self._version_activa.conteo()
+
+    def _inicializar_chroma(self, nombre: str):
+        """Crea (una sola vez) el cliente Chroma con persistencia y abre la colección."""
         persist_path = Path.cwd() / ".chroma"
         try:
-            self.client = chromadb.Client(Settings(
-                persist_directory=str(persist_path),
-                anonymized_telemetry=False,
-                allow_reset=True,
-                is_persistent=True
-            ))
-            self.coleccion = self.client.get_or_create_collection(
-                self.config.collection_name,
+            if self.client is None:
+                self.client = chromadb.Client(Settings(
+                    persist_directory=str(persist_path),
+                    anonymized_telemetry=False,
+                    allow_reset=True,
+                    is_persistent=True
+                ))
+            # Sin función de embeddings propia de Chroma: documentos y consultas se
+            # codifican siempre con el modelo del indexador
+            coleccion = self.client.get_or_create_collection(
+                nombre,
                 metadata={
                     "hnsw:space": "cosine",
                     "hnsw:construction_ef": 200,
                     "hnsw:search_ef": 100,
                     "hnsw:M": 64
-                }
+                },
+                embedding_function=None
             )
-            logger.info(f"Colección '{self.config.collection_name}' inicializada correctamente")
+            logger.info(f"Colección '{nombre}' inicializada correctamente")
+            return coleccion
         except Exception as e:
             logger.error(f"Error al inicializar ChromaDB: {e}")
             raise
 
+    def _colecciones_huerfanas(self) -> List[str]:
+        """
+        Colecciones de este índice que no son particiones de la versión activa:
+        reconstrucciones interrumpidas y la colección única anterior a las particiones.
+        Esta última solo sobra cuando ya hay una versión publicada que la reemplace.
+        """
+        base = self.config.collection_name
+        if self.config.vector_backend == "faiss":
+            directorio = self._ruta_faiss(base).parent
+            nombres = [d.name for d in directorio.iterdir()] if directorio.is_dir() else []
+        else:
+            nombres = [getattr(c, "name", c) for c in self.client.list_collections()]
+        activas = set(self._colecciones(self._version_activa))
+        return [
+            n for n in nombres
+            if ((n == base and self._version_activa.numero > 0) or n.startswith(f"{base}__")) and n not in activas
+        ]
+
+    def _versiones_huerfanas(self) -> List[str]:
+        """Versiones con proyección PCA, respuestas exactas u orígenes compartidos guardados que no son la activa."""
+        base = self.config.collection_name
+        versiones = set()
+        for prefijo, extension in (("pca_", "npz"), ("qa_", "json"), ("origenes_", "json")):
+            for ruta in Path(self.config.cache_dir).glob(f"{prefijo}{base}*.{extension}"):
+                version = ruta.stem[len(prefijo):]
+                if version == base or version.startswith(f"{base}__"):
+                    versiones.add(version)
+        versiones.discard(self._version_activa.nombre)
+        return sorted(versiones)
+
+    def _eliminar_en_segundo_plano(self, nombres: List[str], versiones: Sequence[str] = ()):
+        """
+        Elimina colecciones retiradas (y la proyección y las respuestas exactas de sus
+        versiones) sin bloquear las consultas ni la publicación.
+        """
+        if not nombres and not versiones:
+            return
+
+        def eliminar():
+            for version in versiones:
+                self._ruta_proyeccion(version).unlink(missing_ok=True)
+                self._ruta_respuestas(version).unlink(missing_ok=True)
+                self._ruta_compartidos(version).unlink(missing_ok=True)
+            for nombre in nombres:
+                try:
+                    if self.config.vector_backend == "faiss":
+                        shutil.rmtree(self._ruta_faiss(nombre), ignore_errors=True)
+                    else:
+                        self.client.delete_collection(nombre)
+                    self._ruta_bm25(nombre).unlink(missing_ok=True)
+                    logger.info(f"Colección retirada eliminada: {nombre}")
+                except Exception as e:
+                    logger.warning(f"No se pudo eliminar la colección {nombre}: {e}")
+
+        threading.Thread(target=eliminar, name="eliminar_versiones", daemon=True).start()
+
+    def _version_escritura(self) -> VersionIndice:
+        """Versión en la que se escribe: la reconstrucción en curso o, si no hay, la activa."""
+        return self._version_nueva or self._version_activa
+
+    def reiniciar_indexacion(self):
+        """
+        Inicia una reconstrucción en una colección nueva y vacía, en tiempo constante.
+        La versión activa no se toca: las consultas la siguen usando hasta que
+        `publicar_reconstruccion` cambia el alias.
+        """
+        with self._lock_versiones:
+            descartada = self._version_nueva
+            numero = max(self._version_activa.numero, descartada.numero if descartada else 0) + 1
+            nombre = self._nombre_version(numero)
+            for particion in [*self.config.particiones, PARTICION_GENERAL]:
+                self._ruta_bm25(f"{nombre}__{particion}").unlink(missing_ok=True)
+            self._ruta_proyeccion(nombre).unlink(missing_ok=True)
+            self._ruta_respuestas(nombre).unlink(missing_ok=True)
+            self._ruta_compartidos(nombre).unlink(missing_ok=True)
+            self._version_nueva = self._abrir_version(nombre, numero)
+        if descartada is not None:
+            logger.warning(f"Se descarta la reconstrucción sin publicar {descartada.nombre}")
+            self._eliminar_en_segundo_plano(self._colecciones(descartada), [descartada.nombre])
+        logger.info(f"Reconstrucción iniciada en la colección '{nombre}'")
+
+    def publicar_reconstruccion(self) -> bool:
+        """
+        Valida la reconstrucción en curso (sus particiones tienen todos los fragmentos
+        escritos y no están vacías), cambia el alias a la versión nueva y elimina la
+        anterior en segundo plano. Si la validación falla, la versión nueva se
+        descarta y la activa se conserva. Retorna si se publicó.
+        """
+        with self._lock_versiones:
+            nueva = self._version_nueva
+            if nueva is None:
+                logger.warning("No hay una reconstrucción en curso para publicar")
+                return False
+            self._version_nueva = None
+            total = nueva.conteo()
+            if nueva.fragmentos == 0 or total != nueva.fragmentos:
+                logger.error(
+                    f"Reconstrucción inválida en '{nueva.nombre}': {total} fragmentos en las colecciones, "
+                    f"{nueva.fragmentos} escritos; se conserva '{self._version_activa.nombre}'"
+                )
+                self._eliminar_en_segundo_plano(self._colecciones(nueva), [nueva.nombre])
+                return False
+
+            self._guardar_version(nueva)
+            self._escribir_alias(nueva)
+            anterior, self._version_activa = self._version_activa, nueva
+            self.indexacion_completa = True
+            # Con la versión nueva publicada ya sobran la anterior y la colección única heredada
+            retiradas = self._colecciones_huerfanas()
+        self._eliminar_en_segundo_plano(retiradas, [anterior.nombre])
+        logger.info(f"Publicada la colección '{nueva.nombre}' ({total} fragmentos), retirada '{anterior.nombre}'")
+        return True
+
+    async def reconstruir_indice(self, documentos: Dict[str, str], dataset_path: Optional[str] = None) -> bool:
+        """
+        Reconstruye el índice completo en una versión nueva (documentos y, si se
+        indica o está configurado, dataset de entrenamiento) y la publica solo si
+        quedó completa.
+        """
+        dataset_path = dataset_path or self.config.training_dataset_path
+        self.reiniciar_indexacion()
+        await self.indexar_documentos(documentos)
+        if dataset_path:
+            await self.indexar_dataset_entrenamiento(dataset_path)
+        return self.publicar_reconstruccion()
+
+    def _cargar_modelo_embeddings(self):
+        """
+        Carga el modelo de embeddings según `embedding_backend`. Si el backend ONNX no
+        está disponible (onnxruntime sin instalar o exportación fallida) se usa torch.
+        """
+        if self.config.embedding_backend != "torch":
+            directorio = Path(self.config.cache_dir) / "onnx" / self.config.model_name.replace("/", "__")
+            try:
+                return EmbedderONNX.cargar_o_exportar(
+                    self.config.model_name,
+                    str(directorio),
+                    cuantizado=self.config.embedding_backend == "onnx_int8",
+                    providers=self.config.onnx_providers,
+                    cache_folder=self.config.cache_dir
+                )
+            except Exception as e:
+                logger.warning(f"No se pudo usar el backend {self.config.embedding_backend}, se usa torch: {e}")
+                self.config.embedding_backend = "torch"
+        return SentenceTransformer(
+            self.config.model_name,
+            device="cpu",
+            cache_folder=self.config.cache_dir
+        )
+
     def _setup_directories(self):
         """Configura los directorios necesarios."""
         os.makedirs(self.config.cache_dir, exist_ok=True)
 
+    def _id_modelo_embeddings(self) -> str:
+        # Los embeddings de cada backend se guardan por separado: los de ONNX int8 no
+        # son idénticos a los de torch. El modelo puede venir de otro indexador.
+        backend = getattr(self.modelo_embeddings, "backend", "torch")
+        return self.config.model_name if backend == "torch" else f"{self.config.model_name}@{backend}"
+
     def _load_embedding_cache(self):
-        """Carga el cache de embeddings desde disco."""
-        cache_file = Path(self.config.cache_dir) / "embedding_cache.pkl"
-        if cache_file.exists():
+        """Abre el cache de embeddings en disco (memoria mapeada, sin deserializarlo)."""
+        self.embedding_cache = EmbeddingStore(
+            str(Path(self.config.cache_dir) / "embeddings"),
+            modelo_id=self._id_modelo_embeddings(),
+            dimension=self.modelo_embeddings.get_sentence_embedding_dimension(),
+            capacidad=self.config.embedding_cache_max_entries
+        )
+
+    def _actualizar_generacion(self, nombre: str, contenido: str):
+        """Registra la huella de un documento indexado y recalcula la generación de su versión."""
+        version = self._version_escritura()
+        version.huellas[nombre] = hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+        self._recalcular_generacion(version)
+
+    @staticmethod
+    def _recalcular_generacion(version: VersionIndice):
+        resumen = hashlib.sha1()
+        for clave in sorted(version.huellas):
+            resumen.update(f"{clave}:{version.huellas[clave]}\n".encode("utf-8"))
+        version.generacion = resumen.hexdigest()[:16]
+
+    def _reconstruir_bm25(self, particion: Particion):
+        """Construye el índice BM25 de una partición a partir de los fragmentos de su colección."""
+        existentes = particion.coleccion.get(include=["documents", "metadatas"])
+        particion.bm25.agregar(
+            existentes["ids"],
+            existentes["documents"],
+            [m.get("origen", "") for m in existentes["metadatas"]]
+        )
+        particion.bm25.guardar()
+        logger.info(f"Índice BM25 de '{particion.nombre}' reconstruido: {len(particion.bm25)} fragmentos")
+
+    def _guardar_version(self, version: VersionIndice):
+        for particion in version.particiones.values():
+            if isinstance(particion.coleccion, VectorStore):
+                particion.coleccion.guardar()
+            particion.bm25.guardar()
+        ruta = self._ruta_compartidos(version.nombre)
+        if version.compartidos:
+            temporal = ruta.with_suffix(".tmp")
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(version.compartidos, f, ensure_ascii=False)
+            os.replace(temporal, ruta)
+        else:
+            ruta.unlink(missing_ok=True)
+
+    def guardar_indices(self):
+        """
+        Persiste el almacén vectorial (si no se persiste solo), los índices auxiliares y
+        la generación de la versión activa.
+        """
+        for version in filter(None, (self._version_activa, self._version_nueva)):
+            self._guardar_version(version)
+        with self._lock_versiones:
+            self._escribir_alias(self._version_activa)
+        if self._fragmentos_tokenizados is not None:
+            self._fragmentos_tokenizados.guardar()
+
+    def eliminar_origen(self, origen: str):
+        """
+        Elimina de la colección y del índice BM25 todos los fragmentos de un origen.
+        Los fragmentos canónicos que comparte con otros documentos no se pierden: pasan
+        al siguiente origen de su lista, y el origen sale de las listas de los demás.
+        """
+        for version in filter(None, (self._version_activa, self._version_nueva)):
+            particion = version.particiones[self._particion_de(origen)]
+            propietarios = [origen, *version.compartidos.pop(origen, [])]
+            existentes = particion.coleccion.get(
+                where={"origen": {"$in": propietarios}}, include=["documents", "metadatas"]
+            )
+            actualizados: Dict[str, Dict] = {}
+            movidos: Dict[str, Dict] = {}
+            for fragmento_id, metadata in zip(existentes["ids"], existentes["metadatas"]):
+                origenes = _origenes_fragmento(metadata)
+                if origen not in origenes or origenes == [origen]:
+                    continue
+                restantes = [o for o in origenes if o != origen]
+                nueva = {**metadata, "origen": restantes[0], "origenes": SEPARADOR_ORIGENES.join(restantes)}
+                (movidos if metadata["origen"] == origen else actualizados)[fragmento_id] = nueva
+                for otro in restantes[1:]:
+                    if restantes[0] not in version.compartidos.setdefault(otro, []):
+                        version.compartidos[otro].append(restantes[0])
+            if actualizados:
+                particion.coleccion.update(ids=list(actualizados), metadatas=list(actualizados.values()))
+            if movidos:
+                self._mover_fragmentos(particion, movidos)
+            for otro in list(version.compartidos):
+                version.compartidos[otro] = [o for o in version.compartidos[otro] if o != origen]
+                if not version.compartidos[otro]:
+                    del version.compartidos[otro]
+            particion.coleccion.delete(where={"origen": origen})
+            particion.bm25.eliminar_origen(origen)
+            version.fragmentos = version.conteo()
+            if version.huellas.pop(origen, None) is not None:
+                self._recalcular_generacion(version)
+
+    @staticmethod
+    def _mover_fragmentos(particion: Particion, metadatas: Dict[str, Dict]) -> None:
+        """
+        Vuelve a escribir fragmentos con el vector guardado y la metadata de su nuevo
+        origen, bajo un id de ese origen: si el origen anterior se vuelve a indexar,
+        sus ids no chocan con los de los fragmentos que cedió.
+        """
+        existentes = particion.coleccion.get(ids=list(metadatas), include=["documents", "embeddings"])
+        ids = [f"{metadatas[i]['origen']}_{i}" for i in existentes["ids"]]
+        nuevas = [metadatas[i] for i in existentes["ids"]]
+        particion.coleccion.add(
+            documents=existentes["documents"],
+            embeddings=np.asarray(existentes["embeddings"], dtype=np.float32),
+            metadatas=nuevas,
+            ids=ids
+        )
+        particion.bm25.agregar(ids, existentes["documents"], [m["origen"] for m in nuevas])
+
+    def _obtener_store_fragmentos(self) -> Optional[FragmentTokenStore]:
+        """Carga bajo demanda el tokenizer QA y el almacén de fragmentos tokenizados."""
+        if self._fragmentos_tokenizados is None and self.config.qa_tokenizer_name:
             try:
-                with open(cache_file, 'rb') as f:
-                    self.embedding_cache = pickle.load(f)
-                logger.info(f"Cache de embeddings cargado: {len(self.embedding_cache)} entradas")
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(self.config.qa_tokenizer_name, use_fast=True)
+                self._fragmentos_tokenizados = FragmentTokenStore(
+                    tokenizer,
+                    str(Path(self.config.cache_dir) / "fragmentos_tokenizados.npz")
+                )
             except Exception as e:
-                logger.warning(f"Error al cargar cache de embeddings: {e}")
+                logger.warning(f"No se pudo cargar el tokenizer QA para pre-tokenizar fragmentos: {e}")
+                self.config.qa_tokenizer_name = None
+        return self._fragmentos_tokenizados
 
-    def _save_embedding_cache(self):
-        """Guarda el cache de embeddings en disco."""
-        cache_file = Path(self.config.cache_dir) / "embedding_cache.pkl"
-        try:
-            with open(cache_file, 'wb') as f:
-                pickle.dump(self.embedding_cache, f)
-            logger.info(f"Cache de embeddings guardado: {len(self.embedding_cache)} entradas")
-        except Exception as e:
-            logger.warning(f"Error al guardar cache de embeddings: {e}")
+    def tokens_fragmento(self, fragmento_id: str, texto: str) -> Optional[List[int]]:
+        """
+        Retorna los ids de tokens QA del fragmento calculados al indexar, o None si no
+        hay tokenizer QA configurado.
+        """
+        store = self._obtener_store_fragmentos()
+        if store is None:
+            return None
+        return store.obtener(fragmento_id, texto)
 
     def _get_embedding(self, text: str) -> np.ndarray:
         """Obtiene el embedding de un texto con cache."""
-        if text in self.embedding_cache:
-            return self.embedding_cache[text]
-        
-        embedding = self.modelo_embeddings.encode(text, convert_to_numpy=True)
-        self.embedding_cache[text] = embedding
+        return self._calcular_embeddings([text])[0]
+
+    def _calcular_embeddings(self, textos: List[str]) -> List[np.ndarray]:
+        """
+        Calcula los embeddings de un lote con una sola llamada al modelo. Solo se
+        codifican los textos que no están en el cache, ordenados por longitud para
+        minimizar el padding dentro de cada sub-lote.
+        """
+        embeddings = self.embedding_cache.obtener_lote(textos)
+        faltantes = list(dict.fromkeys(t for t, e in zip(textos, embeddings) if e is None))
+        if faltantes:
+            faltantes.sort(key=len)
+            vectores = self.modelo_embeddings.encode(
+                faltantes,
+                batch_size=self.config.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            self.embedding_cache.guardar_lote(faltantes, vectores)
+            calculados = dict(zip(faltantes, vectores))
+            embeddings = [calculados[t] if e is None else e for t, e in zip(textos, embeddings)]
+        return embeddings
+
+    def calcular_embedding_consulta(self, pregunta: str) -> np.ndarray:
+        """
+        Calcula el embedding de una pregunta con el mismo modelo con el que se
+        indexaron los fragmentos. Las preguntas repetidas se sirven desde un LRU.
+        """
+        clave = pregunta.strip().lower()
+        with self._lock_consultas:
+            embedding = self._consultas_recientes.get(clave)
+            if embedding is not None:
+                self._consultas_recientes.move_to_end(clave)
+                return embedding
+
+        embedding = self.modelo_embeddings.encode(clave, convert_to_numpy=True)
+        with self._lock_consultas:
+            self._consultas_recientes[clave] = embedding
+            while len(self._consultas_recientes) > self.config.query_cache_size:
+                self._consultas_recientes.popitem(last=False)
         return embedding
 
+    def _parametros_fragmentacion(self) -> Dict[str, int]:
+        return {
+            "chunk_size": self.config.chunk_size,
+            "chunk_overlap": self.config.chunk_overlap,
+            "min_chunk_words": self.config.min_chunk_words,
+            "max_chunk_words": self.config.max_chunk_words,
+        }
+
     def _chunk_text(self, text: str) -> List[str]:
         """Divide el texto en fragmentos de manera más inteligente y contextual."""
         if not text or not isinstance(text, str):
             logger.warning("Texto inválido o vacío recibido en _chunk_text")
             return []
-            
-        # Dividir por párrafos primero
-        paragraphs = re.split(r'\n\s*\n', text)
-        chunks = []
-        current_chunk = []
-        current_length = 0
-        
-        for paragraph in paragraphs:
-            # Limpiar y normalizar el párrafo
-            paragraph = re.sub(r'\s+', ' ', paragraph).strip()
-            if not paragraph:
-                continue
-                
-            # Detectar si es un título o encabezado
-            is_heading = bool(re.match(r'^[A-Z][A-Z\s]+$', paragraph)) or len(paragraph.split()) <= 5
-            
-            # Dividir en oraciones para mejor contexto
-            sentences = re.split(r'(?<=[.!?])\s+', paragraph)
-            
-            # Si es un título, mantenerlo con el siguiente párrafo
-            if is_heading and sentences:
-                heading = sentences.pop(0)
-                if sentences:
-                    current_chunk.append(f"{heading} {sentences[0]}")
-                    current_length += len(heading.split()) + len(sentences[0].split())
-                    sentences.pop(0)
-                else:
-                    current_chunk.append(heading)
-                    current_length += len(heading.split())
-            
-            # Procesar cada oración
-            for sentence in sentences:
-                sentence = sentence.strip()
-                if not sentence:
-                    continue
-                    
-                words = len(sentence.split())
-                
-                # Si la oración es muy larga, dividirla en suboraciones
-                if words > self.config.max_chunk_words:
-                    sub_sentences = re.split(r'(?<=[,;:])\s+', sentence)
-                    for sub in sub_sentences:
-                        sub = sub.strip()
-                        if len(sub.split()) >= self.config.min_chunk_words:
-                            if not current_chunk:
-                                chunks.append(sub)
-                            else:
-                                if current_length + len(sub.split()) <= self.config.max_chunk_words:
-                                    current_chunk.append(sub)
-                                    current_length += len(sub.split())
-                                else:
-                                    chunks.append(" ".join(current_chunk))
-                                    current_chunk = [sub]
-                                    current_length = len(sub.split())
-                    continue
-                
-                # Si el chunk actual más la nueva oración excede el límite
-                if current_length + words > self.config.max_chunk_words:
-                    if current_chunk:
-                        chunks.append(" ".join(current_chunk))
-                    current_chunk = [sentence]
-                    current_length = words
-                else:
-                    current_chunk.append(sentence)
-                    current_length += words
-                
-                # Si alcanzamos el tamaño del chunk, guardarlo
-                if len(current_chunk) >= self.config.chunk_size:
-                    chunks.append(" ".join(current_chunk))
-                    # Mantener algunas oraciones para el siguiente chunk (overlap)
-                    overlap = current_chunk[-self.config.chunk_overlap:] if self.config.chunk_overlap > 0 else []
-                    current_chunk = overlap
-                    current_length = sum(len(s.split()) for s in overlap)
-        
-        # Agregar el último chunk si existe
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-        
-        # Filtrar y limpiar chunks
-        cleaned_chunks = []
-        for chunk in chunks:
-            # Limpiar espacios y caracteres especiales
-            chunk = re.sub(r'\s+', ' ', chunk).strip()
-            # Verificar longitud y contenido significativo
-            words = len(chunk.split())
-            if (self.config.min_chunk_words <= words <= self.config.max_chunk_words and 
-                len(re.findall(r'[a-zA-ZáéíóúÁÉÍÓÚñÑ]', chunk)) > 0):  # Asegurar que hay texto significativo
-                cleaned_chunks.append(chunk)
-        
-        logger.debug(f"Generados {len(cleaned_chunks)} chunks limpios")
-        return cleaned_chunks
+        fragmentos = list(generar_fragmentos(text, **self._parametros_fragmentacion()))
+        logger.debug(f"Generados {len(fragmentos)} chunks limpios")
+        return fragmentos
+
+    async def _lotes_fragmentos(self, contenido: str, futuro: Optional[Future] = None) -> AsyncIterator[List[str]]:
+        """
+        Produce los fragmentos de un documento en lotes de `batch_size`. Si el
+        documento se fragmentó en el pool de procesos se espera su resultado; si no,
+        el generador avanza en un hilo y el lote siguiente se prepara mientras se
+        procesan los embeddings del actual.
+        """
+        tamano = self.config.batch_size
+        if futuro is not None:
+            try:
+                fragmentos = await asyncio.wrap_future(futuro)
+            except Exception as e:
+                # Un proceso del pool murió: el documento se fragmenta en el proceso actual
+                logger.warning(f"Falló la fragmentación en el pool, se fragmenta en el proceso actual: {e}")
+            else:
+                for i in range(0, len(fragmentos), tamano):
+                    yield fragmentos[i:i + tamano]
+                return
+
+        loop = asyncio.get_running_loop()
+        generador = generar_fragmentos(contenido, **self._parametros_fragmentacion())
+        siguiente = loop.run_in_executor(None, lambda: list(islice(generador, tamano)))
+        while True:
+            lote = await siguiente
+            if not lote:
+                return
+            siguiente = loop.run_in_executor(None, lambda: list(islice(generador, tamano)))
+            yield lote
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """
+        Pool de procesos de fragmentación del indexador. Los procesos se lanzan con
+        spawn: un fork del proceso principal, con torch cargado y varios hilos
+        activos, puede quedar bloqueado. Solo importan `utils.chunking`.
+        """
+        with self._lock_pool:
+            if self._pool_fragmentacion is None:
+                self._pool_fragmentacion = ProcessPoolExecutor(
+                    max_workers=self.config.chunk_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool_fragmentacion
+
+    def _fragmentar_en_procesos(self, documentos: Dict[str, str]) -> Dict[str, Future]:
+        """
+        Envía cada documento al pool de procesos para fragmentarlos en paralelo.
+        Retorna los futuros por documento (vacío si se fragmenta en el proceso actual).
+        """
+        if min(self.config.chunk_workers, len(documentos)) <= 1:
+            return {}
+        parametros = self._parametros_fragmentacion()
+        for intento in range(2):
+            try:
+                pool = self._pool()
+                futuros = {}
+                for nombre, contenido in documentos.items():
+                    if contenido and isinstance(contenido, str):
+                        futuro = pool.submit(fragmentar_documento, contenido, parametros)
+                        self._futuros_fragmentacion.add(futuro)
+                        futuro.add_done_callback(self._futuros_fragmentacion.discard)
+                        futuros[nombre] = futuro
+                return futuros
+            except BrokenProcessPool as e:
+                # Un proceso del pool murió: se descarta el pool y se crea otro una vez
+                logger.warning(f"Pool de fragmentación roto, se reinicia: {e}")
+                self._cerrar_pool()
+            except Exception as e:
+                logger.warning(f"No se pudo usar el pool de fragmentación, se fragmenta en el proceso actual: {e}")
+                break
+        return {}
+
+    def _cerrar_pool(self) -> None:
+        """
+        Cancela los trabajos pendientes y detiene el pool de fragmentación sin esperar.
+        Los futuros se cancelan uno a uno: `shutdown(cancel_futures=...)` no existe en
+        Python 3.8.
+        """
+        with self._lock_pool:
+            for futuro in list(self._futuros_fragmentacion):
+                futuro.cancel()
+            self._futuros_fragmentacion.clear()
+            if self._pool_fragmentacion is not None:
+                self._pool_fragmentacion.shutdown(wait=False)
+                self._pool_fragmentacion = None
+
+    def cerrar(self) -> None:
+        """Detiene el pool de fragmentación y los executors del indexador."""
+        self._cerrar_pool()
+        self._executor_particiones.shutdown(wait=False)
+        self._executor.shutdown(wait=False)
 
     async def _process_batch_async(self, documents: List[str], metadatas: List[dict], ids: List[str]):
         """Procesa un lote de documentos de manera asíncrona."""
         try:
-            # Generar embeddings en paralelo
-            with ThreadPoolExecutor(max_workers=self.config.max_workers) as executor:
-                embeddings = list(executor.map(self._get_embedding, documents))
-            
-            # Comprimir embeddings si es necesario
-            if len(documents) > self.config.compression_threshold:
-                embeddings = [self._compress_embedding(emb) for emb in embeddings]
+            # Generar los embeddings del lote en una sola pasada, fuera del event loop
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(self._executor, self._calcular_embeddings, documents)
             
-            # Agregar a ChromaDB
-            self.coleccion.add(
-                documents=documents,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
-            )
+            # Agregar a la versión en construcción o, si no hay, a la activa, en la
+            # partición de la fuente de cada fragmento
+            version = self._version_escritura()
+            if version.proyeccion is not None:
+                embeddings = version.proyeccion.proyectar(np.stack(embeddings))
+            grupos: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(metadatas):
+                grupos.setdefault(self._particion_de(metadata.get("origen", "")), []).append(i)
+            for nombre_particion, posiciones in grupos.items():
+                particion = version.particiones[nombre_particion]
+                lote_ids = [ids[i] for i in posiciones]
+                lote_documentos = [documents[i] for i in posiciones]
+                lote_metadatas = [metadatas[i] for i in posiciones]
+                await loop.run_in_executor(self._executor, lambda: particion.coleccion.add(
+                    documents=lote_documentos,
+                    embeddings=[embeddings[i] for i in posiciones],
+                    metadatas=lote_metadatas,
+                    ids=lote_ids
+                ))
+                particion.bm25.agregar(lote_ids, lote_documentos, [m.get("origen", "") for m in lote_metadatas])
+            version.fragmentos += len(ids)
+
+            # Pre-tokenizar los fragmentos para la etapa de QA
+            store = self._obtener_store_fragmentos()
+            if store is not None:
+                store.agregar(ids, documents)
         except Exception as e:
             logger.error(f"Error al procesar lote asíncrono: {e}")
             raise
 
-    def _compress_embedding(self, embedding: np.ndarray) -> np.ndarray:
-        """Comprime el embedding usando PCA simple."""
-        # Implementación básica de compresión
-        return embedding.astype(np.float32)
-
-    def reiniciar_indexacion(self):
-        """Reinicia la indexación eliminando todos los documentos existentes."""
-        try:
-            logger.info("Iniciando reinicio de indexación...")
-            
-            # Obtener todos los documentos
-            resultados = self.coleccion.get()
-            if not resultados or not resultados['ids']:
-                logger.info("No hay documentos para eliminar")
-                return
-                
-            total_docs = len(resultados['ids'])
-            logger.info(f"Encontrados {total_docs} documentos para eliminar")
-            
-            # Eliminar documentos en lotes
-            batch_size = 100
-            for i in range(0, total_docs, batch_size):
-                batch_ids = resultados['ids'][i:i + batch_size]
-                try:
-                    self.coleccion.delete(ids=batch_ids)
-                    logger.info(f"Eliminados {len(batch_ids)} documentos (lote {i//batch_size + 1})")
-                except Exception as e:
-                    logger.error(f"Error eliminando lote {i//batch_size + 1}: {str(e)}")
-                    
-            # Limpiar caché de embeddings
-            self.embedding_cache.clear()
-            logger.info("Caché de embeddings limpiada")
-            
-            # Verificar que la colección está vacía
-            resultados = self.coleccion.get()
-            if not resultados or not resultados['ids']:
-                logger.info("Reinicio de indexación completado exitosamente")
-            else:
-                logger.warning(f"Quedaron {len(resultados['ids'])} documentos sin eliminar")
-                
-        except Exception as e:
-            logger.error(f"Error en reinicio de indexación: {str(e)}", exc_info=True)
-            raise
+    async def _preparar_proyeccion(self, textos: Callable[[], List[str]]) -> None:
+        """
+        Ajusta la proyección PCA de la versión de escritura antes de su primera
+        escritura, sobre los embeddings de `textos()` (que quedan en el cache y no se
+        recalculan al indexar). Una versión con fragmentos sin proyectar no se proyecta.
+        """
+        version = self._version_escritura()
+        if not self.config.pca_dimension or version.proyeccion is not None or version.conteo() > 0:
+            return
+        loop = asyncio.get_running_loop()
+        muestra = await loop.run_in_executor(None, textos)
+        if len(muestra) < 2 * self.config.pca_dimension:
+            logger.warning(
+                f"Solo {len(muestra)} fragmentos para ajustar PCA a {self.config.pca_dimension} dimensiones; "
+                f"'{version.nombre}' se indexa sin proyección"
+            )
+            return
+        if len(muestra) > MUESTRA_MAXIMA_PCA:
+            elegidos = np.random.default_rng(0).choice(len(muestra), MUESTRA_MAXIMA_PCA, replace=False)
+            muestra = [muestra[i] for i in sorted(elegidos)]
+        embeddings = await loop.run_in_executor(self._executor, self._calcular_embeddings, muestra)
+        version.proyeccion = ProyeccionPCA.ajustar(np.stack(embeddings), self.config.pca_dimension)
+        version.proyeccion.guardar(str(self._ruta_proyeccion(version.nombre)))
 
     async def indexar_documentos(self, documentos: Dict[str, str]) -> None:
-        """Indexa los documentos proporcionados usando embeddings."""
+        """
+        Indexa los documentos proporcionados usando embeddings. Con
+        `deduplicar_fragmentos`, los fragmentos casi duplicados se descartan antes de
+        calcular su embedding y el fragmento canónico guarda en `origenes` todos los
+        documentos que lo contienen.
+        """
         try:
             if not documentos:
                 logger.warning("No hay documentos para indexar")
@@ -302,342 +853,610 @@ class DocumentIndexer:
             logger.info(f"Iniciando indexación de {len(documentos)} documentos...")
             total_fragmentos = 0
             documentos_procesados = 0
-            
-            for nombre, contenido in documentos.items():
-                try:
-                    logger.info(f"Procesando documento: {nombre}")
-                    
-                    # Dividir en fragmentos
-                    fragmentos = self._chunk_text(contenido)
-                    if not fragmentos:
-                        logger.warning(f"No se generaron fragmentos para {nombre}")
-                        continue
-                        
-                    logger.info(f"Generados {len(fragmentos)} fragmentos para {nombre}")
-                    total_fragmentos += len(fragmentos)
-                    
-                    # Procesar fragmentos en lotes
-                    batch_size = self.config.batch_size
-                    for i in range(0, len(fragmentos), batch_size):
-                        batch = fragmentos[i:i + batch_size]
-                        try:
-                            # Generar embeddings para el lote
-                            embeddings = await self._process_batch_async(batch, [{
-                                "origen": nombre,
-                                "fecha_indexacion": datetime.now().isoformat(),
-                                "chunk_index": j,
-                                "total_chunks": len(fragmentos)
-                            } for j in range(i, min(i + batch_size, len(fragmentos)))], [f"{nombre}_{j+1}" for j in range(i, min(i + batch_size, len(fragmentos)))]
-                            )
-                            
-                            logger.debug(f"Indexado lote {i//batch_size + 1} de {nombre}: {len(batch)} fragmentos")
-                            
-                        except Exception as e:
-                            logger.error(f"Error procesando lote {i//batch_size + 1} de {nombre}: {str(e)}")
+            duplicados = 0
+
+            parametros = self._parametros_fragmentacion()
+            await self._preparar_proyeccion(lambda: [
+                fragmento
+                for contenido in documentos.values()
+                for fragmento in generar_fragmentos(contenido, **parametros)
+            ])
+
+            version = self._version_escritura()
+            # Solo una reconstrucción deduplica entre documentos: en la versión activa
+            # los documentos se reemplazan de a uno (`eliminar_origen`) y no pueden
+            # compartir fragmentos. Los documentos de búsqueda van primero para que
+            # el canónico quede con su origen. Solo se comparan documentos de la misma
+            # partición, para que el canónico quede donde el enrutamiento lo busca.
+            entre_documentos = version is not self._version_activa
+            prioridad = {origen: i for i, origen in enumerate(self.config.origenes_busqueda or [])}
+            documentos = dict(sorted(documentos.items(), key=lambda item: prioridad.get(item[0], len(prioridad))))
+            detectores: Dict[str, DetectorDuplicados] = {}
+            canonicos: Dict[str, Dict] = {}
+            origenes_extra: Dict[str, List[str]] = {}
+
+            # Los documentos se fragmentan en paralelo mientras se indexan los anteriores
+            futuros = self._fragmentar_en_procesos(documentos)
+            try:
+                for nombre, contenido in documentos.items():
+                    try:
+                        logger.info(f"Procesando documento: {nombre}")
+                        if not contenido or not isinstance(contenido, str):
+                            logger.warning(f"Texto inválido o vacío en {nombre}")
                             continue
-                            
-                    documentos_procesados += 1
-                    logger.info(f"Documento {nombre} indexado exitosamente")
-                    
-                except Exception as e:
-                    logger.error(f"Error procesando documento {nombre}: {str(e)}", exc_info=True)
-                    continue
-                    
+                        detector = None
+                        if self.config.deduplicar_fragmentos:
+                            particion_documento = self._particion_de(nombre)
+                            if particion_documento not in detectores or not entre_documentos:
+                                detectores[particion_documento] = DetectorDuplicados(umbral=self.config.umbral_duplicados)
+                            detector = detectores[particion_documento]
+
+                        # Los lotes se indexan a medida que el fragmentador los produce
+                        fragmentos_documento = 0
+                        numero_lote = 0
+                        async for batch in self._lotes_fragmentos(contenido, futuros.get(nombre)):
+                            inicio = fragmentos_documento
+                            fragmentos_documento += len(batch)
+                            numero_lote += 1
+                            textos, metadatas, ids = [], [], []
+                            for j, texto in enumerate(batch, start=inicio):
+                                fragmento_id = f"{nombre}_{j+1}"
+                                canonico = detector.canonico(texto, fragmento_id) if detector is not None else None
+                                if canonico is not None:
+                                    duplicados += 1
+                                    extra = origenes_extra.setdefault(canonico, [])
+                                    if nombre != canonicos[canonico]["origen"] and nombre not in extra:
+                                        extra.append(nombre)
+                                    continue
+                                metadata = {
+                                    "origen": nombre,
+                                    "fecha_indexacion": datetime.now().isoformat(),
+                                    "chunk_index": j
+                                }
+                                if detector is not None:
+                                    canonicos[fragmento_id] = metadata
+                                textos.append(texto)
+                                metadatas.append(metadata)
+                                ids.append(fragmento_id)
+                            if not textos:
+                                continue
+                            try:
+                                await self._process_batch_async(textos, metadatas, ids)
+
+                                logger.debug(f"Indexado lote {numero_lote} de {nombre}: {len(textos)} fragmentos")
+
+                            except Exception as e:
+                                logger.error(f"Error procesando lote {numero_lote} de {nombre}: {str(e)}")
+                                continue
+
+                        if not fragmentos_documento:
+                            logger.warning(f"No se generaron fragmentos para {nombre}")
+                            continue
+
+                        logger.info(f"Generados {fragmentos_documento} fragmentos para {nombre}")
+                        total_fragmentos += fragmentos_documento
+                        documentos_procesados += 1
+                        self._actualizar_generacion(nombre, contenido)
+                        logger.info(f"Documento {nombre} indexado exitosamente")
+
+                    except Exception as e:
+                        logger.error(f"Error procesando documento {nombre}: {str(e)}", exc_info=True)
+                        continue
+            finally:
+                # El pool sigue vivo para la próxima indexación: solo se descartan los pendientes
+                for futuro in futuros.values():
+                    futuro.cancel()
+
+            self._registrar_origenes_duplicados(version, canonicos, origenes_extra)
+
             # Verificar resultados
-            resultados = self.coleccion.get()
-            total_indexados = len(resultados['ids']) if resultados and resultados['ids'] else 0
+            total_indexados = version.conteo()
             
             logger.info(f"""
             Resumen de indexación:
             - Documentos procesados: {documentos_procesados}/{len(documentos)}
             - Fragmentos generados: {total_fragmentos}
+            - Duplicados descartados: {duplicados}
             - Fragmentos indexados: {total_indexados}
+            - Colección: {version.nombre}
+            - Generación del índice: {version.generacion}
             """)
+
+            self.guardar_indices()
             
-            self.indexacion_completa = True
+            if version is self._version_activa:
+                self.indexacion_completa = True
             
         except Exception as e:
             logger.error(f"Error en indexación: {str(e)}", exc_info=True)
             raise
 
+    def _registrar_origenes_duplicados(
+        self, version: VersionIndice, canonicos: Dict[str, Dict], origenes_extra: Dict[str, List[str]]
+    ) -> None:
+        """
+        Agrega a la metadata de cada fragmento canónico (ya escrito) la lista de los
+        documentos en los que apareció un casi duplicado suyo, y registra en la versión
+        qué orígenes guardan fragmentos de cada documento para que los filtros por
+        origen los encuentren.
+        """
+        por_particion: Dict[str, tuple] = {}
+        for fragmento_id, extra in origenes_extra.items():
+            if not extra:
+                continue
+            metadata = canonicos[fragmento_id]
+            metadata["origenes"] = SEPARADOR_ORIGENES.join([metadata["origen"], *extra])
+            for otro in extra:
+                if metadata["origen"] not in version.compartidos.setdefault(otro, []):
+                    version.compartidos[otro].append(metadata["origen"])
+            ids, metadatas = por_particion.setdefault(self._particion_de(metadata["origen"]), ([], []))
+            ids.append(fragmento_id)
+            metadatas.append(metadata)
+        for nombre_particion, (ids, metadatas) in por_particion.items():
+            try:
+                version.particiones[nombre_particion].coleccion.update(ids=ids, metadatas=metadatas)
+            except Exception as e:
+                logger.warning(f"No se pudieron registrar los orígenes de {len(ids)} fragmentos canónicos: {e}")
+
     def esta_indexacion_completa(self) -> bool:
         """Retorna si la indexación está completa."""
         return self.indexacion_completa
 
     async def indexar_dataset_entrenamiento(self, dataset_path: str) -> None:
-        """Indexa el dataset de entrenamiento como fuente adicional de conocimiento."""
+        """
+        Indexa el dataset de entrenamiento como fuente adicional de conocimiento. El
+        archivo se lee en streaming (JSONL, un par por línea) y se indexa por lotes;
+        las preguntas repetidas (misma pregunta normalizada) se descartan y las
+        demás alimentan el mapa de respuestas exactas de la versión.
+        """
         try:
             if not self.config.include_training_data:
                 logger.info("Indexación de dataset de entrenamiento desactivada en configuración")
                 return
 
             logger.info(f"Iniciando indexación del dataset de entrenamiento desde: {dataset_path}")
-            
-            # Cargar dataset
-            try:
-                with open(dataset_path, 'r', encoding='utf-8') as f:
-                    dataset = json.load(f)
-            except Exception as e:
-                logger.error(f"Error al cargar dataset de entrenamiento: {e}")
+            if not Path(dataset_path).exists():
+                logger.error(f"No existe el dataset de entrenamiento: {dataset_path}")
                 return
 
-            # Preparar documentos para indexación
-            documentos = []
-            metadatas = []
-            ids = []
-            
-            for i, (pregunta, respuesta) in enumerate(zip(dataset['question'], dataset['answer'])):
-                # Crear documento combinando pregunta y respuesta
-                doc = f"Pregunta: {pregunta}\nRespuesta: {respuesta}"
-                documentos.append(doc)
-                
-                # Metadata específica para dataset de entrenamiento
-                metadatas.append({
-                    "origen": "dataset_entrenamiento",
-                    "tipo": "qa_pair",
-                    "pregunta": pregunta,
-                    "respuesta": respuesta,
-                    "fecha_indexacion": datetime.now().isoformat(),
-                    "chunk_index": i
-                })
-                
-                ids.append(f"training_{i+1}")
+            await self._preparar_proyeccion(
+                lambda: [texto_par_qa(pregunta, respuesta) for pregunta, respuesta in leer_pares_qa(dataset_path)]
+            )
 
-            # Indexar en lotes
+            # El dataset se reemplaza completo: se retiran los pares de una indexación anterior
+            version = self._version_escritura()
+            particion = version.particiones[self._particion_de("dataset_entrenamiento")]
+            if particion.coleccion.count() > 0:
+                particion.coleccion.delete(where={"origen": "dataset_entrenamiento"})
+                particion.bm25.eliminar_origen("dataset_entrenamiento")
+                version.fragmentos = version.conteo()
+            respuestas = RespuestasExactas()
+            huella = hashlib.sha1()
+            fecha = datetime.now().isoformat()
             batch_size = self.config.batch_size
-            for i in range(0, len(documentos), batch_size):
-                batch_docs = documentos[i:i + batch_size]
-                batch_metadatas = metadatas[i:i + batch_size]
-                batch_ids = ids[i:i + batch_size]
-                
+            documentos, metadatas, ids = [], [], []
+            indexados = duplicados = lotes = 0
+
+            async def procesar_lote():
+                nonlocal lotes
+                lotes += 1
                 try:
-                    await self._process_batch_async(batch_docs, batch_metadatas, batch_ids)
-                    logger.debug(f"Indexado lote {i//batch_size + 1} del dataset de entrenamiento")
+                    await self._process_batch_async(documentos, metadatas, ids)
+                    logger.debug(f"Indexado lote {lotes} del dataset de entrenamiento")
                 except Exception as e:
-                    logger.error(f"Error procesando lote {i//batch_size + 1} del dataset: {str(e)}")
+                    logger.error(f"Error procesando lote {lotes} del dataset: {str(e)}")
+
+            for pregunta, respuesta in leer_pares_qa(dataset_path):
+                if not respuestas.agregar(pregunta, respuesta):
+                    duplicados += 1
                     continue
+                # El texto del fragmento es la única copia de la pregunta y la respuesta
+                documentos.append(texto_par_qa(pregunta, respuesta))
+                metadatas.append({
+                    "origen": "dataset_entrenamiento",
+                    "tipo": "qa_pair",
+                    "fecha_indexacion": fecha,
+                    "chunk_index": indexados
+                })
+                indexados += 1
+                ids.append(f"training_{indexados}")
+                huella.update(f"{pregunta}\x00{respuesta}\n".encode("utf-8"))
+
+                if len(documentos) >= batch_size:
+                    await procesar_lote()
+                    documentos, metadatas, ids = [], [], []
+            if documentos:
+                await procesar_lote()
+
+            version.con_dataset = True
+            version.respuestas = respuestas
+            respuestas.guardar(str(self._ruta_respuestas(version.nombre)))
+            self.guardar_indices()
+            self._actualizar_generacion("dataset_entrenamiento", huella.hexdigest())
+            logger.info(
+                f"Dataset de entrenamiento indexado exitosamente: {indexados} pares QA "
+                f"({duplicados} preguntas duplicadas descartadas)"
+            )
 
-            self.training_data_indexed = True
-            logger.info(f"Dataset de entrenamiento indexado exitosamente: {len(documentos)} pares QA")
-            
         except Exception as e:
             logger.error(f"Error en indexación del dataset: {str(e)}", exc_info=True)
             raise
 
-    def buscar_pregunta_semantica(
-        self, 
-        pregunta: str, 
+    def respuesta_exacta(self, pregunta: str) -> Optional[str]:
+        """
+        Respuesta curada del dataset para una pregunta idéntica (tras normalizar
+        tildes, mayúsculas y puntuación) a una de la versión activa, o None.
+        """
+        if not self.config.include_training_data:
+            return None
+        return self._version_activa.respuestas.obtener(pregunta)
+
+    def buscar_fragmentos(
+        self,
+        pregunta: str,
         top_k: int = 5,
         filtros: Optional[Dict] = None,
-        use_hybrid: bool = True
-    ) -> str:
-        """Búsqueda semántica mejorada con soporte para dataset de entrenamiento."""
-        try:
-            # Normalizar la pregunta
-            pregunta = pregunta.strip().lower()
-            
-            # Ajustar filtros para incluir dataset de entrenamiento si está indexado
-            if filtros is None:
-                filtros = {
-                    "origen": {
-                        "$in": [
-                            "REGLAMENTO INTERNO DE TRABAJO - MODIFICACIÓN V2.docx",
-                            "Procedimiento Liquidación de nómina.docx"
-                        ]
-                    }
-                }
-                
-                if self.training_data_indexed and self.config.include_training_data:
-                    filtros["origen"]["$in"].append("dataset_entrenamiento")
+        embedding_consulta: Optional[np.ndarray] = None,
+        use_hybrid: bool = True,
+        categoria: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Búsqueda semántica con soporte para dataset de entrenamiento. Retorna los
+        mejores fragmentos como diccionarios con id, origen, texto, metadata y score.
+        La pregunta se codifica con el modelo del indexador (nunca con la función de
+        embeddings por defecto de Chroma); si se recibe `embedding_consulta`
+        (calculado con `calcular_embedding_consulta`) se reutiliza. Con `use_hybrid`
+        el ranking denso se fusiona con el de BM25 mediante reciprocal-rank fusion.
+
+        Solo se consultan las particiones relevantes (según `categoria`, los filtros o
+        los orígenes de búsqueda por defecto), en paralelo y con k propio cada una. Si
+        las particiones de la categoría no dan resultados se repite la búsqueda sin
+        ella: una categoría mal asignada no deja la pregunta sin contexto.
+        """
+        # Normalizar la pregunta
+        pregunta = pregunta.strip().lower()
+        # Toda la consulta usa la misma versión aunque se publique otra mientras tanto
+        version = self._version_activa
+
+        # Realizar búsqueda semántica
+        if embedding_consulta is None:
+            embedding_consulta = self.calcular_embedding_consulta(pregunta)
+        if version.proyeccion is not None:
+            embedding_consulta = version.proyeccion.proyectar(embedding_consulta)
+        vector = [np.asarray(embedding_consulta, dtype=np.float32).tolist()]
+        k = top_k * self.config.k_por_particion
 
-            # Realizar búsqueda semántica
-            resultados = self.coleccion.query(
-                query_texts=[pregunta],
-                n_results=top_k * 5,
+        nombres, where = self._particiones_consulta(version, filtros, categoria)
+        candidatos = self._buscar_en_particiones(version, nombres, where, pregunta, vector, k, use_hybrid)
+        if not candidatos and not filtros and categoria in self.config.rutas_categoria:
+            respaldo, where = self._particiones_consulta(version, None, None)
+            if set(respaldo) - set(nombres):
+                logger.info(f"Sin resultados en las particiones de '{categoria}'; se repite con los orígenes por defecto")
+                candidatos = self._buscar_en_particiones(version, respaldo, where, pregunta, vector, k, use_hybrid)
+
+        if not candidatos:
+            logger.warning(f"No se encontraron resultados para la pregunta: {pregunta}")
+        return candidatos[:top_k]
+
+    def _buscar_en_particiones(
+        self,
+        version: VersionIndice,
+        nombres: List[str],
+        where: Optional[Dict],
+        pregunta: str,
+        vector: List[List[float]],
+        k: int,
+        use_hybrid: bool
+    ) -> List[Dict]:
+        """Consulta las particiones en paralelo y retorna sus candidatos ordenados (fusionados con BM25)."""
+        # Un filtro por origen también debe encontrar los fragmentos canónicos que el
+        # documento comparte con otros: se amplía a sus propietarios y luego se filtra por `origenes`
+        filtrados = self._origenes_de_filtro(where)
+        ampliados = None
+        if filtrados:
+            ampliados = list(dict.fromkeys(
+                [*filtrados, *(d for o in filtrados for d in version.compartidos.get(o, []))]
+            ))
+            if len(ampliados) > len(filtrados):
+                where = {"origen": {"$in": ampliados}}
+            else:
+                ampliados = None
+        origenes = self._origenes_de_filtro(where) if use_hybrid else False
+
+        def consultar(nombre: str):
+            particion = version.particiones[nombre]
+            if particion.coleccion.count() == 0:
+                return [], []
+            resultados = particion.coleccion.query(
+                query_embeddings=vector,
+                n_results=k,
                 include=["documents", "metadatas", "distances"],
-                where=filtros
+                **({"where": where} if where else {})
             )
+            densos = self._rankear_candidatos(pregunta, resultados)
+            if ampliados:
+                densos = [c for c in densos if set(_origenes_fragmento(c["metadata"])) & set(filtrados)]
+            lexicos = []
+            if origenes is not False:
+                lexicos = [(i, s, nombre) for i, s in particion.bm25.buscar(pregunta, k, origenes)]
+            return densos, lexicos
 
-            if not resultados['documents'] or not resultados['documents'][0]:
-                logger.warning(f"No se encontraron resultados para la pregunta: {pregunta}")
-                return "No se encontraron resultados relevantes en la documentación."
+        if len(nombres) > 1:
+            partes = list(self._executor_particiones.map(consultar, nombres))
+        else:
+            partes = [consultar(nombre) for nombre in nombres]
 
-            respuestas = []
-            scores = []
-            seen_docs = set()
+        # Los puntajes de todas las particiones son comparables: se mezclan por score
+        candidatos = sorted((c for densos, _ in partes for c in densos), key=lambda c: c["score"], reverse=True)
+        lexicos = sorted((l for _, lexicos in partes for l in lexicos), key=lambda l: l[1], reverse=True)
+        if lexicos:
+            candidatos = self._fusionar_rrf(candidatos, lexicos[:k], version, np.asarray(vector[0], dtype=np.float32))
+            if ampliados:
+                candidatos = [c for c in candidatos if set(_origenes_fragmento(c["metadata"])) & set(filtrados)]
+        return candidatos
 
-            # Procesar y rankear resultados
-            for i in range(len(resultados['documents'][0])):
-                fragmento = resultados['documents'][0][i]
-                metadata = resultados['metadatas'][0][i]
-                score = resultados.get('distances', [[]])[0][i] if 'distances' in resultados else None
+    def _particiones_consulta(self, version: VersionIndice, filtros: Optional[Dict], categoria: Optional[str]):
+        """
+        Elige las particiones a consultar y el filtro `where` que aún hace falta dentro
+        de ellas. Un filtro explícito manda; si no, la categoría de la pregunta; si no,
+        los orígenes de búsqueda por defecto (más el dataset si está indexado).
+        """
+        incluir_dataset = version.con_dataset and self.config.include_training_data
+        if filtros:
+            origenes = self._origenes_de_filtro(filtros)
+            if origenes is False:
+                return list(version.particiones), filtros
+            return list(dict.fromkeys(self._particion_de(o) for o in origenes)), filtros
 
-                if score is not None:
-                    # Normalizar score
-                    normalized_score = 1 - score
+        if categoria in self.config.rutas_categoria:
+            nombres = [
+                n for n in self.config.rutas_categoria[categoria]
+                if n in version.particiones and (incluir_dataset or self._particion_de("dataset_entrenamiento") != n)
+            ]
+            return nombres, None
 
-                    # Ajustar umbral y pesos según el origen
-                    if metadata['origen'] == "dataset_entrenamiento":
-                        min_threshold = 0.45  # Umbral más bajo para dataset de entrenamiento
-                        final_score = normalized_score * self.config.training_data_weight
-                    else:
-                        min_threshold = self.config.min_similarity_threshold
-                        length_score = min(1.0, len(fragmento.split()) / self.config.max_chunk_words)
-                        keyword_score = self._calculate_keyword_score(pregunta, fragmento)
-                        final_score = (
-                            normalized_score * 0.5 +
-                            length_score * 0.3 +
-                            keyword_score * 0.2
-                        )
-
-                    if normalized_score < min_threshold:
-                        continue
+        if not self.config.origenes_busqueda:
+            return list(version.particiones), None
+        origenes = list(self.config.origenes_busqueda)
+        if incluir_dataset:
+            origenes.append("dataset_entrenamiento")
+        nombres = list(dict.fromkeys(self._particion_de(o) for o in origenes))
+        # La partición general mezcla fuentes: ahí sí hace falta filtrar por origen
+        where = {"origen": {"$in": origenes}} if PARTICION_GENERAL in nombres else None
+        return nombres, where
 
-                    # Formatear respuesta según el origen
-                    if metadata['origen'] == "dataset_entrenamiento":
-                        respuesta = (
-                            f"📚 Respuesta del Dataset de Entrenamiento:\n"
-                            f"❓ Pregunta Original: {metadata['pregunta']}\n"
-                            f"✅ Respuesta: {metadata['respuesta']}\n"
-                            f"🎯 Relevancia: {final_score:.2%}"
-                        )
-                    else:
-                        respuesta = (
-                            f"📄 Documento: {metadata['origen']}\n"
-                            f"📝 Fragmento: {fragmento}\n"
-                            f"🎯 Relevancia: {final_score:.2%}"
-                        )
-
-                    # Solo incluir si es un documento nuevo o tiene mejor score
-                    doc_id = f"{metadata['origen']}_{metadata.get('chunk_index', i)}"
-                    if doc_id not in seen_docs or final_score > max(scores):
-                        scores.append(final_score)
-                        respuestas.append(respuesta)
-                        seen_docs.add(doc_id)
-
-            # Ordenar y seleccionar mejores resultados
-            if respuestas:
-                sorted_results = [r for _, r in sorted(zip(scores, respuestas), reverse=True)]
-                return "\n\n".join(sorted_results[:top_k])
-            else:
-                logger.warning(f"No se encontraron resultados relevantes para: {pregunta}")
-                return "No se encontraron resultados relevantes en la documentación."
+    def _rankear_candidatos(self, pregunta: str, resultados: Dict) -> List[Dict]:
+        """
+        Puntúa en bloque los candidatos de una consulta a la colección: similitud,
+        largo y coincidencia de palabras clave se calculan como arreglos NumPy. Descarta
+        los que no alcanzan el umbral de su origen, deja el mejor por (origen, chunk) y
+        retorna los candidatos ordenados por score.
+        """
+        documentos = resultados["documents"][0] if resultados.get("documents") else []
+        if not documentos or not resultados.get("distances"):
+            return []
+        metadatas = resultados["metadatas"][0]
+        ids = resultados["ids"][0]
 
-        except Exception as e:
-            logger.error(f"Error durante la búsqueda: {e}", exc_info=True)
-            return f"Error al procesar la consulta: {str(e)}"
+        similitud = 1 - np.asarray(resultados["distances"][0], dtype=np.float32)
+        es_dataset = np.array([m["origen"] == "dataset_entrenamiento" for m in metadatas], dtype=bool)
+        palabras = [documento.lower().split() for documento in documentos]
+        largos = np.array([len(p) for p in palabras], dtype=np.float32)
 
-    def _calculate_keyword_score(self, query: str, text: str) -> float:
-        """Calcula un score basado en coincidencia de palabras clave."""
-        query_words = set(query.lower().split())
-        text_words = set(text.lower().split())
-        
-        # Calcular Jaccard similarity
-        intersection = len(query_words.intersection(text_words))
-        union = len(query_words.union(text_words))
-        
-        if union == 0:
-            return 0.0
-            
-        return intersection / union
+        length_score = np.minimum(1.0, largos / self.config.max_chunk_words)
+        keyword_score = self._puntajes_palabras_clave(pregunta, palabras)
+        puntajes = np.where(
+            es_dataset,
+            similitud * self.config.training_data_weight,
+            similitud * 0.5 + length_score * 0.3 + keyword_score * 0.2
+        )
+        umbral = self._umbrales_similitud(es_dataset)
+
+        candidatos = []
+        vistos = set()
+        for i in np.argsort(-puntajes, kind="stable"):
+            if similitud[i] < umbral[i]:
+                continue
+            metadata = metadatas[i]
+            clave = (metadata["origen"], metadata.get("chunk_index", i))
+            if clave in vistos:
+                continue
+            vistos.add(clave)
+            candidatos.append({
+                "id": ids[i],
+                "origen": metadata["origen"],
+                "texto": documentos[i],
+                "metadata": metadata,
+                "score": float(puntajes[i])
+            })
+        return candidatos
+
+    def _umbrales_similitud(self, es_dataset: np.ndarray) -> np.ndarray:
+        """Similitud mínima de cada candidato; más baja para el dataset de entrenamiento."""
+        return np.where(es_dataset, 0.45, self.config.min_similarity_threshold)
+
+    @staticmethod
+    def _puntajes_palabras_clave(pregunta: str, palabras: List[List[str]]) -> np.ndarray:
+        """
+        Similitud de Jaccard entre las palabras de la pregunta y las de cada texto,
+        calculada para todos los textos a la vez sobre pares únicos (texto, palabra).
+        """
+        consulta = set(pregunta.lower().split())
+        if not palabras or not consulta:
+            return np.zeros(len(palabras), dtype=np.float32)
+        vocabulario = {palabra: i for i, palabra in enumerate(consulta)}
+        codigos = [[vocabulario.setdefault(palabra, len(vocabulario)) for palabra in texto] for texto in palabras]
+        largos = np.array([len(c) for c in codigos], dtype=np.int64)
+        if not largos.any():
+            return np.zeros(len(palabras), dtype=np.float32)
+        textos = np.repeat(np.arange(len(palabras), dtype=np.int64), largos)
+        pares = np.unique(textos * len(vocabulario) + np.concatenate([c for c in codigos if c]))
+        texto_par = pares // len(vocabulario)
+        unicas = np.bincount(texto_par, minlength=len(palabras))
+        interseccion = np.bincount(texto_par[pares % len(vocabulario) < len(consulta)], minlength=len(palabras))
+        union = unicas + len(consulta) - interseccion
+        return (interseccion / np.maximum(union, 1)).astype(np.float32)
+
+    @staticmethod
+    def _origenes_de_filtro(filtros: Optional[Dict]):
+        """
+        Traduce el filtro de Chroma a orígenes para BM25: None si no hay filtro y
+        False si el filtro no es sobre `origen` (en ese caso no se usa BM25).
+        """
+        if not filtros:
+            return None
+        if set(filtros) != {"origen"}:
+            return False
+        condicion = filtros["origen"]
+        if isinstance(condicion, str):
+            return [condicion]
+        if isinstance(condicion, dict) and set(condicion) == {"$eq"}:
+            return [condicion["$eq"]]
+        if isinstance(condicion, dict) and set(condicion) == {"$in"}:
+            return list(condicion["$in"])
+        return False
+
+    def _fusionar_rrf(
+        self,
+        densos: List[Dict],
+        lexicos: List[tuple],
+        version: VersionIndice,
+        embedding_consulta: np.ndarray
+    ) -> List[Dict]:
+        """
+        Fusiona el ranking denso (ya ordenado) con el de BM25 usando reciprocal-rank
+        fusion ponderada. El score resultante se normaliza a [0, 1].
+
+        Los fragmentos que solo encontró BM25 deben alcanzar el mismo umbral de
+        similitud que los densos: una coincidencia léxica sin relación semántica con
+        la pregunta no llega al modelo QA.
+        """
+        k = self.config.rrf_k
+        peso = self.config.hybrid_search_weight
+        ids = list(dict.fromkeys([c["id"] for c in densos] + [i for i, _, _ in lexicos]))
+        posicion = {fragmento_id: i for i, fragmento_id in enumerate(ids)}
+
+        rango_denso = np.full(len(ids), np.inf)
+        rango_denso[[posicion[c["id"]] for c in densos]] = np.arange(len(densos))
+        rango_lexico = np.full(len(ids), np.inf)
+        rango_lexico[[posicion[i] for i, _, _ in lexicos]] = np.arange(len(lexicos))
+        fusion = (peso / (k + 1 + rango_denso) + (1 - peso) / (k + 1 + rango_lexico)) * (k + 1)
+        orden = np.argsort(-fusion, kind="stable")
+
+        por_id = {c["id"]: c for c in densos}
+        faltantes: Dict[str, List[str]] = {}
+        for fragmento_id, _, particion in lexicos:
+            if fragmento_id not in por_id:
+                faltantes.setdefault(particion, []).append(fragmento_id)
+        for particion, ids_particion in faltantes.items():
+            extra = version.particiones[particion].coleccion.get(
+                ids=ids_particion, include=["documents", "metadatas", "embeddings"]
+            )
+            if not extra["ids"]:
+                continue
+            similitud = self._similitudes_fragmentos(extra["embeddings"], embedding_consulta)
+            es_dataset = np.array([m.get("origen") == "dataset_entrenamiento" for m in extra["metadatas"]], dtype=bool)
+            suficientes = similitud >= self._umbrales_similitud(es_dataset)
+            for fragmento_id, texto, metadata, suficiente in zip(
+                extra["ids"], extra["documents"], extra["metadatas"], suficientes
+            ):
+                if not suficiente:
+                    continue
+                por_id[fragmento_id] = {
+                    "id": fragmento_id,
+                    "origen": metadata.get("origen", ""),
+                    "texto": texto,
+                    "metadata": metadata,
+                }
+
+        fusionados = []
+        for i in orden:
+            candidato = por_id.get(ids[i])
+            if candidato is None:
+                continue
+            candidato["score"] = float(fusion[i])
+            fusionados.append(candidato)
+        return fusionados
+
+    @staticmethod
+    def _similitudes_fragmentos(embeddings, embedding_consulta: np.ndarray) -> np.ndarray:
+        """
+        Similitud de coseno entre la consulta (ya proyectada si la versión tiene PCA)
+        y los vectores guardados de fragmentos indexados: no se calcula ningún embedding
+        en la consulta ni se escribe en el cache de indexación.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        consulta = np.asarray(embedding_consulta, dtype=np.float32)
+        normas = np.linalg.norm(embeddings, axis=1) * max(float(np.linalg.norm(consulta)), 1e-12)
+        return embeddings @ consulta / np.maximum(normas, 1e-12)
 
-    def _combine_search_results(
+    @staticmethod
+    def formatear_fragmento(resultado: Dict) -> str:
+        """Formatea un resultado de `buscar_fragmentos` según su origen."""
+        metadata = resultado["metadata"]
+        if resultado["origen"] == "dataset_entrenamiento":
+            # Los pares indexados antes del formato actual guardaban una copia en la metadata
+            pregunta, respuesta = separar_par_qa(resultado["texto"])
+            return (
+                f"📚 Respuesta del Dataset de Entrenamiento:\n"
+                f"❓ Pregunta Original: {metadata.get('pregunta', pregunta)}\n"
+                f"✅ Respuesta: {metadata.get('respuesta', respuesta)}\n"
+                f"🎯 Relevancia: {resultado['score']:.2%}"
+            )
+        return (
+            f"📄 Documento: {metadata.get('origenes', resultado['origen'])}\n"
+            f"📝 Fragmento: {resultado['texto']}\n"
+            f"🎯 Relevancia: {resultado['score']:.2%}"
+        )
+
+    def buscar_pregunta_semantica(
         self, 
-        semantic_results: Dict, 
-        keyword_results: Dict,
-        query: str
-    ) -> Dict:
-        """Combina y re-ranking resultados de búsqueda híbrida."""
+        pregunta: str, 
+        top_k: int = 5,
+        filtros: Optional[Dict] = None,
+        use_hybrid: bool = True,
+        embedding_consulta: Optional[np.ndarray] = None,
+        categoria: Optional[str] = None
+    ) -> str:
+        """Búsqueda semántica que retorna los mejores fragmentos formateados como texto."""
         try:
-            combined_docs = []
-            combined_metadatas = []
-            combined_distances = []
-            seen_ids = set()
-            
-            # Función para procesar resultados
-            def process_results(results, weight=1.0):
-                if not results['documents'] or not results['documents'][0]:
-                    return
-                    
-                for i in range(len(results['documents'][0])):
-                    doc = results['documents'][0][i]
-                    metadata = results['metadatas'][0][i]
-                    distance = results.get('distances', [[]])[0][i] if 'distances' in results else None
-                    
-                    # Usar metadata como identificador único
-                    doc_id = f"{metadata['origen']}_{metadata.get('chunk_index', i)}"
-                    
-                    if doc_id not in seen_ids:
-                        seen_ids.add(doc_id)
-                        combined_docs.append(doc)
-                        combined_metadatas.append(metadata)
-                        
-                        if distance is not None:
-                            # Ajustar distancia según el peso
-                            adjusted_distance = distance * weight
-                            combined_distances.append(adjusted_distance)
-                        else:
-                            combined_distances.append(1.0)
-            
-            # Procesar resultados semánticos (mayor peso)
-            process_results(semantic_results, weight=0.7)
-            
-            # Procesar resultados keyword (menor peso)
-            process_results(keyword_results, weight=0.3)
-            
-            # Re-ranking basado en scores combinados
-            if combined_distances:
-                # Calcular scores finales
-                final_scores = []
-                for i, doc in enumerate(combined_docs):
-                    semantic_score = 1 - combined_distances[i]
-                    keyword_score = self._calculate_keyword_score(query, doc)
-                    final_score = semantic_score * 0.7 + keyword_score * 0.3
-                    final_scores.append(final_score)
-                
-                # Ordenar por score final
-                sorted_indices = sorted(range(len(final_scores)), key=lambda i: final_scores[i], reverse=True)
-                
-                return {
-                    'documents': [[combined_docs[i] for i in sorted_indices]],
-                    'metadatas': [[combined_metadatas[i] for i in sorted_indices]],
-                    'distances': [[1 - final_scores[i] for i in sorted_indices]]
-                }
-            
-            return {
-                'documents': [combined_docs],
-                'metadatas': [combined_metadatas],
-                'distances': [combined_distances]
-            }
-            
+            resultados = self.buscar_fragmentos(pregunta, top_k, filtros, embedding_consulta, use_hybrid, categoria)
+            if resultados:
+                return "\n\n".join(self.formatear_fragmento(r) for r in resultados)
+            logger.warning(f"No se encontraron resultados relevantes para: {pregunta}")
+            return "No se encontraron resultados relevantes en la documentación."
+
         except Exception as e:
-            logger.error(f"Error al combinar resultados: {e}")
-            # En caso de error, retornar resultados semánticos
-            return semantic_results
+            logger.error(f"Error durante la búsqueda: {e}", exc_info=True)
+            return f"Error al procesar la consulta: {str(e)}"
 
     def limpiar_cache(self):
         """Limpia el cache de embeddings."""
-        self.embedding_cache.clear()
-        self._save_embedding_cache()
+        self.embedding_cache.limpiar()
         logger.info("Cache de embeddings limpiado")
 
     def optimizar_indice(self):
         """Optimiza el índice para mejor rendimiento."""
         try:
-            # Actualizar configuración de HNSW
-            self.coleccion.update(
-                metadata={
-                    "hnsw:space": "cosine",
-                    "hnsw:construction_ef": 200,
-                    "hnsw:search_ef": 100,
-                    "hnsw:M": 64
-                }
-            )
-            
-            # Reconstruir índice si es necesario
-            if len(self.coleccion.get()['ids']) > 10000:
-                logger.info("Reconstruyendo índice para optimización...")
-                self.coleccion.rebuild()
+            for particion in self._version_activa.particiones.values():
+                coleccion = particion.coleccion
+                if isinstance(coleccion, VectorStore):
+                    coleccion.optimizar()
+                    continue
+                # Actualizar configuración de HNSW
+                coleccion.update(
+                    metadata={
+                        "hnsw:space": "cosine",
+                        "hnsw:construction_ef": 200,
+                        "hnsw:search_ef": 100,
+                        "hnsw:M": 64
+                    }
+                )
+
+                # Reconstruir índice si es necesario
+                if coleccion.count() > 10000:
+                    logger.info(f"Reconstruyendo índice de '{particion.nombre}' para optimización...")
+                    coleccion.rebuild()
             
             logger.info("Índice optimizado correctamente")
         except Exception as e:
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """
+    Cache persistente de embeddings acotado en tamaño.
+
+    - La clave es el SHA1 del id del modelo y el texto, no el texto completo.
+    - Los vectores se guardan en float16 en un archivo memoria-mapeada de
+      `capacidad` filas; al arrancar no se deserializa nada, solo se relee el
+      índice de claves.
+    - El índice clave -> fila es un log de solo-agregado. Cada vector se escribe y se
+      sincroniza antes de registrar su línea, y las filas reutilizadas se anulan en
+      el log antes de sobrescribirlas, de modo que una caída a mitad de escritura
+      nunca deja una clave apuntando a un vector incompleto o ajeno.
+    - Al llenarse se reutiliza la fila de la clave usada hace más tiempo (LRU).
+    """
+
+    _VECTORES = "vectores.f16"
+    _INDICE = "indice.log"
+    _META = "meta.json"
+
+    def __init__(self, directorio: str, modelo_id: str, dimension: int, capacidad: int = 200_000):
+        self.directorio = Path(directorio)
+        self.modelo_id = modelo_id
+        self.dimension = dimension
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._libres: List[int] = []
+        self._lineas_log = 0
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self._abrir()
+
+    # --- Persistencia ---
+
+    def _meta_esperada(self):
+        return {"modelo_id": self.modelo_id, "dimension": self.dimension, "capacidad": self.capacidad}
+
+    def _abrir(self):
+        ruta_meta = self.directorio / self._META
+        ruta_vectores = self.directorio / self._VECTORES
+        meta = None
+        if ruta_meta.exists():
+            try:
+                meta = json.loads(ruta_meta.read_text(encoding="utf-8"))
+            except Exception as e:
+                logger.warning(f"Metadatos del cache de embeddings ilegibles: {e}")
+
+        if meta != self._meta_esperada() or not ruta_vectores.exists() or not (self.directorio / self._INDICE).exists():
+            if meta is not None:
+                logger.info("Cambió el modelo o la capacidad del cache de embeddings; se reinicia")
+            self._crear()
+            return
+
+        self._vectores = np.memmap(ruta_vectores, dtype=np.float16, mode="r+", shape=(self.capacidad, self.dimension))
+        ocupadas = {}
+        with open(self.directorio / self._INDICE, "r", encoding="ascii", errors="ignore") as f:
+            for linea in f:
+                partes = linea.split()
+                # Una línea truncada por una caída se descarta
+                if len(partes) != 2 or len(partes[0]) not in (1, 40) or not partes[1].isdigit():
+                    continue
+                clave, fila = partes[0], int(partes[1])
+                if fila >= self.capacidad:
+                    continue
+                anterior = ocupadas.pop(fila, None)
+                if anterior is not None:
+                    self._lru.pop(anterior, None)
+                if clave == "-":
+                    # Fila liberada para ser reutilizada
+                    continue
+                vieja = self._lru.pop(clave, None)
+                if vieja is not None and ocupadas.get(vieja) == clave:
+                    del ocupadas[vieja]
+                self._lru[clave] = fila
+                ocupadas[fila] = clave
+                self._lineas_log += 1
+        self._libres = sorted(set(range(self.capacidad)) - set(ocupadas), reverse=True)
+        self._log = open(self.directorio / self._INDICE, "a", encoding="ascii")
+        logger.info(f"Cache de embeddings abierto: {len(self._lru)} entradas")
+
+    def _crear(self):
+        for nombre in (self._VECTORES, self._INDICE):
+            ruta = self.directorio / nombre
+            if ruta.exists():
+                ruta.unlink()
+        self._vectores = np.memmap(
+            self.directorio / self._VECTORES, dtype=np.float16, mode="w+", shape=(self.capacidad, self.dimension)
+        )
+        self._log = open(self.directorio / self._INDICE, "w", encoding="ascii")
+        self._lru.clear()
+        self._libres = list(range(self.capacidad - 1, -1, -1))
+        self._lineas_log = 0
+        temporal = self.directorio / (self._META + ".tmp")
+        temporal.write_text(json.dumps(self._meta_esperada()), encoding="utf-8")
+        os.replace(temporal, self.directorio / self._META)
+
+    def _compactar(self):
+        """Reescribe el log con una línea por entrada viva, en orden LRU."""
+        self._log.close()
+        temporal = self.directorio / (self._INDICE + ".tmp")
+        with open(temporal, "w", encoding="ascii") as f:
+            for clave, fila in self._lru.items():
+                f.write(f"{clave} {fila}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.directorio / self._INDICE)
+        self._log = open(self.directorio / self._INDICE, "a", encoding="ascii")
+        self._lineas_log = len(self._lru)
+
+    # --- Acceso ---
+
+    def _clave(self, texto: str) -> str:
+        return hashlib.sha1(f"{self.modelo_id}\0{texto}".encode("utf-8")).hexdigest()
+
+    def __contains__(self, texto: str) -> bool:
+        return self._clave(texto) in self._lru
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def obtener(self, texto: str) -> Optional[np.ndarray]:
+        return self.obtener_lote([texto])[0]
+
+    def obtener_lote(self, textos: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Retorna el embedding (float32) de cada texto, o None si no está en el cache."""
+        resultado: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for texto in textos:
+                clave = self._clave(texto)
+                fila = self._lru.get(clave)
+                if fila is None:
+                    resultado.append(None)
+                    continue
+                self._lru.move_to_end(clave)
+                resultado.append(np.asarray(self._vectores[fila], dtype=np.float32))
+        return resultado
+
+    def _escribir_log(self, lineas: List[str]) -> None:
+        self._log.write("".join(lineas))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._lineas_log += len(lineas)
+
+    def guardar_lote(self, textos: Iterable[str], vectores: Iterable[np.ndarray]) -> None:
+        """Agrega embeddings; los vectores se sincronizan a disco antes de registrar sus claves."""
+        with self._lock:
+            asignaciones = []
+            liberadas = []
+            for texto, vector in zip(textos, vectores):
+                clave = self._clave(texto)
+                fila = self._lru.pop(clave, None)
+                if fila is None:
+                    if self._libres:
+                        fila = self._libres.pop()
+                    else:
+                        _, fila = self._lru.popitem(last=False)
+                        liberadas.append(f"- {fila}\n")
+                self._lru[clave] = fila
+                asignaciones.append((clave, fila, vector))
+            if not asignaciones:
+                return
+
+            # Primero se anulan en el log las filas expulsadas, luego se escriben los vectores
+            if liberadas:
+                self._escribir_log(liberadas)
+            for _, fila, vector in asignaciones:
+                self._vectores[fila] = np.asarray(vector, dtype=np.float16)
+            self._vectores.flush()
+            self._escribir_log([f"{clave} {fila}\n" for clave, fila, _ in asignaciones])
+
+            if self._lineas_log > 4 * max(len(self._lru), 1) and self._lineas_log > 1000:
+                self._compactar()
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._log.close()
+            del self._vectores
+            self._crear()
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._vectores.flush()
+            self._log.close()
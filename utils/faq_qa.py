@@ -1,35 +1,145 @@
-from transformers import pipeline
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 
-qa_pipeline = pipeline(
-    "question-answering",
-    model="mrm8488/bert-base-spanish-wwm-cased-finetuned-spa-squad2-es",
-    tokenizer="mrm8488/bert-base-spanish-wwm-cased-finetuned-spa-squad2-es"
-)
+from utils.bm25_index import BM25Index
 
-def responder_pregunta_documental(pregunta, documentos_texto, ventana=500, paso=250):
+MODELO_QA = "mrm8488/bert-base-spanish-wwm-cased-finetuned-spa-squad2-es"
+
+
+@lru_cache(maxsize=1)
+def obtener_qa_pipeline():
+    """Pipeline de QA, cargado en el primer uso y no al importar el módulo."""
+    from transformers import pipeline
+
+    return pipeline("question-answering", model=MODELO_QA, tokenizer=MODELO_QA)
+
+
+class _IndiceVentanas:
+    """
+    Ventanas de todos los documentos, cortadas con el overflow/stride del tokenizer
+    QA, con un índice BM25 (el mismo `BM25Index` de la búsqueda híbrida) para
+    elegir candidatas sin ejecutar el modelo.
+    """
+
+    def __init__(self, documentos_texto: Dict[str, str], ventana: int, solapamiento: int):
+        self.ventanas: List[Tuple[str, str]] = []
+        for nombre, texto in documentos_texto.items():
+            for fragmento in _ventanas_tokenizadas(texto, ventana, solapamiento):
+                self.ventanas.append((nombre, fragmento))
+        self._bm25 = BM25Index()
+        self._bm25.agregar(
+            [str(i) for i in range(len(self.ventanas))],
+            [fragmento for _, fragmento in self.ventanas],
+            [nombre for nombre, _ in self.ventanas]
+        )
+
+    def candidatas(self, pregunta: str, top_n: int, completar: bool = False) -> List[int]:
+        """
+        Retorna los índices de las `top_n` ventanas con mayor puntaje BM25 (> 0). Con
+        `completar`, las plazas libres se llenan con las demás ventanas en el orden de
+        los documentos, para no descartar las que solo coinciden en significado.
+        """
+        candidatas = [int(i) for i, _ in self._bm25.buscar(pregunta, top_n)]
+        if completar:
+            elegidas = set(candidatas)
+            restantes = (i for i in range(len(self.ventanas)) if i not in elegidas)
+            candidatas.extend(islice(restantes, top_n - len(candidatas)))
+        return candidatas
+
+
+def _ventanas_tokenizadas(texto: str, ventana: int, solapamiento: int) -> List[str]:
+    """Corta el texto en ventanas de `ventana` tokens QA que se solapan en `solapamiento`."""
+    codificado = obtener_qa_pipeline().tokenizer(
+        texto,
+        add_special_tokens=False,
+        truncation=True,
+        max_length=ventana,
+        stride=solapamiento,
+        return_overflowing_tokens=True,
+        return_offsets_mapping=True
+    )
+    ventanas = []
+    for offsets in codificado["offset_mapping"]:
+        if offsets:
+            ventanas.append(texto[offsets[0][0]:offsets[-1][1]])
+    return ventanas
+
+
+# Pocos corpus distintos: los documentos institucionales y las páginas web recientes
+_MAX_INDICES = 8
+_indice_cache: "OrderedDict[Tuple, _IndiceVentanas]" = OrderedDict()
+
+
+def _obtener_indice(documentos_texto: Dict[str, str], ventana: int, solapamiento: int) -> _IndiceVentanas:
+    """Reutiliza el índice mientras los documentos no cambien."""
+    huella = hashlib.sha1()
+    for nombre in sorted(documentos_texto):
+        huella.update(nombre.encode("utf-8"))
+        huella.update(documentos_texto[nombre].encode("utf-8"))
+    clave = (huella.hexdigest(), ventana, solapamiento)
+    if clave in _indice_cache:
+        _indice_cache.move_to_end(clave)
+        return _indice_cache[clave]
+    indice = _IndiceVentanas(documentos_texto, ventana, solapamiento)
+    _indice_cache[clave] = indice
+    while len(_indice_cache) > _MAX_INDICES:
+        _indice_cache.popitem(last=False)
+    return indice
+
+
+def mejor_respuesta(
+    pregunta: str,
+    documentos_texto: Dict[str, str],
+    ventana: int = 320,
+    solapamiento: int = 128,
+    top_n: int = 8,
+    umbral: float = 0.2,
+    preclasificados: bool = False
+) -> Optional[Tuple[str, str, float]]:
     """
-    Divide cada documento en fragmentos y aplica QA por separado (sliding window).
-    Elige la mejor respuesta entre todos los fragmentos.
+    Divide cada documento en ventanas de tokens del modelo QA, elige con BM25 las
+    `top_n` ventanas más prometedoras y aplica QA sobre ellas en un solo lote.
+    Retorna (documento, respuesta, score) de la mejor respuesta sobre el umbral.
+
+    Con `preclasificados`, los documentos son fragmentos ya ordenados por relevancia
+    (p. ej. la búsqueda densa de la normativa local): las ventanas sin coincidencias
+    BM25 también se leen, en ese orden, y el índice no se guarda en el caché porque
+    cada consulta trae un conjunto distinto.
     """
+    if preclasificados:
+        indice = _IndiceVentanas(documentos_texto, ventana, solapamiento)
+    else:
+        indice = _obtener_indice(documentos_texto, ventana, solapamiento)
+    candidatas = indice.candidatas(pregunta, top_n, completar=preclasificados)
     respuestas = []
 
-    for nombre, texto in documentos_texto.items():
-        palabras = texto.split()
-        total = len(palabras)
-        for i in range(0, total, paso):
-            fragmento = " ".join(palabras[i:i+ventana])
-            try:
-                resultado = qa_pipeline({
-                    "question": pregunta,
-                    "context": fragmento
-                })
-                if resultado and resultado["score"] > 0.2:
-                    respuestas.append((nombre, resultado["answer"], round(resultado["score"], 3)))
-            except Exception as e:
-                print(f"Error en fragmento {i}-{i+ventana} de {nombre}: {e}")
-
-    if not respuestas:
-        return "No encontré una respuesta clara en los documentos institucionales."
+    if candidatas:
+        try:
+            resultados = obtener_qa_pipeline()(
+                question=[pregunta] * len(candidatas),
+                context=[indice.ventanas[i][1] for i in candidatas],
+                batch_size=len(candidatas)
+            )
+            if isinstance(resultados, dict):
+                resultados = [resultados]
+            for i, resultado in zip(candidatas, resultados):
+                if resultado and resultado["score"] > umbral:
+                    respuestas.append((indice.ventanas[i][0], resultado["answer"], round(resultado["score"], 3)))
+        except Exception as e:
+            print(f"Error en QA sobre {len(candidatas)} ventanas candidatas: {e}")
+
+    return max(respuestas, key=lambda x: x[2]) if respuestas else None
+
 
-    mejor = max(respuestas, key=lambda x: x[2])
+def responder_pregunta_documental(pregunta, documentos_texto, ventana=320, solapamiento=128, top_n=8):
+    """
+    Busca la respuesta en las ventanas de los documentos más relevantes para la
+    pregunta (ver `mejor_respuesta`).
+    """
+    mejor = mejor_respuesta(pregunta, documentos_texto, ventana, solapamiento, top_n)
+    if not mejor:
+        return "No encontré una respuesta clara en los documentos institucionales."
     return f"📄 Según el documento '{mejor[0]}':\n{mejor[1]}"
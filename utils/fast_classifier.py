@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.model_inference import CATEGORIAS_PREGUNTA
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FastClassifierConfig:
+    """Configuración de la cabeza lineal de clasificación rápida."""
+    umbral_confianza: float = 0.85  # Por debajo de este valor calibrado se consulta BERT
+    min_ejemplos: int = 60
+    reentrenar_cada: int = 50  # Ejemplos nuevos etiquetados por BERT antes de reentrenar
+    max_ejemplos: int = 5000
+    epocas: int = 300
+    tasa_aprendizaje: float = 0.5
+    regularizacion: float = 1e-3
+    fraccion_validacion: float = 0.2
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class ClasificadorRapido:
+    """
+    Regresión logística multinomial sobre el embedding de la pregunta calculado por
+    el sentence-transformer del indexador. La confianza se calibra con temperature
+    scaling sobre un conjunto de validación, de modo que el umbral es comparable a
+    una probabilidad. Aprende de las decisiones de BERT (destilación en línea): el
+    reentrenamiento corre en un hilo aparte y el modelo nuevo se publica bajo el lock.
+    """
+
+    def __init__(self, ruta: Optional[str] = None, config: Optional[FastClassifierConfig] = None):
+        self.config = config or FastClassifierConfig()
+        self.ruta = Path(ruta) if ruta else None
+        self.W: Optional[np.ndarray] = None
+        self.b: Optional[np.ndarray] = None
+        self.temperatura = 1.0
+        self._X: List[np.ndarray] = []
+        self._y: List[int] = []
+        self._nuevos = 0
+        self._lock = threading.Lock()
+        self._reentrenando: Optional[threading.Thread] = None
+        if self.ruta and self.ruta.exists():
+            self.cargar()
+
+    def esta_entrenado(self) -> bool:
+        return self.W is not None
+
+    @staticmethod
+    def _preparar(X: np.ndarray) -> np.ndarray:
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        normas = np.linalg.norm(X, axis=1, keepdims=True)
+        return X / np.maximum(normas, 1e-12)
+
+    def predecir(self, embedding: np.ndarray) -> Tuple[str, float]:
+        """Retorna la categoría y su probabilidad calibrada."""
+        with self._lock:
+            W, b, temperatura = self.W, self.b, self.temperatura
+        if W is None:
+            raise RuntimeError("El clasificador rápido no está entrenado")
+        probabilidades = _softmax((self._preparar(embedding) @ W + b) / temperatura)[0]
+        idx = int(np.argmax(probabilidades))
+        return CATEGORIAS_PREGUNTA[idx], float(probabilidades[idx])
+
+    def clasificar(self, embedding: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Retorna la predicción solo si supera el umbral de confianza calibrada."""
+        if not self.esta_entrenado():
+            return None
+        categoria, confianza = self.predecir(embedding)
+        if confianza < self.config.umbral_confianza:
+            return None
+        return categoria, confianza
+
+    def _ajustar(self, X: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Descenso de gradiente de la entropía cruzada con regularización L2."""
+        n, d = X.shape
+        k = len(CATEGORIAS_PREGUNTA)
+        W = np.zeros((d, k), dtype=np.float32)
+        b = np.zeros(k, dtype=np.float32)
+        Y = np.eye(k, dtype=np.float32)[y]
+        for _ in range(self.config.epocas):
+            P = _softmax(X @ W + b)
+            G = (P - Y) / n
+            W -= self.config.tasa_aprendizaje * (X.T @ G + self.config.regularizacion * W)
+            b -= self.config.tasa_aprendizaje * G.sum(axis=0)
+        return W, b
+
+    @staticmethod
+    def _calibrar(logits: np.ndarray, y: np.ndarray) -> float:
+        """Busca la temperatura que minimiza la log-verosimilitud negativa."""
+        mejor_t, mejor_nll = 1.0, np.inf
+        for t in np.linspace(0.25, 5.0, 39):
+            P = _softmax(logits / t)
+            nll = -np.mean(np.log(P[np.arange(len(y)), y] + 1e-12))
+            if nll < mejor_nll:
+                mejor_t, mejor_nll = float(t), nll
+        return mejor_t
+
+    def entrenar(self, embeddings: np.ndarray, categorias: List[str]) -> Dict[str, float]:
+        """Entrena la cabeza y calibra su confianza. Retorna métricas de validación."""
+        X = self._preparar(embeddings)
+        y = np.array([CATEGORIAS_PREGUNTA.index(c) for c in categorias], dtype=np.int64)
+        rng = np.random.default_rng(0)
+        orden = rng.permutation(len(y))
+        n_val = int(len(y) * self.config.fraccion_validacion)
+        val, train = orden[:n_val], orden[n_val:]
+
+        W, b = self._ajustar(X[train], y[train])
+        temperatura = 1.0
+        exactitud = float("nan")
+        if n_val >= 10:
+            logits_val = X[val] @ W + b
+            temperatura = self._calibrar(logits_val, y[val])
+            exactitud = float(np.mean(np.argmax(logits_val, axis=1) == y[val]))
+            # Con la calibración hecha, se reentrena con todos los ejemplos
+            W, b = self._ajustar(X, y)
+
+        with self._lock:
+            self.W, self.b, self.temperatura = W, b, temperatura
+        metricas = {"ejemplos": len(y), "exactitud_validacion": exactitud, "temperatura": temperatura}
+        logger.info(f"Clasificador rápido entrenado: {metricas}")
+        return metricas
+
+    def agregar_ejemplo(self, embedding: np.ndarray, categoria: str) -> None:
+        """
+        Registra una pregunta etiquetada por BERT y, cuando se acumulan suficientes
+        ejemplos nuevos, lanza el reentrenamiento en segundo plano: la petición que
+        lo dispara no espera el ajuste. Mientras tanto se sigue usando el modelo actual.
+        """
+        with self._lock:
+            self._X.append(np.asarray(embedding, dtype=np.float32).ravel())
+            self._y.append(CATEGORIAS_PREGUNTA.index(categoria))
+            if len(self._y) > self.config.max_ejemplos:
+                self._X = self._X[-self.config.max_ejemplos:]
+                self._y = self._y[-self.config.max_ejemplos:]
+            self._nuevos += 1
+            if len(self._y) < self.config.min_ejemplos or self._nuevos < self.config.reentrenar_cada:
+                return
+            if self._reentrenando is not None and self._reentrenando.is_alive():
+                return  # Los ejemplos nuevos esperan al siguiente reentrenamiento
+            self._nuevos = 0
+            X = np.stack(self._X)
+            categorias = [CATEGORIAS_PREGUNTA[i] for i in self._y]
+            self._reentrenando = threading.Thread(
+                target=self._reentrenar, args=(X, categorias), name="reentrenar_clasificador", daemon=True
+            )
+            self._reentrenando.start()
+
+    def _reentrenar(self, X: np.ndarray, categorias: List[str]) -> None:
+        try:
+            self.entrenar(X, categorias)
+            self.guardar()
+        except Exception as e:
+            logger.warning(f"Error reentrenando el clasificador rápido: {e}")
+
+    def esperar_reentrenamiento(self, timeout: Optional[float] = None) -> None:
+        """Espera a que termine el reentrenamiento en curso, si lo hay."""
+        hilo = self._reentrenando
+        if hilo is not None:
+            hilo.join(timeout)
+
+    def guardar(self) -> None:
+        if not self.ruta or not self.esta_entrenado():
+            return
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            W, b, temperatura = self.W, self.b, self.temperatura
+            X = np.stack(self._X) if self._X else np.zeros((0, W.shape[0]), dtype=np.float32)
+            y = np.array(self._y, dtype=np.int64)
+        temporal = self.ruta.with_suffix(".tmp")
+        with open(temporal, "wb") as f:
+            np.savez(f, W=W, b=b, temperatura=temperatura, X=X, y=y)
+        os.replace(temporal, self.ruta)
+        logger.debug(f"Clasificador rápido guardado en {self.ruta}")
+
+    def cargar(self) -> None:
+        try:
+            with np.load(self.ruta) as datos:
+                self.W = datos["W"]
+                self.b = datos["b"]
+                self.temperatura = float(datos["temperatura"])
+                self._X = list(datos["X"])
+                self._y = datos["y"].tolist()
+            logger.info(f"Clasificador rápido cargado: {len(self._y)} ejemplos, T={self.temperatura:.2f}")
+        except Exception as e:
+            logger.warning(f"Error al cargar el clasificador rápido: {e}")
@@ -0,0 +1,96 @@
+import logging
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentTokenStore:
+    """
+    Almacén de los fragmentos indexados ya tokenizados con el tokenizer del modelo QA.
+
+    Los ids de tokens (sin tokens especiales) se guardan como arreglos int32 por id de
+    fragmento, junto con un CRC32 del texto para detectar fragmentos que cambiaron.
+    En consulta solo se tokeniza la pregunta y se empalma con estos ids.
+    """
+
+    def __init__(self, tokenizer, ruta: Optional[str] = None):
+        self.tokenizer = tokenizer
+        self.ruta = Path(ruta) if ruta else None
+        self._tokens: Dict[str, np.ndarray] = {}
+        self._crc: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if self.ruta and self.ruta.exists():
+            self.cargar()
+
+    @staticmethod
+    def _crc32(texto: str) -> int:
+        return zlib.crc32(texto.encode("utf-8"))
+
+    def agregar(self, ids: Sequence[str], textos: Sequence[str]) -> None:
+        """Tokeniza un lote de fragmentos y guarda sus ids de tokens."""
+        if not ids:
+            return
+        tokenizados = self.tokenizer(list(textos), add_special_tokens=False)["input_ids"]
+        with self._lock:
+            for fragmento_id, texto, tokens in zip(ids, textos, tokenizados):
+                self._tokens[fragmento_id] = np.asarray(tokens, dtype=np.int32)
+                self._crc[fragmento_id] = self._crc32(texto)
+
+    def obtener(self, fragmento_id: str, texto: str) -> List[int]:
+        """
+        Retorna los ids de tokens del fragmento; si no está almacenado o el texto
+        cambió, lo tokeniza y lo guarda.
+        """
+        with self._lock:
+            tokens = self._tokens.get(fragmento_id)
+            vigente = tokens is not None and self._crc.get(fragmento_id) == self._crc32(texto)
+        if not vigente:
+            self.agregar([fragmento_id], [texto])
+            tokens = self._tokens[fragmento_id]
+        return tokens.tolist()
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._crc.clear()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def guardar(self) -> None:
+        """Guarda todos los fragmentos en un único arreglo concatenado con sus offsets."""
+        if not self.ruta:
+            return
+        with self._lock:
+            ids = list(self._tokens)
+            largos = np.array([len(self._tokens[i]) for i in ids], dtype=np.int64)
+            tokens = np.concatenate([self._tokens[i] for i in ids]) if ids else np.zeros(0, dtype=np.int32)
+            crc = np.array([self._crc[i] for i in ids], dtype=np.uint32)
+        try:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.ruta, "wb") as f:
+                np.savez(f, ids=np.array(ids, dtype=object), offsets=np.cumsum(largos), tokens=tokens, crc=crc)
+            logger.info(f"Fragmentos tokenizados guardados: {len(ids)}")
+        except Exception as e:
+            logger.warning(f"Error al guardar fragmentos tokenizados: {e}")
+
+    def cargar(self) -> None:
+        try:
+            with np.load(self.ruta, allow_pickle=True) as datos:
+                ids = datos["ids"].tolist()
+                finales = datos["offsets"]
+                tokens = datos["tokens"]
+                crc = datos["crc"]
+            inicio = 0
+            for i, fragmento_id in enumerate(ids):
+                self._tokens[fragmento_id] = tokens[inicio:finales[i]]
+                self._crc[fragmento_id] = int(crc[i])
+                inicio = finales[i]
+            logger.info(f"Fragmentos tokenizados cargados: {len(ids)}")
+        except Exception as e:
+            logger.warning(f"Error al cargar fragmentos tokenizados: {e}")
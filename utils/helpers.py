@@ -1,3 +1,7 @@
+import re
+import unicodedata
+
+
 def encontrar_valor_en_linea(linea, posibles_campos, documento):
     """
     Busca el documento en una línea usando posibles nombres de columna
@@ -16,3 +20,26 @@ def extraer_columna_por_encabezado(encabezados, nombres_posibles):
         if encabezado.strip().lower() in [n.lower() for n in nombres_posibles]:
             return i
     return -1
+
+
+# Tabla de plegado de tildes que conserva la longitud del texto
+_TABLA_TILDES = str.maketrans("áéíóúüñàèìòù", "aeiouunaeiou")
+
+
+def plegar_acentos(texto):
+    """
+    Pasa el texto a minúsculas y elimina las tildes carácter a carácter, de modo
+    que las posiciones del texto plegado coinciden con las del original.
+    """
+    return (texto or "").lower().translate(_TABLA_TILDES)
+
+
+def normalizar_pregunta(pregunta):
+    """
+    Normaliza una pregunta para usarla como clave: minúsculas, sin tildes,
+    sin signos de puntuación y con espacios simples.
+    """
+    texto = unicodedata.normalize("NFKD", (pregunta or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SchedulerConfig:
+    """Configuración del planificador de inferencia por lotes."""
+    max_batch_size: int = 8
+    max_wait_ms: float = 5.0
+    concurrencia: int = 1  # Lotes que pueden ejecutarse a la vez por modelo
+
+
+class _ColaModelo:
+    """Cola de solicitudes pendientes de un modelo y su hilo despachador."""
+
+    def __init__(self, nombre: str, funcion_lote: Callable[[List[Any]], List[Any]], config: SchedulerConfig):
+        self.nombre = nombre
+        self.funcion_lote = funcion_lote
+        self.config = config
+        self.pendientes: "queue.Queue" = queue.Queue()
+        self.ejecutor = ThreadPoolExecutor(
+            max_workers=max(1, config.concurrencia),
+            thread_name_prefix=f"lote-{nombre}"
+        )
+        # Mientras todos los lotes están ocupados las solicitudes se acumulan en la cola
+        self.libres = threading.Semaphore(max(1, config.concurrencia))
+        self.lotes = 0
+        self.solicitudes = 0
+        self.hilo = threading.Thread(target=self._despachar, name=f"planificador-{nombre}", daemon=True)
+        self.hilo.start()
+
+    def _despachar(self):
+        """Agrupa solicitudes hasta llenar el lote o agotar la espera máxima."""
+        while True:
+            self.libres.acquire()
+            primero = self.pendientes.get()
+            if primero is None:
+                break
+            lote = [primero]
+            limite = time.monotonic() + self.config.max_wait_ms / 1000
+            while len(lote) < self.config.max_batch_size:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    siguiente = self.pendientes.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    self.pendientes.put(None)
+                    break
+                lote.append(siguiente)
+            self.ejecutor.submit(self._ejecutar_lote, lote)
+
+    def _ejecutar_lote(self, lote: List[tuple]):
+        """Ejecuta un lote y reparte cada resultado a su solicitud."""
+        try:
+            self._procesar_lote(lote)
+        finally:
+            self.libres.release()
+
+    def _procesar_lote(self, lote: List[tuple]):
+        activos = [(entrada, futuro) for entrada, futuro in lote if futuro.set_running_or_notify_cancel()]
+        if not activos:
+            return
+        self.lotes += 1
+        self.solicitudes += len(activos)
+        try:
+            resultados = self.funcion_lote([entrada for entrada, _ in activos])
+            if len(resultados) != len(activos):
+                raise RuntimeError(
+                    f"El modelo '{self.nombre}' retornó {len(resultados)} resultados para {len(activos)} entradas"
+                )
+            for (_, futuro), resultado in zip(activos, resultados):
+                futuro.set_result(resultado)
+        except Exception as e:
+            logger.error(f"Error ejecutando lote de '{self.nombre}' ({len(activos)} solicitudes): {e}")
+            for _, futuro in activos:
+                futuro.set_exception(e)
+
+    def detener(self):
+        self.pendientes.put(None)
+        self.hilo.join(timeout=1)
+        self.ejecutor.shutdown(wait=False)
+
+
+class InferenceScheduler:
+    """
+    Planificador que agrupa solicitudes de inferencia de todas las sesiones.
+
+    Cada modelo registrado tiene su propia cola: las solicitudes que llegan dentro de
+    `max_wait_ms` se agrupan en un lote de hasta `max_batch_size` entradas, se ejecutan
+    en una sola pasada del modelo y el resultado de cada una se entrega a su `Future`.
+    Se puede usar desde hilos (`ejecutar`) o desde corrutinas (`ejecutar_async`).
+    """
+
+    def __init__(self, config: Optional[SchedulerConfig] = None):
+        self.config = config or SchedulerConfig()
+        self._colas: Dict[str, _ColaModelo] = {}
+
+    def registrar_modelo(
+        self,
+        nombre: str,
+        funcion_lote: Callable[[List[Any]], List[Any]],
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        concurrencia: Optional[int] = None
+    ) -> None:
+        """Registra (o reemplaza) la función de inferencia por lotes de un modelo."""
+        config = SchedulerConfig(
+            max_batch_size=max_batch_size or self.config.max_batch_size,
+            max_wait_ms=self.config.max_wait_ms if max_wait_ms is None else max_wait_ms,
+            concurrencia=concurrencia or self.config.concurrencia
+        )
+        anterior = self._colas.pop(nombre, None)
+        if anterior:
+            anterior.detener()
+        self._colas[nombre] = _ColaModelo(nombre, funcion_lote, config)
+        logger.info(
+            f"Modelo '{nombre}' registrado en el planificador "
+            f"(lote máx. {config.max_batch_size}, espera máx. {config.max_wait_ms} ms)"
+        )
+
+    def tiene_modelo(self, nombre: str) -> bool:
+        return nombre in self._colas
+
+    def enviar(self, nombre: str, entrada: Any) -> Future:
+        """Encola una entrada para el modelo indicado y retorna su Future."""
+        if nombre not in self._colas:
+            raise KeyError(f"Modelo no registrado en el planificador: {nombre}")
+        futuro: Future = Future()
+        self._colas[nombre].pendientes.put((entrada, futuro))
+        return futuro
+
+    def ejecutar(self, nombre: str, entrada: Any, timeout: Optional[float] = None) -> Any:
+        """Ejecuta una entrada y espera su resultado (uso desde hilos)."""
+        return self.enviar(nombre, entrada).result(timeout=timeout)
+
+    def ejecutar_varios(self, nombre: str, entradas: List[Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Encola varias entradas a la vez para que compartan lote. Retorna, para cada
+        entrada, su resultado o la excepción producida.
+        """
+        futuros = [self.enviar(nombre, entrada) for entrada in entradas]
+        resultados = []
+        for futuro in futuros:
+            try:
+                resultados.append(futuro.result(timeout=timeout))
+            except Exception as e:
+                resultados.append(e)
+        return resultados
+
+    async def ejecutar_async(self, nombre: str, entrada: Any) -> Any:
+        """Ejecuta una entrada sin bloquear el event loop."""
+        return await asyncio.wrap_future(self.enviar(nombre, entrada))
+
+    def estadisticas(self) -> Dict[str, Dict[str, float]]:
+        """Retorna el tamaño promedio de lote alcanzado por modelo."""
+        return {
+            nombre: {
+                "lotes": cola.lotes,
+                "solicitudes": cola.solicitudes,
+                "tamano_promedio_lote": cola.solicitudes / cola.lotes if cola.lotes else 0.0
+            }
+            for nombre, cola in self._colas.items()
+        }
+
+    def detener(self) -> None:
+        for cola in self._colas.values():
+            cola.detener()
+        self._colas.clear()
@@ -0,0 +1,100 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.helpers import plegar_acentos
+
+
+@dataclass
+class ResultadoRuteo:
+    """Coincidencias de palabras clave de una pregunta, agrupadas por tabla."""
+    grupos: Dict[str, List[str]] = field(default_factory=dict)
+    palabras: List[str] = field(default_factory=list)
+
+    def primer_grupo(self, tabla: str) -> Optional[str]:
+        """Retorna el primer grupo (en el orden de la tabla) con alguna coincidencia."""
+        grupos = self.grupos.get(tabla)
+        return grupos[0] if grupos else None
+
+    def tiene(self, tabla: str, grupo: Optional[str] = None) -> bool:
+        grupos = self.grupos.get(tabla, [])
+        return bool(grupos) if grupo is None else grupo in grupos
+
+
+class KeywordMatcher:
+    """
+    Buscador de múltiples palabras clave compilado en una sola expresión regular.
+
+    Todas las tablas de palabras clave se pliegan (minúsculas, sin tildes) y se
+    combinan en una alternancia ordenada de la más larga a la más corta dentro de un
+    lookahead, de modo que una sola pasada sobre la pregunta encuentra en cada
+    posición la palabra más larga; las palabras más cortas que son prefijo de ella
+    se agregan desde una tabla precalculada. Así se conserva la semántica de
+    subcadena de `keyword in pregunta` con un único recorrido.
+    """
+
+    def __init__(self):
+        # tabla -> lista ordenada de (grupo, [palabras])
+        self._tablas: Dict[str, List[Tuple[str, List[str]]]] = {}
+        self._con_acentos: Dict[str, set] = {}
+        self._patron: Optional[re.Pattern] = None
+        # palabra plegada -> [(tabla, orden_grupo, grupo, palabra exacta o None)]
+        self._destinos: Dict[str, List[Tuple[str, int, str, Optional[str]]]] = {}
+        self._prefijos: Dict[str, List[str]] = {}
+
+    def agregar_tabla(
+        self,
+        nombre: str,
+        grupos: Dict[str, Iterable[str]],
+        respetar_acentos: Iterable[str] = ()
+    ) -> "KeywordMatcher":
+        """
+        Agrega una tabla de palabras clave agrupadas. Los grupos indicados en
+        `respetar_acentos` solo coinciden si las tildes también coinciden (p. ej.
+        "qué" interrogativo frente a "que").
+        """
+        self._tablas[nombre] = [(grupo, list(palabras)) for grupo, palabras in grupos.items()]
+        self._con_acentos[nombre] = set(respetar_acentos)
+        self._compilar()
+        return self
+
+    def _compilar(self):
+        self._destinos = {}
+        for tabla, grupos in self._tablas.items():
+            for orden, (grupo, palabras) in enumerate(grupos):
+                for palabra in palabras:
+                    palabra = palabra.lower()
+                    plegada = plegar_acentos(palabra)
+                    exacta = palabra if grupo in self._con_acentos[tabla] else None
+                    self._destinos.setdefault(plegada, []).append((tabla, orden, grupo, exacta))
+
+        claves = sorted((c for c in self._destinos if c), key=len, reverse=True)
+        self._prefijos = {
+            clave: [otra for otra in claves if otra != clave and clave.startswith(otra)]
+            for clave in claves
+        }
+        self._patron = re.compile("(?=(" + "|".join(re.escape(c) for c in claves) + "))") if claves else None
+
+    def buscar(self, texto: str) -> ResultadoRuteo:
+        """Retorna todas las coincidencias de la pregunta en una sola pasada."""
+        if self._patron is None:
+            return ResultadoRuteo()
+
+        original = (texto or "").lower()
+        plegado = plegar_acentos(texto)
+        encontrados: Dict[str, Dict[int, str]] = {}
+        palabras = []
+        for coincidencia in self._patron.finditer(plegado):
+            inicio = coincidencia.start()
+            larga = coincidencia.group(1)
+            for clave in [larga] + self._prefijos[larga]:
+                for tabla, orden, grupo, exacta in self._destinos[clave]:
+                    if exacta is not None and original[inicio:inicio + len(exacta)] != exacta:
+                        continue
+                    encontrados.setdefault(tabla, {})[orden] = grupo
+                    palabras.append(clave)
+
+        return ResultadoRuteo(
+            grupos={tabla: [grupos[i] for i in sorted(grupos)] for tabla, grupos in encontrados.items()},
+            palabras=list(dict.fromkeys(palabras))
+        )
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopLagMonitor:
+    """
+    Mide el retraso del event loop: una corrutina duerme `intervalo_s` y registra
+    cuánto tarda de más en despertar. Un retraso alto indica que algún trabajo
+    bloqueante se está ejecutando en el loop y congelando las demás sesiones.
+    """
+
+    def __init__(self, intervalo_s: float = 0.1, umbral_ms: float = 50.0, ventana: int = 600):
+        self.intervalo_s = intervalo_s
+        self.umbral_ms = umbral_ms
+        self._retrasos_ms: deque = deque(maxlen=ventana)
+        self._tarea: Optional[asyncio.Task] = None
+
+    async def iniciar(self) -> None:
+        """Inicia la medición en el event loop actual."""
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self._medir())
+            logger.info(f"Monitor de event loop iniciado (umbral {self.umbral_ms} ms)")
+
+    async def detener(self) -> None:
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+
+    async def _medir(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            inicio = loop.time()
+            await asyncio.sleep(self.intervalo_s)
+            retraso_ms = max(0.0, (loop.time() - inicio - self.intervalo_s) * 1000)
+            self._retrasos_ms.append(retraso_ms)
+            if retraso_ms > self.umbral_ms:
+                logger.warning(f"Event loop bloqueado {retraso_ms:.0f} ms (umbral {self.umbral_ms:.0f} ms)")
+
+    def estadisticas(self) -> Dict[str, float]:
+        """Retorna el retraso del loop en la ventana reciente (ms)."""
+        if not self._retrasos_ms:
+            return {"muestras": 0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        retrasos = np.fromiter(self._retrasos_ms, dtype=np.float64)
+        return {
+            "muestras": len(retrasos),
+            "p50_ms": float(np.percentile(retrasos, 50)),
+            "p95_ms": float(np.percentile(retrasos, 95)),
+            "max_ms": float(retrasos.max())
+        }
@@ -0,0 +1,196 @@
+from typing import Any, Dict, List, Sequence, Tuple, Union
+import logging
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+CATEGORIAS_PREGUNTA = ["specific_data", "general_info", "document_qa"]
+
+# Parámetros de generación del modelo T5 finetuneado
+PARAMETROS_GENERACION_T5: Dict[str, Any] = {
+    "min_length": 100,  # Aumentado para respuestas más completas
+    "num_beams": 5,     # Aumentado para mejor calidad
+    "length_penalty": 2.0,  # Aumentado para favorecer respuestas más largas
+    "early_stopping": True,
+    "do_sample": True,  # Habilitado para mejor diversidad
+    "temperature": 0.7,  # Reducido para más coherencia
+    "top_k": 50,        # Ajustado para mejor calidad
+    "top_p": 0.9,       # Ajustado para mejor calidad
+    "repetition_penalty": 1.2,  # Ajustado para evitar repeticiones
+    "no_repeat_ngram_size": 3,
+    "num_return_sequences": 1
+}
+
+
+def clasificar_lote(model, tokenizer, preguntas: Sequence[str], max_length: int = 512) -> List[Tuple[str, float]]:
+    """Clasifica un lote de preguntas con BERT en una sola pasada (con padding)."""
+    inputs = tokenizer(
+        list(preguntas),
+        return_tensors="pt",
+        truncation=True,
+        padding=True,
+        max_length=max_length
+    )
+    with torch.no_grad():
+        outputs = model(**inputs)
+        predictions = torch.softmax(outputs.logits, dim=1)
+        confianzas, indices = torch.max(predictions, dim=1)
+    return [
+        (CATEGORIAS_PREGUNTA[idx], conf)
+        for idx, conf in zip(indices.tolist(), confianzas.tolist())
+    ]
+
+
+def responder_qa_lote(qa_pipeline, entradas: Sequence[Tuple[str, str]], max_answer_len: int = 150) -> List[Dict[str, Any]]:
+    """Ejecuta el pipeline de QA sobre un lote de pares (pregunta, contexto)."""
+    resultados = qa_pipeline(
+        question=[pregunta for pregunta, _ in entradas],
+        context=[contexto for _, contexto in entradas],
+        max_answer_len=max_answer_len,
+        handle_impossible_answer=True,
+        batch_size=len(entradas)
+    )
+    # El pipeline retorna un dict (no una lista) cuando recibe una sola entrada
+    if isinstance(resultados, dict):
+        resultados = [resultados]
+    return list(resultados)
+
+
+def generar_t5_lote(model, tokenizer, prompts: Sequence[str], max_length: int = 512) -> List[str]:
+    """Genera respuestas T5 para un lote de prompts con padding y máscara de atención."""
+    inputs = tokenizer(
+        list(prompts),
+        max_length=max_length,
+        truncation=True,
+        return_tensors="pt",
+        padding=True,
+        add_special_tokens=True
+    )
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_length=min(max_length, 512),
+            forced_bos_token_id=tokenizer.bos_token_id,
+            forced_eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
+            **PARAMETROS_GENERACION_T5
+        )
+    return [texto.strip() for texto in tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+
+
+def _ventanas_contexto(contexto_ids: Sequence[int], largo: int, stride: int) -> List[Tuple[int, List[int]]]:
+    """Divide el contexto en ventanas de `largo` tokens que se solapan en `stride`."""
+    paso = max(1, largo - stride)
+    ventanas = []
+    inicio = 0
+    while True:
+        ventanas.append((inicio, list(contexto_ids[inicio:inicio + largo])))
+        if inicio + largo >= len(contexto_ids):
+            break
+        inicio += paso
+    return ventanas
+
+
+def responder_qa_pretokenizado_lote(
+    model,
+    tokenizer,
+    entradas: Sequence[Tuple[str, Union[str, Sequence[int]]]],
+    max_answer_len: int = 150,
+    max_length: int = 384,
+    stride: int = 128,
+    max_question_len: int = 64
+) -> List[Dict[str, Any]]:
+    """
+    Ejecuta QA extractivo sobre pares (pregunta, ids de tokens del contexto) ya
+    tokenizados al indexar. Solo se tokeniza cada pregunta distinta una vez; los ids
+    del contexto se empalman con los tokens especiales del modelo, se dividen en
+    ventanas y todo el lote se evalúa en una sola pasada. Reproduce la selección de
+    span del pipeline de QA con `handle_impossible_answer=True`. Si un contexto llega
+    como texto se tokeniza aquí.
+    """
+    if not entradas:
+        return []
+    entradas = [
+        (pregunta, tokenizer(contexto, add_special_tokens=False)["input_ids"] if isinstance(contexto, str) else contexto)
+        for pregunta, contexto in entradas
+    ]
+
+    tokens_pregunta: Dict[str, List[int]] = {}
+    for pregunta, _ in entradas:
+        if pregunta not in tokens_pregunta:
+            ids = tokenizer(pregunta, add_special_tokens=False)["input_ids"]
+            tokens_pregunta[pregunta] = ids[:max_question_len]
+
+    usa_token_type = "token_type_ids" in getattr(tokenizer, "model_input_names", [])
+    cls_id = tokenizer.cls_token_id
+    secuencias, tipos, ventanas = [], [], []
+    for indice, (pregunta, contexto_ids) in enumerate(entradas):
+        q_ids = tokens_pregunta[pregunta]
+        disponible = max_length - len(q_ids) - tokenizer.num_special_tokens_to_add(pair=True)
+        for inicio, ctx in _ventanas_contexto(contexto_ids, max(1, disponible), stride):
+            secuencia = tokenizer.build_inputs_with_special_tokens(q_ids, ctx)
+            especiales = tokenizer.get_special_tokens_mask(q_ids, ctx)
+            posiciones = [i for i, especial in enumerate(especiales) if not especial]
+            posiciones_ctx = posiciones[len(q_ids):len(q_ids) + len(ctx)]
+            secuencias.append(secuencia)
+            if usa_token_type:
+                tipos.append(tokenizer.create_token_type_ids_from_sequences(q_ids, ctx))
+            posicion_cls = secuencia.index(cls_id) if cls_id is not None and cls_id in secuencia else 0
+            ventanas.append((indice, ctx, posiciones_ctx, posicion_cls))
+
+    largo = max(len(s) for s in secuencias)
+    pad_id = tokenizer.pad_token_id or 0
+    input_ids = torch.full((len(secuencias), largo), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(secuencias), largo), dtype=torch.long)
+    for fila, secuencia in enumerate(secuencias):
+        input_ids[fila, :len(secuencia)] = torch.tensor(secuencia, dtype=torch.long)
+        attention_mask[fila, :len(secuencia)] = 1
+    inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if usa_token_type:
+        token_type_ids = torch.zeros((len(secuencias), largo), dtype=torch.long)
+        for fila, tipo in enumerate(tipos):
+            token_type_ids[fila, :len(tipo)] = torch.tensor(tipo, dtype=torch.long)
+        inputs["token_type_ids"] = token_type_ids
+
+    with torch.no_grad():
+        outputs = model(**inputs)
+    logits_inicio = outputs.start_logits.float()
+    logits_fin = outputs.end_logits.float()
+
+    # Por entrada: mejor span entre ventanas y menor puntaje de "sin respuesta"
+    mejores: Dict[int, Tuple[float, str]] = {}
+    nulos: Dict[int, float] = {}
+    for fila, (indice, ctx, posiciones_ctx, posicion_cls) in enumerate(ventanas):
+        permitidas = torch.zeros(largo, dtype=torch.bool)
+        permitidas[posiciones_ctx] = True
+        permitidas[posicion_cls] = True
+        p_inicio = torch.softmax(logits_inicio[fila].masked_fill(~permitidas, float("-inf")), dim=-1)
+        p_fin = torch.softmax(logits_fin[fila].masked_fill(~permitidas, float("-inf")), dim=-1)
+
+        nulo = float(p_inicio[posicion_cls] * p_fin[posicion_cls])
+        nulos[indice] = min(nulos.get(indice, nulo), nulo)
+
+        if not posiciones_ctx:
+            continue
+        s_ctx = p_inicio[posiciones_ctx]
+        e_ctx = p_fin[posiciones_ctx]
+        candidatos = torch.triu(torch.outer(s_ctx, e_ctx))
+        candidatos = torch.tril(candidatos, diagonal=max_answer_len - 1)
+        mejor = int(torch.argmax(candidatos))
+        inicio, fin = divmod(mejor, candidatos.shape[1])
+        puntaje = float(candidatos[inicio, fin])
+        if indice not in mejores or puntaje > mejores[indice][0]:
+            respuesta = tokenizer.decode(ctx[inicio:fin + 1], skip_special_tokens=True).strip()
+            mejores[indice] = (puntaje, respuesta)
+
+    resultados = []
+    for indice in range(len(entradas)):
+        puntaje, respuesta = mejores.get(indice, (0.0, ""))
+        nulo = nulos.get(indice, 0.0)
+        if nulo > puntaje:
+            resultados.append({"answer": "", "score": nulo})
+        else:
+            resultados.append({"answer": respuesta, "score": puntaje})
+    return resultados
@@ -0,0 +1,88 @@
+import logging
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.helpers import plegar_acentos
+
+logger = logging.getLogger(__name__)
+
+_PATRON_PALABRAS = re.compile(r"\w+")
+# Primo mayor que 2**32: las permutaciones (a·x + b) mod P de hashes de 32 bits no desbordan uint64
+_PRIMO = np.uint64(4294967311)
+
+
+class DetectorDuplicados:
+    """
+    Detector de fragmentos casi duplicados con firmas MinHash y buckets LSH.
+
+    Cada fragmento se representa por sus shingles de `tamano_shingle` palabras
+    (minúsculas, sin tildes). La firma MinHash estima la similitud de Jaccard entre
+    dos fragmentos, y las bandas LSH limitan la comparación a los fragmentos que
+    comparten al menos una banda completa de la firma. Un fragmento es duplicado
+    del primer canónico cuya similitud estimada alcanza `umbral`.
+    """
+
+    def __init__(
+        self,
+        umbral: float = 0.85,
+        permutaciones: int = 128,
+        bandas: int = 16,
+        tamano_shingle: int = 3,
+        semilla: int = 0
+    ):
+        if permutaciones % bandas:
+            raise ValueError(f"Las permutaciones ({permutaciones}) deben repartirse en {bandas} bandas iguales")
+        self.umbral = umbral
+        self.bandas = bandas
+        self.filas = permutaciones // bandas
+        self.tamano_shingle = tamano_shingle
+        rng = np.random.default_rng(semilla)
+        self._a = rng.integers(1, 2 ** 31, permutaciones, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, 2 ** 31, permutaciones, dtype=np.uint64)[:, None]
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self._firmas: List[np.ndarray] = []
+        self._claves: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._claves)
+
+    def _shingles(self, texto: str) -> np.ndarray:
+        palabras = _PATRON_PALABRAS.findall(plegar_acentos(texto))
+        n = self.tamano_shingle
+        grupos = [" ".join(palabras[i:i + n]) for i in range(max(1, len(palabras) - n + 1))]
+        return np.unique(np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for g in grupos), dtype=np.uint64, count=len(grupos)
+        ))
+
+    def firma(self, texto: str) -> np.ndarray:
+        """Firma MinHash del texto: el mínimo de cada permutación sobre sus shingles."""
+        return ((self._a * self._shingles(texto)[None, :] + self._b) % _PRIMO).min(axis=1)
+
+    def _bandas(self, firma: np.ndarray):
+        for banda in range(self.bandas):
+            yield banda, firma[banda * self.filas:(banda + 1) * self.filas].tobytes()
+
+    def canonico(self, texto: str, clave: str) -> Optional[str]:
+        """
+        Retorna la clave del canónico del que `texto` es casi duplicado, o None si no
+        lo es; en ese caso el texto queda registrado como canónico con `clave`.
+        """
+        firma = self.firma(texto)
+        candidatos = {i for llave in self._bandas(firma) for i in self._buckets.get(llave, ())}
+        mejor, similitud_mejor = None, 0.0
+        for i in sorted(candidatos):
+            similitud = float(np.mean(self._firmas[i] == firma))
+            if similitud > similitud_mejor:
+                mejor, similitud_mejor = i, similitud
+        if mejor is not None and similitud_mejor >= self.umbral:
+            return self._claves[mejor]
+
+        posicion = len(self._claves)
+        self._firmas.append(firma)
+        self._claves.append(clave)
+        for llave in self._bandas(firma):
+            self._buckets.setdefault(llave, []).append(posicion)
+        return None
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from bs4 import BeautifulSoup
+
+from utils.embedding_index import DocumentIndexer, IndexConfig
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES_NORMATIVA = (".html", ".htm", ".txt", ".docx")
+
+
+@dataclass
+class NormativaLocalConfig:
+    """Configuración del espejo local de normativa laboral."""
+    directorio: str = "normativa_local"
+    collection_name: str = "normativa_mintrabajo"
+    cache_dir: str = ".embedding_cache_normativa"
+    # Perfil de fragmentación: artículos cortos, con poco solapamiento
+    chunk_size: int = 6
+    chunk_overlap: int = 1
+    min_chunk_words: int = 8
+    max_chunk_words: int = 200
+    min_similarity_threshold: float = 0.45
+
+
+def extraer_texto_html(html: str) -> str:
+    """Extrae el texto de párrafos, listas y títulos, sin scripts ni navegación."""
+    soup = BeautifulSoup(html, "html.parser")
+    for etiqueta in soup(["script", "style", "nav", "header", "footer", "form", "noscript"]):
+        etiqueta.decompose()
+    bloques = [
+        elemento.get_text(" ", strip=True)
+        for elemento in soup.find_all(["h1", "h2", "h3", "p", "li"])
+    ]
+    # Un bloque por párrafo para que el fragmentador respete los límites
+    return "\n\n".join(bloque for bloque in bloques if bloque)
+
+
+def leer_documento_normativa(ruta: Path) -> str:
+    """Lee un documento de normativa: HTML, texto extraído de PDF o DOCX."""
+    extension = ruta.suffix.lower()
+    if extension in (".html", ".htm"):
+        return extraer_texto_html(ruta.read_text(encoding="utf-8", errors="ignore"))
+    if extension == ".docx":
+        from utils.cache_loader import extraer_lineas_docx
+        return "\n\n".join(extraer_lineas_docx(str(ruta)))
+    return ruta.read_text(encoding="utf-8", errors="ignore")
+
+
+def escanear_normativa(directorio: Path) -> Dict[str, Tuple[Path, str]]:
+    """Retorna, por ruta relativa, cada archivo de normativa del directorio y su huella SHA-1."""
+    actuales = {}
+    for ruta in sorted(directorio.rglob("*")):
+        if ruta.is_file() and ruta.suffix.lower() in EXTENSIONES_NORMATIVA:
+            huella = hashlib.sha1(ruta.read_bytes()).hexdigest()
+            actuales[str(ruta.relative_to(directorio))] = (ruta, huella)
+    return actuales
+
+
+class NormativaLocal:
+    """
+    Espejo local de la normativa laboral indexado en su propia colección. Los
+    archivos del directorio se indexan de forma incremental: solo se reprocesan los
+    que cambiaron, y se eliminan los fragmentos de los que ya no existen.
+    """
+
+    def __init__(self, config: Optional[NormativaLocalConfig] = None, modelo_embeddings=None):
+        self.config = config or NormativaLocalConfig()
+        self.indexer = DocumentIndexer(
+            IndexConfig(
+                collection_name=self.config.collection_name,
+                cache_dir=self.config.cache_dir,
+                chunk_size=self.config.chunk_size,
+                chunk_overlap=self.config.chunk_overlap,
+                min_chunk_words=self.config.min_chunk_words,
+                max_chunk_words=self.config.max_chunk_words,
+                min_similarity_threshold=self.config.min_similarity_threshold,
+                include_training_data=False,
+                origenes_busqueda=None
+            ),
+            modelo_embeddings=modelo_embeddings
+        )
+        self._ruta_manifiesto = Path(self.config.cache_dir) / "manifiesto_normativa.json"
+        self._manifiesto: Dict[str, str] = self._cargar_manifiesto()
+        if self._manifiesto and self.indexer.total_fragmentos() == 0:
+            # El índice se perdió o cambió de formato: se reindexa todo
+            logger.info("El índice de normativa está vacío; se reindexarán todos los archivos")
+            self._manifiesto = {}
+        if self._manifiesto:
+            self.indexer.indexacion_completa = True
+
+    def _cargar_manifiesto(self) -> Dict[str, str]:
+        if self._ruta_manifiesto.exists():
+            try:
+                with open(self._ruta_manifiesto, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Manifiesto de normativa ilegible, se reindexará todo: {e}")
+        return {}
+
+    def _guardar_manifiesto(self, manifiesto: Dict[str, str]):
+        temporal = self._ruta_manifiesto.with_suffix(".tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, self._ruta_manifiesto)
+
+    async def sincronizar(self) -> Dict[str, int]:
+        """
+        Indexa los archivos nuevos o modificados del directorio y retira los
+        eliminados. Retorna cuántos archivos se agregaron, actualizaron y retiraron.
+        La lectura de archivos y las escrituras del índice corren en el executor
+        para no bloquear el event loop de la aplicación.
+        """
+        loop = asyncio.get_running_loop()
+        directorio = Path(self.config.directorio)
+        if not directorio.is_dir():
+            logger.warning(f"No existe el directorio de normativa: {directorio}")
+            return {"agregados": 0, "actualizados": 0, "retirados": 0}
+
+        actuales = await loop.run_in_executor(None, escanear_normativa, directorio)
+
+        resumen = {"agregados": 0, "actualizados": 0, "retirados": 0}
+        for nombre in [n for n in self._manifiesto if n not in actuales]:
+            await loop.run_in_executor(None, self.indexer.eliminar_origen, nombre)
+            del self._manifiesto[nombre]
+            resumen["retirados"] += 1
+            logger.info(f"Normativa retirada: {nombre}")
+
+        for nombre, (ruta, huella) in actuales.items():
+            anterior = self._manifiesto.get(nombre)
+            if anterior == huella:
+                continue
+            try:
+                texto = await loop.run_in_executor(None, leer_documento_normativa, ruta)
+            except Exception as e:
+                logger.error(f"No se pudo leer {ruta}: {e}")
+                continue
+            if anterior is not None:
+                await loop.run_in_executor(None, self.indexer.eliminar_origen, nombre)
+            await self.indexer.indexar_documentos({nombre: texto})
+            self._manifiesto[nombre] = huella
+            resumen["actualizados" if anterior else "agregados"] += 1
+            await loop.run_in_executor(None, self._guardar_manifiesto, dict(self._manifiesto))
+
+        await loop.run_in_executor(None, self._guardar_manifiesto, dict(self._manifiesto))
+        if resumen["retirados"]:
+            await loop.run_in_executor(None, self.indexer.guardar_indices)
+        self.indexer.indexacion_completa = bool(self._manifiesto)
+        logger.info(f"Normativa local sincronizada: {resumen}, {len(self._manifiesto)} archivos indexados")
+        return resumen
+
+    def buscar(self, pregunta: str, top_k: int = 3, embedding_consulta: Optional[np.ndarray] = None) -> List[Dict]:
+        """Retorna los fragmentos de normativa más relevantes para la pregunta."""
+        if not self.indexer.esta_indexacion_completa():
+            return []
+        return self.indexer.buscar_fragmentos(pregunta, top_k=top_k, embedding_consulta=embedding_consulta)
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Indexa el espejo local de normativa laboral")
+    parser.add_argument("--directorio", default=NormativaLocalConfig.directorio)
+    parser.add_argument("--vigilar", type=float, default=0,
+                        help="Segundos entre sincronizaciones; 0 sincroniza una sola vez")
+    args = parser.parse_args()
+
+    normativa = NormativaLocal(NormativaLocalConfig(directorio=args.directorio))
+    await normativa.sincronizar()
+    while args.vigilar > 0:
+        await asyncio.sleep(args.vigilar)
+        await normativa.sincronizar()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
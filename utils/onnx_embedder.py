@@ -0,0 +1,242 @@
+import inspect
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS_EMBEDDINGS = ("torch", "onnx", "onnx_int8")
+
+# Oraciones con las que se comprueba la equivalencia al exportar
+ORACIONES_VERIFICACION = [
+    "¿Cuántos días de vacaciones me corresponden por año trabajado?",
+    "La prima de servicios se paga en junio y en diciembre.",
+    "El reglamento interno de trabajo establece el horario de la jornada laboral.",
+    "¿Cómo solicito un certificado laboral?",
+    "Las horas extra nocturnas tienen un recargo sobre el valor de la hora ordinaria.",
+    "El auxilio de transporte se liquida junto con el salario mensual.",
+    "Incapacidad",
+    "Procedimiento de liquidación de nómina para contratistas y empleados de planta con novedades del periodo.",
+]
+
+
+def _agrupar(salida: np.ndarray, mascara: np.ndarray, pooling: str) -> np.ndarray:
+    """Pooling de sentence-transformers sobre la salida del transformer (lote, tokens, dimensión)."""
+    if pooling == "cls":
+        return salida[:, 0]
+    # Media de los tokens reales: el padding no cuenta
+    mascara = mascara[..., None].astype(salida.dtype)
+    return (salida * mascara).sum(axis=1) / np.clip(mascara.sum(axis=1), 1e-9, None)
+
+
+def _normalizar(vectores: np.ndarray) -> np.ndarray:
+    return vectores / np.maximum(np.linalg.norm(vectores, axis=1, keepdims=True), 1e-12)
+
+
+def similitudes_coseno(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return _normalizar(a) @ _normalizar(b).T
+
+
+def verificar_equivalencia(referencia, candidato, textos: Sequence[str] = ORACIONES_VERIFICACION) -> Dict[str, float]:
+    """
+    Compara dos modelos de embeddings sobre los mismos textos: coseno entre el
+    embedding de referencia y el del candidato para cada texto, y diferencia máxima
+    entre sus matrices de similitud texto-texto (lo que realmente usa la búsqueda).
+    """
+    textos = list(textos)
+    ref = np.asarray(referencia.encode(textos, convert_to_numpy=True), dtype=np.float32)
+    cand = np.asarray(candidato.encode(textos, convert_to_numpy=True), dtype=np.float32)
+    por_texto = np.sum(_normalizar(ref) * _normalizar(cand), axis=1)
+    diferencia = np.abs(similitudes_coseno(ref, ref) - similitudes_coseno(cand, cand))
+    return {
+        "coseno_minimo": round(float(por_texto.min()), 5),
+        "coseno_medio": round(float(por_texto.mean()), 5),
+        "diferencia_similitud_maxima": round(float(diferencia.max()), 5),
+    }
+
+
+class EmbedderONNX:
+    """
+    Modelo de embeddings de oraciones exportado a ONNX, con la misma interfaz que
+    usa el indexador de `SentenceTransformer` (`encode` y
+    `get_sentence_embedding_dimension`). El pooling (media de los tokens o CLS) y la
+    normalización se aplican con NumPy sobre la salida del transformer, por lo que
+    la inferencia no necesita torch.
+    """
+
+    def __init__(
+        self,
+        directorio: str,
+        cuantizado: bool = False,
+        providers: Optional[List[str]] = None,
+        configuracion: Optional[Dict] = None
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.backend = "onnx_int8" if cuantizado else "onnx"
+        self.directorio = Path(directorio)
+        # Durante la exportación la configuración aún no está en disco
+        self.configuracion = configuracion or json.loads((self.directorio / "embedder.json").read_text(encoding="utf-8"))
+        self.pooling = self.configuracion["pooling"]
+        self.normalizar = self.configuracion["normalizar"]
+        self.max_seq_length = self.configuracion["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.directorio), use_fast=True)
+
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        archivo = self.directorio / ("model_int8.onnx" if cuantizado else "model.onnx")
+        self.sesion = ort.InferenceSession(
+            str(archivo), sess_options=opciones, providers=providers or ["CPUExecutionProvider"]
+        )
+        self._entradas = [entrada.name for entrada in self.sesion.get_inputs()]
+        logger.info(f"Modelo de embeddings ONNX cargado: {archivo.name} ({self.configuracion['modelo']})")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.configuracion["dimension"]
+
+    def _codificar_lote(self, textos: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(
+            textos,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        entradas = {nombre: tokens[nombre].astype(np.int64) for nombre in self._entradas if nombre in tokens}
+        salida = self.sesion.run(None, entradas)[0]
+        return _agrupar(salida, tokens["attention_mask"], self.pooling)
+
+    def encode(
+        self,
+        textos: Union[str, Sequence[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False
+    ) -> np.ndarray:
+        """Codifica uno o varios textos; retorna float32 con la forma de `SentenceTransformer.encode`."""
+        unico = isinstance(textos, str)
+        textos = [textos] if unico else list(textos)
+        if not textos:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Lotes de textos de longitud parecida para minimizar el padding
+        orden = np.argsort([len(t) for t in textos], kind="stable")
+        vectores = np.empty((len(textos), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for inicio in range(0, len(textos), batch_size):
+            indices = orden[inicio:inicio + batch_size]
+            vectores[indices] = self._codificar_lote([textos[i] for i in indices])
+
+        if self.normalizar or normalize_embeddings:
+            vectores /= np.maximum(np.linalg.norm(vectores, axis=1, keepdims=True), 1e-12)
+        return vectores[0] if unico else vectores
+
+    @staticmethod
+    def exportar(
+        model_name: str,
+        directorio: str,
+        cache_folder: Optional[str] = None,
+        opset: int = 14
+    ) -> Dict:
+        """
+        Exporta el transformer de un modelo de sentence-transformers a ONNX (float32
+        y cuantizado dinámicamente a int8) junto con su tokenizer y su configuración
+        de pooling. Verifica la equivalencia de ambos modelos con el original y la
+        guarda en `embedder.json`, que se escribe al final: un directorio sin ese
+        archivo es una exportación incompleta. Requiere torch, sentence-transformers
+        y onnxruntime.
+        """
+        import torch
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        from sentence_transformers import SentenceTransformer
+
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        original = SentenceTransformer(model_name, device="cpu", cache_folder=cache_folder)
+        transformer = original[0].auto_model.eval()
+        tokenizer = original.tokenizer
+
+        pooling = original[1].get_pooling_mode_str()
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Pooling '{pooling}' de {model_name} no soportado por el embedder ONNX")
+
+        ejemplo = tokenizer(["Texto de ejemplo para exportar"], return_tensors="pt")
+        # Las entradas del grafo siguen el orden de los parámetros de forward, no el del tokenizer
+        nombres = [nombre for nombre in inspect.signature(transformer.forward).parameters if nombre in ejemplo]
+        ejes = {nombre: {0: "lote", 1: "secuencia"} for nombre in nombres}
+        ejes["last_hidden_state"] = {0: "lote", 1: "secuencia"}
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer,
+                ({nombre: ejemplo[nombre] for nombre in nombres},),
+                str(directorio / "model.onnx"),
+                input_names=nombres,
+                output_names=["last_hidden_state"],
+                dynamic_axes=ejes,
+                opset_version=opset,
+                do_constant_folding=True
+            )
+        quantize_dynamic(
+            str(directorio / "model.onnx"), str(directorio / "model_int8.onnx"), weight_type=QuantType.QInt8
+        )
+        tokenizer.save_pretrained(str(directorio))
+
+        configuracion = {
+            "modelo": model_name,
+            "pooling": pooling,
+            "normalizar": any(type(modulo).__name__ == "Normalize" for modulo in original),
+            "max_seq_length": original.max_seq_length,
+            "dimension": original.get_sentence_embedding_dimension(),
+        }
+        verificaciones = {}
+        for cuantizado in (False, True):
+            clave = "equivalencia_int8" if cuantizado else "equivalencia"
+            exportado = EmbedderONNX(str(directorio), cuantizado, configuracion=configuracion)
+            verificaciones[clave] = verificar_equivalencia(original, exportado)
+            logger.info(f"Modelo ONNX{' int8' if cuantizado else ''} frente a torch: {verificaciones[clave]}")
+        configuracion.update(verificaciones)
+
+        temporal = directorio / "embedder.json.tmp"
+        temporal.write_text(json.dumps(configuracion, indent=2), encoding="utf-8")
+        os.replace(temporal, directorio / "embedder.json")
+        return configuracion
+
+    @classmethod
+    def cargar_o_exportar(
+        cls,
+        model_name: str,
+        directorio: str,
+        cuantizado: bool = False,
+        providers: Optional[List[str]] = None,
+        cache_folder: Optional[str] = None,
+        coseno_minimo: float = 0.99
+    ) -> "EmbedderONNX":
+        """
+        Abre el modelo exportado en `directorio`, exportándolo la primera vez (o de
+        nuevo si la exportación guardada no tiene verificación de equivalencia). Lanza
+        `ValueError` si el coseno mínimo con el original quedó por debajo de
+        `coseno_minimo`: esos embeddings no serían intercambiables con los de torch
+        (el indexador vuelve entonces a torch).
+        """
+        clave = "equivalencia_int8" if cuantizado else "equivalencia"
+        ruta = Path(directorio) / "embedder.json"
+        if not ruta.exists():
+            logger.info(f"Exportando {model_name} a ONNX en {directorio}")
+            cls.exportar(model_name, directorio, cache_folder=cache_folder)
+        elif clave not in json.loads(ruta.read_text(encoding="utf-8")):
+            logger.warning(f"La exportación ONNX de {directorio} no está verificada; se exporta de nuevo")
+            cls.exportar(model_name, directorio, cache_folder=cache_folder)
+        embedder = cls(directorio, cuantizado, providers)
+        nombre = f"ONNX{' int8' if cuantizado else ''}"
+        verificacion = embedder.configuracion[clave]
+        if verificacion["coseno_minimo"] < coseno_minimo:
+            raise ValueError(
+                f"El modelo {nombre} se aparta del original "
+                f"(coseno mínimo {verificacion['coseno_minimo']:.4f} < {coseno_minimo})"
+            )
+        return embedder
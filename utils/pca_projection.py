@@ -0,0 +1,80 @@
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ProyeccionPCA:
+    """
+    Proyección PCA de embeddings a menos dimensiones, ajustada sobre los fragmentos
+    del corpus. Los vectores se proyectan sobre las componentes principales y se
+    vuelven a normalizar, de modo que la similitud de coseno de la colección sigue
+    siendo válida. La proyección no centra los vectores: restar la media desplaza
+    todos los cosenos y los umbrales absolutos de similitud del indexador (ajustados
+    para el modelo completo) dejarían fuera fragmentos relevantes. Documentos y
+    consultas deben pasar por la misma proyección, que se guarda junto a la versión
+    del índice.
+    """
+
+    def __init__(self, media: np.ndarray, componentes: np.ndarray, varianza_explicada: float = 0.0):
+        self.media = media.astype(np.float32)
+        self.componentes = componentes.astype(np.float32)  # (dimension, dimension_original)
+        self.varianza_explicada = varianza_explicada
+
+    @property
+    def dimension(self) -> int:
+        return self.componentes.shape[0]
+
+    @property
+    def dimension_original(self) -> int:
+        return self.componentes.shape[1]
+
+    @classmethod
+    def ajustar(cls, vectores: np.ndarray, dimension: int, max_muestras: int = 50_000, semilla: int = 0) -> "ProyeccionPCA":
+        """Ajusta la proyección sobre (una muestra de) los vectores."""
+        matriz = np.asarray(vectores, dtype=np.float32)
+        if len(matriz) > max_muestras:
+            matriz = matriz[np.random.default_rng(semilla).choice(len(matriz), max_muestras, replace=False)]
+        if dimension >= matriz.shape[1] or dimension > len(matriz):
+            raise ValueError(
+                f"PCA a {dimension} dimensiones requiere menos dimensiones que {matriz.shape[1]} "
+                f"y al menos {dimension} vectores (hay {len(matriz)})"
+            )
+        # Sin centrar: las componentes conservan la dirección media y con ella la escala de los cosenos
+        media = np.zeros(matriz.shape[1], dtype=np.float32)
+        _, valores, componentes = np.linalg.svd(matriz, full_matrices=False)
+        varianza = valores ** 2
+        explicada = float(varianza[:dimension].sum() / max(varianza.sum(), 1e-12))
+        logger.info(f"PCA ajustado: {matriz.shape[1]} -> {dimension} dimensiones, varianza explicada {explicada:.1%}")
+        return cls(media, componentes[:dimension], explicada)
+
+    def proyectar(self, vectores) -> np.ndarray:
+        """Proyecta uno o varios vectores; retorna float32 normalizado con la misma forma de entrada."""
+        matriz = np.asarray(vectores, dtype=np.float32)
+        unico = matriz.ndim == 1
+        proyectados = (np.atleast_2d(matriz) - self.media) @ self.componentes.T
+        proyectados /= np.maximum(np.linalg.norm(proyectados, axis=1, keepdims=True), 1e-12)
+        return proyectados[0] if unico else proyectados
+
+    def guardar(self, ruta: str) -> None:
+        ruta = Path(ruta)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = ruta.with_suffix(".tmp.npz")
+        np.savez(temporal, media=self.media, componentes=self.componentes, varianza_explicada=self.varianza_explicada)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> Optional["ProyeccionPCA"]:
+        """Carga la proyección guardada, o None si no existe o es ilegible."""
+        if not Path(ruta).exists():
+            return None
+        try:
+            with np.load(ruta) as datos:
+                return cls(datos["media"], datos["componentes"], float(datos["varianza_explicada"]))
+        except Exception as e:
+            logger.warning(f"Proyección PCA ilegible en {ruta}: {e}")
+            return None
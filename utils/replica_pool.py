@@ -0,0 +1,361 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Tipos de datos de safetensors soportados
+_DTYPES_SAFETENSORS = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def cargar_state_dict_mmap(ruta: str) -> Dict[str, torch.Tensor]:
+    """
+    Abre un archivo .safetensors como memoria mapeada (MAP_PRIVATE) y retorna sus
+    tensores sin copiarlos. Los procesos que mapean el mismo archivo comparten las
+    páginas físicas a través del page cache del sistema operativo.
+
+    Un tensor cuyo inicio en el archivo no es múltiplo del tamaño de su elemento no
+    se puede expresar como vista del almacenamiento; ese tensor se toma de una copia
+    privada cargada con `safetensors.torch.load_file`.
+    """
+    ruta = str(ruta)
+    with open(ruta, "rb") as f:
+        largo_encabezado = int.from_bytes(f.read(8), "little")
+        encabezado = json.loads(f.read(largo_encabezado))
+    inicio_datos = 8 + largo_encabezado
+    almacenamiento = torch.UntypedStorage.from_file(ruta, shared=False, nbytes=os.path.getsize(ruta))
+
+    tensores = {}
+    copia_privada = None
+    for nombre, info in encabezado.items():
+        if nombre == "__metadata__":
+            continue
+        dtype = _DTYPES_SAFETENSORS[info["dtype"]]
+        inicio, _ = info["data_offsets"]
+        tamano_elemento = torch.empty((), dtype=dtype).element_size()
+        if (inicio_datos + inicio) % tamano_elemento:
+            if copia_privada is None:
+                from safetensors.torch import load_file
+
+                logger.warning(f"{ruta} tiene tensores desalineados; se cargan en memoria privada")
+                copia_privada = load_file(ruta)
+            tensores[nombre] = copia_privada[nombre]
+            continue
+        tensor = torch.empty(0, dtype=dtype)
+        tensor.set_(almacenamiento, (inicio_datos + inicio) // tamano_elemento, info["shape"])
+        tensores[nombre] = tensor
+    return tensores
+
+
+def compartir_pesos(model: torch.nn.Module, ruta_safetensors: str) -> int:
+    """
+    Reemplaza los pesos del modelo por los tensores mapeados del archivo, liberando
+    la copia privada creada por `from_pretrained`. Retorna el número de tensores
+    reemplazados.
+    """
+    if not Path(ruta_safetensors).exists():
+        logger.warning(f"No existe {ruta_safetensors}; el modelo usará memoria privada")
+        return 0
+
+    mapeados = cargar_state_dict_mmap(ruta_safetensors)
+    prefijo = getattr(model, "base_model_prefix", "")
+    reemplazados = 0
+    with torch.no_grad():
+        destinos = itertools.chain(
+            model.named_parameters(remove_duplicate=False),
+            model.named_buffers(remove_duplicate=False)
+        )
+        for nombre, destino in destinos:
+            origen = mapeados.get(nombre)
+            if origen is None and prefijo and nombre.startswith(prefijo + "."):
+                origen = mapeados.get(nombre[len(prefijo) + 1:])
+            if origen is None or origen.shape != destino.shape or origen.dtype != destino.dtype:
+                continue
+            destino.data = origen
+            reemplazados += 1
+    return reemplazados
+
+
+def _proceso_replica(indice, nucleos, hilos, modelo_dir, max_length, entrada, salida):
+    """Proceso de una réplica: carga los modelos con pesos compartidos y atiende lotes."""
+    from transformers import (
+        T5ForConditionalGeneration,
+        T5Tokenizer,
+        AutoModelForSequenceClassification,
+        AutoTokenizer,
+        pipeline as hf_pipeline,
+    )
+    from utils.model_inference import clasificar_lote, responder_qa_pretokenizado_lote, generar_t5_lote
+
+    try:
+        if nucleos and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, nucleos)
+        torch.set_num_threads(hilos)
+
+        bert_dir = os.path.join(modelo_dir, "bert_model")
+        model_t5 = T5ForConditionalGeneration.from_pretrained(
+            modelo_dir, torch_dtype=torch.float32, local_files_only=True, low_cpu_mem_usage=True
+        )
+        tokenizer_t5 = T5Tokenizer.from_pretrained(modelo_dir, local_files_only=True, model_max_length=max_length)
+        if not tokenizer_t5.bos_token_id:
+            tokenizer_t5.bos_token_id = tokenizer_t5.pad_token_id
+        if not tokenizer_t5.eos_token_id:
+            tokenizer_t5.eos_token_id = tokenizer_t5.pad_token_id
+        bert_model = AutoModelForSequenceClassification.from_pretrained(
+            bert_dir, num_labels=3, torch_dtype=torch.float32, low_cpu_mem_usage=True
+        )
+        bert_tokenizer = AutoTokenizer.from_pretrained(bert_dir, use_fast=True)
+        qa_pipeline = hf_pipeline(
+            "question-answering", model=modelo_dir, tokenizer=modelo_dir, framework="pt", device=-1
+        )
+
+        compartidos = (
+            compartir_pesos(model_t5, os.path.join(modelo_dir, "model.safetensors")) +
+            compartir_pesos(bert_model, os.path.join(bert_dir, "model.safetensors")) +
+            compartir_pesos(qa_pipeline.model, os.path.join(modelo_dir, "model.safetensors"))
+        )
+        for modelo in (model_t5, bert_model, qa_pipeline.model):
+            modelo.eval()
+
+        tareas = {
+            "clasificador": lambda lote: clasificar_lote(bert_model, bert_tokenizer, lote),
+            "qa": lambda lote: responder_qa_pretokenizado_lote(
+                qa_pipeline.model, qa_pipeline.tokenizer, lote, max_answer_len=150
+            ),
+            "t5": lambda lote: generar_t5_lote(model_t5, tokenizer_t5, lote, max_length),
+        }
+        salida.put((None, indice, True, f"{compartidos} tensores en memoria compartida"))
+    except Exception as e:
+        salida.put((None, indice, False, f"Error cargando réplica: {e}"))
+        return
+
+    while True:
+        mensaje = entrada.get()
+        if mensaje is None:
+            break
+        solicitud_id, tarea, lote = mensaje
+        try:
+            salida.put((solicitud_id, indice, True, tareas[tarea](lote)))
+        except Exception as e:
+            salida.put((solicitud_id, indice, False, f"{type(e).__name__}: {e}"))
+
+
+class ReplicaPool:
+    """
+    Pool de procesos de inferencia. Cada réplica se fija a un subconjunto de núcleos
+    con su propio número de hilos intra-op y carga T5, BERT y QA sobre los archivos
+    safetensors mapeados en memoria, de modo que la RAM no se multiplica por réplica.
+    Las solicitudes se envían por colas de multiprocessing a la réplica con menos
+    elementos en curso.
+
+    Si el proceso de una réplica muere, sus solicitudes en curso fallan con
+    `RuntimeError` y la réplica se relanza (si ya había cargado antes); una réplica
+    que muere o falla durante la carga queda fuera de la rotación.
+    """
+
+    def __init__(
+        self,
+        modelo_dir: str,
+        num_replicas: int,
+        max_length: int = 512,
+        timeout_carga: float = 600.0,
+        timeout_lote: float = 120.0,
+        intervalo_revision: float = 1.0
+    ):
+        self.modelo_dir = modelo_dir
+        self.num_replicas = max(1, num_replicas)
+        self.max_length = max_length
+        self.timeout_carga = timeout_carga
+        self.timeout_lote = timeout_lote
+        self.intervalo_revision = intervalo_revision
+        self._contexto = multiprocessing.get_context("spawn")
+        self._procesos: List[Any] = []
+        self._entradas: List[Any] = []
+        self._nucleos: List[List[int]] = []
+        self._salida = None
+        self._carga: List[int] = []
+        self._pendientes: Dict[int, tuple] = {}
+        self._listas: List[Optional[bool]] = []
+        self._lock = threading.Lock()
+        self._listo = threading.Condition(self._lock)
+        self._ids = itertools.count()
+        self._receptor: Optional[threading.Thread] = None
+        self._detenido = False
+
+    def _repartir_nucleos(self) -> List[List[int]]:
+        if hasattr(os, "sched_getaffinity"):
+            nucleos = sorted(os.sched_getaffinity(0))
+        else:
+            nucleos = list(range(os.cpu_count() or 1))
+        tamano = max(1, len(nucleos) // self.num_replicas)
+        return [nucleos[i * tamano:(i + 1) * tamano] or nucleos for i in range(self.num_replicas)]
+
+    def iniciar(self) -> bool:
+        """Lanza las réplicas y espera a que terminen de cargar los modelos."""
+        self._salida = self._contexto.Queue()
+        self._receptor = threading.Thread(target=self._recibir, name="receptor-replicas", daemon=True)
+        self._receptor.start()
+
+        with self._lock:
+            for indice, nucleos in enumerate(self._repartir_nucleos()):
+                self._procesos.append(None)
+                self._entradas.append(None)
+                self._nucleos.append(nucleos)
+                self._carga.append(0)
+                self._listas.append(None)
+                self._lanzar(indice)
+
+        with self._listo:
+            self._listo.wait_for(lambda: all(estado is not None for estado in self._listas), timeout=self.timeout_carga)
+            disponibles = sum(1 for estado in self._listas if estado)
+        logger.info(f"Réplicas de inferencia disponibles: {disponibles}/{self.num_replicas}")
+        return disponibles > 0
+
+    def _lanzar(self, indice: int):
+        """Lanza (o relanza) el proceso de una réplica con una cola de entrada nueva. Requiere el lock."""
+        nucleos = self._nucleos[indice]
+        entrada = self._contexto.Queue()
+        proceso = self._contexto.Process(
+            target=_proceso_replica,
+            args=(indice, nucleos, len(nucleos), self.modelo_dir, self.max_length, entrada, self._salida),
+            name=f"replica-inferencia-{indice}",
+            daemon=True
+        )
+        proceso.start()
+        self._procesos[indice] = proceso
+        self._entradas[indice] = entrada
+        self._carga[indice] = 0
+        self._listas[indice] = None
+        logger.info(f"Réplica {indice} iniciada (pid {proceso.pid}, núcleos {nucleos})")
+
+    def _revisar_replicas(self):
+        """
+        Detecta réplicas cuyo proceso terminó: falla sus solicitudes en curso (nadie
+        más les responderá) y relanza las que ya habían cargado.
+        """
+        fallidos = []
+        with self._lock:
+            if self._detenido:
+                return
+            for indice, proceso in enumerate(self._procesos):
+                if proceso is None or self._listas[indice] is False or proceso.is_alive():
+                    continue
+                cargada = self._listas[indice]
+                logger.error(f"La réplica {indice} (pid {proceso.pid}) terminó con código {proceso.exitcode}")
+                for solicitud_id, (futuro, _, asignada) in list(self._pendientes.items()):
+                    if asignada == indice:
+                        del self._pendientes[solicitud_id]
+                        fallidos.append(futuro)
+                if cargada:
+                    self._lanzar(indice)
+                else:
+                    # Murió durante la carga: relanzarla repetiría el mismo fallo
+                    self._listas[indice] = False
+                    self._listo.notify_all()
+        for futuro in fallidos:
+            if not futuro.done():
+                futuro.set_exception(RuntimeError("La réplica de inferencia terminó inesperadamente"))
+
+    def _recibir(self):
+        """Entrega a cada Future el resultado que devuelven las réplicas y vigila que sigan vivas."""
+        proxima_revision = time.monotonic() + self.intervalo_revision
+        while True:
+            # La revisión corre también con tráfico: las demás réplicas siguen respondiendo
+            if time.monotonic() >= proxima_revision:
+                self._revisar_replicas()
+                proxima_revision = time.monotonic() + self.intervalo_revision
+            try:
+                mensaje = self._salida.get(timeout=self.intervalo_revision)
+            except queue.Empty:
+                continue
+            if mensaje is None:
+                break
+            solicitud_id, indice, ok, resultado = mensaje
+            with self._lock:
+                if solicitud_id is None:
+                    self._listas[indice] = ok
+                    if ok:
+                        logger.info(f"Réplica {indice} lista: {resultado}")
+                    else:
+                        logger.error(f"Réplica {indice}: {resultado}")
+                    self._listo.notify_all()
+                    continue
+                futuro, tamano, _ = self._pendientes.pop(solicitud_id, (None, 0, indice))
+                self._carga[indice] -= tamano
+            if futuro is None or futuro.done():
+                continue
+            if ok:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(RuntimeError(resultado))
+
+    def enviar(self, tarea: str, lote: Sequence[Any]) -> Future:
+        """Envía un lote a la réplica disponible con menos elementos en curso."""
+        return self._enviar(tarea, lote)[1]
+
+    def _enviar(self, tarea: str, lote: Sequence[Any]):
+        futuro: Future = Future()
+        with self._lock:
+            candidatas = [
+                i for i, proceso in enumerate(self._procesos)
+                if self._listas[i] and proceso.is_alive()
+            ]
+            if not candidatas:
+                raise RuntimeError("No hay réplicas de inferencia disponibles")
+            indice = min(candidatas, key=lambda i: self._carga[i])
+            solicitud_id = next(self._ids)
+            self._pendientes[solicitud_id] = (futuro, len(lote), indice)
+            self._carga[indice] += len(lote)
+            entrada = self._entradas[indice]
+        entrada.put((solicitud_id, tarea, list(lote)))
+        return solicitud_id, futuro
+
+    def ejecutar_lote(self, tarea: str, lote: Sequence[Any]) -> List[Any]:
+        """
+        Ejecuta un lote en una réplica y espera su resultado, como máximo
+        `timeout_lote` segundos; al vencer se abandona la solicitud y se lanza
+        `TimeoutError`, de modo que quien espera (el planificador) nunca queda bloqueado.
+        """
+        solicitud_id, futuro = self._enviar(tarea, lote)
+        try:
+            return futuro.result(timeout=self.timeout_lote)
+        except FutureTimeoutError:
+            with self._lock:
+                pendiente = self._pendientes.pop(solicitud_id, None)
+                if pendiente is not None:
+                    self._carga[pendiente[2]] -= pendiente[1]
+            raise TimeoutError(f"La réplica no respondió el lote '{tarea}' en {self.timeout_lote:.0f} s")
+
+    def detener(self):
+        with self._lock:
+            self._detenido = True
+        for entrada in self._entradas:
+            if entrada is not None:
+                entrada.put(None)
+        for proceso in self._procesos:
+            if proceso is not None:
+                proceso.join(timeout=5)
+        if self._salida is not None:
+            self._salida.put(None)
+        logger.info("Réplicas de inferencia detenidas")
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils.helpers import normalizar_pregunta
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ResponseCacheConfig:
+    """Configuración del caché persistente de respuestas generadas."""
+    db_path: str = ".response_cache/respuestas.sqlite3"
+    max_entries: int = 2000
+    ttl_seconds: float = 7 * 24 * 3600  # Una semana
+
+
+class ResponseCache:
+    """
+    Caché LRU + TTL de respuestas generales (RAG / T5) persistido en SQLite.
+
+    La clave combina la pregunta normalizada con la generación del índice, de modo
+    que cualquier cambio en los documentos indexados invalida las entradas previas.
+    Solo debe usarse para respuestas que no dependen del empleado que pregunta.
+    """
+
+    def __init__(self, config: Optional[ResponseCacheConfig] = None):
+        self.config = config or ResponseCacheConfig()
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        Path(self.config.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.config.db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS respuestas (
+                clave TEXT PRIMARY KEY,
+                generacion TEXT NOT NULL,
+                respuesta TEXT NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self._cargar()
+
+    @staticmethod
+    def _clave(pregunta: str, generacion: str) -> str:
+        normalizada = normalizar_pregunta(pregunta)
+        return hashlib.sha1(f"{generacion}\x00{normalizada}".encode("utf-8")).hexdigest()
+
+    def _cargar(self):
+        """Carga las entradas vigentes desde disco en orden de uso."""
+        limite = time.time() - self.config.ttl_seconds
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM respuestas WHERE creado < ?", (limite,))
+                self._conn.commit()
+                filas = self._conn.execute(
+                    "SELECT clave, generacion, respuesta, creado FROM respuestas ORDER BY ultimo_acceso"
+                ).fetchall()
+                for clave, generacion, respuesta, creado in filas:
+                    self._entradas[clave] = (generacion, respuesta, creado)
+                self._evict()
+            logger.info(f"Caché de respuestas cargado: {len(self._entradas)} entradas")
+        except sqlite3.Error as e:
+            logger.warning(f"Error al cargar caché de respuestas: {e}")
+
+    def _evict(self):
+        """Elimina las entradas menos usadas hasta respetar el tamaño máximo."""
+        eliminadas = []
+        while len(self._entradas) > self.config.max_entries:
+            clave, _ = self._entradas.popitem(last=False)
+            eliminadas.append((clave,))
+        if eliminadas:
+            self._conn.executemany("DELETE FROM respuestas WHERE clave = ?", eliminadas)
+            self._conn.commit()
+
+    def obtener(self, pregunta: str, generacion: str) -> Optional[str]:
+        """Retorna la respuesta cacheada para la pregunta o None si no existe o expiró."""
+        clave = self._clave(pregunta, generacion)
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            _, respuesta, creado = entrada
+            if ahora - creado > self.config.ttl_seconds:
+                del self._entradas[clave]
+                self._conn.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._conn.execute("UPDATE respuestas SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave))
+            self._conn.commit()
+            self.hits += 1
+            return respuesta
+
+    def guardar(self, pregunta: str, generacion: str, respuesta: str) -> None:
+        """Guarda una respuesta general asociada a la generación actual del índice."""
+        clave = self._clave(pregunta, generacion)
+        ahora = time.time()
+        try:
+            with self._lock:
+                self._entradas[clave] = (generacion, respuesta, ahora)
+                self._entradas.move_to_end(clave)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?)",
+                    (clave, generacion, respuesta, ahora, ahora)
+                )
+                self._conn.commit()
+                self._evict()
+        except sqlite3.Error as e:
+            logger.warning(f"Error al guardar respuesta en caché: {e}")
+
+    def invalidar(self, generacion_vigente: Optional[str] = None) -> int:
+        """Elimina las entradas de generaciones distintas a la vigente (o todas)."""
+        with self._lock:
+            if generacion_vigente is None:
+                obsoletas = list(self._entradas)
+            else:
+                obsoletas = [c for c, (g, _, _) in self._entradas.items() if g != generacion_vigente]
+            for clave in obsoletas:
+                del self._entradas[clave]
+            if generacion_vigente is None:
+                self._conn.execute("DELETE FROM respuestas")
+            else:
+                self._conn.execute("DELETE FROM respuestas WHERE generacion != ?", (generacion_vigente,))
+            self._conn.commit()
+        if obsoletas:
+            logger.info(f"Caché de respuestas invalidado: {len(obsoletas)} entradas eliminadas")
+        return len(obsoletas)
+
+    def estadisticas(self) -> Dict[str, float]:
+        """Retorna métricas básicas de uso del caché."""
+        total = self.hits + self.misses
+        return {
+            "entradas": len(self._entradas),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
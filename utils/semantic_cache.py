@@ -0,0 +1,193 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.bm25_index import tokenizar
+from utils.helpers import normalizar_pregunta
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SemanticCacheConfig:
+    """Configuración del caché semántico de respuestas."""
+    # Valor conservador; el umbral del modelo en uso se calibra con benchmarks/bench_cache_semantico.py
+    similarity_threshold: float = 0.95
+    # Los términos de la pregunta guardada deben aparecer en la nueva: dos preguntas que
+    # solo difieren en el cargo o la dependencia tienen similitudes de paráfrasis
+    exigir_terminos: bool = True
+    max_entries: int = 5000
+    max_aciertos_recientes: int = 1000  # Aciertos recordados para reportar falsos positivos
+
+
+class SemanticCache:
+    """
+    Caché de respuestas generales indexado por el embedding de la pregunta.
+
+    Las preguntas se guardan normalizadas en una matriz contigua; la búsqueda es un
+    único producto matriz-vector sobre ella, suficiente para unos miles de entradas
+    sin depender de una librería de ANN. Cuando se alcanza el tamaño máximo se
+    reemplaza la entrada usada hace más tiempo.
+
+    Un acierto exige similitud sobre el umbral y, con `exigir_terminos`, que la
+    pregunta nueva contenga los términos (sin palabras vacías, con stemming) de la
+    guardada: una reformulación acierta, otra entidad en la misma plantilla no.
+    """
+
+    def __init__(
+        self,
+        funcion_embedding: Callable[[str], np.ndarray],
+        config: Optional[SemanticCacheConfig] = None
+    ):
+        self.config = config or SemanticCacheConfig()
+        self.funcion_embedding = funcion_embedding
+        self._lock = threading.Lock()
+        self._matriz: Optional[np.ndarray] = None
+        self._ultimo_uso = np.zeros(self.config.max_entries, dtype=np.int64)
+        self._preguntas: List[Optional[str]] = [None] * self.config.max_entries
+        self._respuestas: List[Optional[str]] = [None] * self.config.max_entries
+        self._terminos: List[Counter] = [Counter()] * self.config.max_entries
+        self._total = 0
+        self._reloj = 0
+        self._generacion: Optional[str] = None
+        self._aciertos_recientes: "OrderedDict[str, int]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.false_hits = 0
+        self.evictions = 0
+
+    def _embedding_normalizado(self, pregunta: str, embedding: Optional[np.ndarray]) -> np.ndarray:
+        if embedding is None:
+            embedding = self.funcion_embedding(pregunta)
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma > 0 else vector
+
+    def _sincronizar_generacion(self, generacion: str):
+        """Descarta el contenido si los documentos indexados cambiaron."""
+        if generacion != self._generacion:
+            if self._total:
+                logger.info(f"Caché semántico invalidado por cambio de generación ({self._total} entradas)")
+            self._total = 0
+            self._ultimo_uso[:] = 0
+            self._preguntas = [None] * self.config.max_entries
+            self._respuestas = [None] * self.config.max_entries
+            self._terminos = [Counter()] * self.config.max_entries
+            self._aciertos_recientes.clear()
+            self._generacion = generacion
+
+    def _buscar_slot(self, vector: np.ndarray):
+        if self._matriz is None or self._total == 0:
+            return -1, 0.0
+        similitudes = self._matriz[:self._total] @ vector
+        slot = int(np.argmax(similitudes))
+        return slot, float(similitudes[slot])
+
+    def buscar(self, pregunta: str, generacion: str, embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        """Retorna la respuesta de una pregunta equivalente ya respondida, si existe."""
+        vector = self._embedding_normalizado(pregunta, embedding)
+        with self._lock:
+            self._sincronizar_generacion(generacion)
+            slot, similitud = self._buscar_slot(vector)
+            if slot < 0 or similitud < self.config.similarity_threshold or not self._terminos_compatibles(slot, pregunta):
+                self.misses += 1
+                return None
+
+            self._reloj += 1
+            self._ultimo_uso[slot] = self._reloj
+            self.hits += 1
+            self._aciertos_recientes[normalizar_pregunta(pregunta)] = slot
+            while len(self._aciertos_recientes) > self.config.max_aciertos_recientes:
+                self._aciertos_recientes.popitem(last=False)
+            logger.debug(f"Acierto semántico ({similitud:.3f}): '{pregunta}' ~ '{self._preguntas[slot]}'")
+            return self._respuestas[slot]
+
+    def _terminos_compatibles(self, slot: int, pregunta: str) -> bool:
+        return not self.config.exigir_terminos or not self._terminos[slot] - Counter(tokenizar(pregunta))
+
+    def guardar(
+        self,
+        pregunta: str,
+        respuesta: str,
+        generacion: str,
+        embedding: Optional[np.ndarray] = None
+    ) -> None:
+        """Agrega una pregunta general ya respondida al caché."""
+        vector = self._embedding_normalizado(pregunta, embedding)
+        with self._lock:
+            self._sincronizar_generacion(generacion)
+            if self._matriz is None:
+                self._matriz = np.zeros((self.config.max_entries, vector.shape[0]), dtype=np.float32)
+
+            terminos = Counter(tokenizar(pregunta))
+            slot, similitud = self._buscar_slot(vector)
+            if slot < 0 or similitud < 0.99 or self._terminos[slot] != terminos:
+                if self._total < self.config.max_entries:
+                    slot = self._total
+                    self._total += 1
+                else:
+                    slot = int(np.argmin(self._ultimo_uso[:self._total]))
+                    self.evictions += 1
+                self._olvidar_aciertos(slot)
+
+            self._reloj += 1
+            self._matriz[slot] = vector
+            self._ultimo_uso[slot] = self._reloj
+            self._preguntas[slot] = pregunta
+            self._respuestas[slot] = respuesta
+            self._terminos[slot] = terminos
+
+    def registrar_falso_acierto(self, pregunta: str) -> bool:
+        """
+        Marca como incorrecta una respuesta servida desde el caché para la pregunta
+        dada y elimina la entrada para no volver a servirla.
+        """
+        with self._lock:
+            slot = self._aciertos_recientes.pop(normalizar_pregunta(pregunta), None)
+            if slot is None or self._respuestas[slot] is None:
+                return False
+            self.false_hits += 1
+            self._eliminar_slot(slot)
+            logger.info(f"Falso acierto registrado en caché semántico para: '{pregunta}'")
+            return True
+
+    def _olvidar_aciertos(self, slot: int):
+        for clave in [c for c, v in self._aciertos_recientes.items() if v == slot]:
+            del self._aciertos_recientes[clave]
+
+    def _eliminar_slot(self, slot: int):
+        """Elimina una entrada moviendo la última a su posición."""
+        ultimo = self._total - 1
+        self._olvidar_aciertos(slot)
+        if slot != ultimo:
+            self._matriz[slot] = self._matriz[ultimo]
+            self._ultimo_uso[slot] = self._ultimo_uso[ultimo]
+            self._preguntas[slot] = self._preguntas[ultimo]
+            self._respuestas[slot] = self._respuestas[ultimo]
+            self._terminos[slot] = self._terminos[ultimo]
+            for clave, valor in self._aciertos_recientes.items():
+                if valor == ultimo:
+                    self._aciertos_recientes[clave] = slot
+        self._ultimo_uso[ultimo] = 0
+        self._preguntas[ultimo] = None
+        self._respuestas[ultimo] = None
+        self._terminos[ultimo] = Counter()
+        self._total = ultimo
+
+    def estadisticas(self) -> Dict[str, float]:
+        """Retorna métricas de uso: tasa de aciertos y de falsos aciertos."""
+        consultas = self.hits + self.misses
+        return {
+            "entradas": self._total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "false_hits": self.false_hits,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / consultas if consultas else 0.0,
+            "false_hit_rate": self.false_hits / self.hits if self.hits else 0.0
+        }
@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.helpers import normalizar_pregunta
+
+logger = logging.getLogger(__name__)
+
+PREFIJO_PREGUNTA = "Pregunta: "
+SEPARADOR_RESPUESTA = "\nRespuesta: "
+
+
+def _par_de_registro(registro) -> Optional[Tuple[str, str]]:
+    if not isinstance(registro, dict):
+        return None
+    pregunta = registro.get("question", registro.get("pregunta"))
+    respuesta = registro.get("answer", registro.get("respuesta"))
+    if not isinstance(pregunta, str) or not isinstance(respuesta, str):
+        return None
+    return pregunta.strip(), respuesta.strip()
+
+
+def leer_pares_qa(ruta: str) -> Iterator[Tuple[str, str]]:
+    """
+    Lee los pares (pregunta, respuesta) del dataset de entrenamiento.
+
+    Un archivo `.jsonl` se recorre línea a línea, con un objeto
+    `{"question": ..., "answer": ...}` por línea, sin cargarlo completo en memoria.
+    Cualquier otra extensión se lee con el formato anterior: un JSON con las
+    listas `question` y `answer` (o una lista de objetos).
+    """
+    if Path(ruta).suffix.lower() == ".jsonl":
+        with open(ruta, "r", encoding="utf-8") as f:
+            for numero, linea in enumerate(f, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    par = _par_de_registro(json.loads(linea))
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Línea {numero} del dataset ignorada: {e}")
+                    continue
+                if par is None:
+                    logger.warning(f"Línea {numero} del dataset sin pregunta o respuesta")
+                    continue
+                yield par
+        return
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    if isinstance(dataset, dict):
+        for pregunta, respuesta in zip(dataset.get("question", []), dataset.get("answer", [])):
+            par = _par_de_registro({"question": pregunta, "answer": respuesta})
+            if par is not None:
+                yield par
+    else:
+        for registro in dataset:
+            par = _par_de_registro(registro)
+            if par is not None:
+                yield par
+
+
+def texto_par_qa(pregunta: str, respuesta: str) -> str:
+    """Texto que se indexa para un par QA; es la única copia de la pregunta y la respuesta."""
+    return f"{PREFIJO_PREGUNTA}{pregunta}{SEPARADOR_RESPUESTA}{respuesta}"
+
+
+def separar_par_qa(texto: str) -> Tuple[str, str]:
+    """Inverso de `texto_par_qa`."""
+    pregunta, _, respuesta = texto.partition(SEPARADOR_RESPUESTA)
+    if pregunta.startswith(PREFIJO_PREGUNTA):
+        pregunta = pregunta[len(PREFIJO_PREGUNTA):]
+    return pregunta, respuesta
+
+
+class RespuestasExactas:
+    """
+    Respuestas curadas del dataset indexadas por la pregunta normalizada (minúsculas,
+    sin tildes ni puntuación). Una pregunta idéntica a una del dataset se responde
+    con un acceso a diccionario, sin clasificar, buscar ni generar.
+    """
+
+    def __init__(self, respuestas: Optional[Dict[str, str]] = None):
+        self._respuestas: Dict[str, str] = respuestas or {}
+
+    def __len__(self) -> int:
+        return len(self._respuestas)
+
+    def agregar(self, pregunta: str, respuesta: str) -> bool:
+        """Registra el par; retorna False si la pregunta normalizada ya existía (duplicado)."""
+        clave = normalizar_pregunta(pregunta)
+        if not clave or clave in self._respuestas:
+            return False
+        self._respuestas[clave] = respuesta
+        return True
+
+    def obtener(self, pregunta: str) -> Optional[str]:
+        return self._respuestas.get(normalizar_pregunta(pregunta))
+
+    def guardar(self, ruta: str) -> None:
+        ruta = Path(ruta)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = ruta.with_suffix(".tmp")
+        temporal.write_text(json.dumps(self._respuestas, ensure_ascii=False), encoding="utf-8")
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> "RespuestasExactas":
+        """Carga las respuestas guardadas; vacías si no existen o son ilegibles."""
+        if not Path(ruta).exists():
+            return cls()
+        try:
+            return cls(json.loads(Path(ruta).read_text(encoding="utf-8")))
+        except Exception as e:
+            logger.warning(f"Respuestas exactas ilegibles en {ruta}: {e}")
+            return cls()
@@ -2,6 +2,7 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 import re
 import logging
+from utils.keyword_matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
@@ -53,12 +54,16 @@ def get_transform_keywords() -> Dict[str, Dict[str, Any]]:
     """Retorna el diccionario de palabras clave para transformaciones."""
     return TRANSFORM_KEYWORDS
 
+def get_transform_keyword_groups() -> Dict[str, list]:
+    """Retorna las palabras clave de cada transformación, en orden de prioridad."""
+    return {nombre: info["keywords"] for nombre, info in TRANSFORM_KEYWORDS.items()}
+
+_transform_matcher = KeywordMatcher().agregar_tabla("transformaciones", get_transform_keyword_groups())
+
 def get_transform_by_keyword(keyword: str) -> Optional[Dict[str, Any]]:
     """Busca una transformación por palabra clave."""
-    for transform_info in TRANSFORM_KEYWORDS.values():
-        if any(kw in keyword.lower() for kw in transform_info["keywords"]):
-            return transform_info
-    return None
+    nombre = _transform_matcher.buscar(keyword).primer_grupo("transformaciones")
+    return TRANSFORM_KEYWORDS[nombre] if nombre else None
 
 def parse_fecha_segura(fecha_str):
     fecha_limpia = fecha_str.strip().split()[0]  # elimina espacios y partes de hora si hay
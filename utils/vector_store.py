@@ -0,0 +1,466 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIPOS_INDICE_FAISS = ("flat", "hnsw", "ivfpq")
+# Cuantización escalar de los vectores en los índices flat y HNSW
+CUANTIZACIONES = ("float32", "float16", "int8")
+
+
+class VectorStore(ABC):
+    """
+    Interfaz de almacén vectorial que usa `DocumentIndexer`. Es el subconjunto de la
+    API de una colección de Chroma (`add`, `query`, `get`, `delete`, `update`,
+    `count`), de modo que una colección de Chroma la cumple directamente y otros
+    backends solo tienen que imitarla. Las distancias son de coseno (1 - similitud).
+    """
+
+    @abstractmethod
+    def add(self, documents: Sequence[str], embeddings: Sequence[np.ndarray], metadatas: Sequence[Dict], ids: Sequence[str]) -> None:
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 10,
+              include: Optional[List[str]] = None, where: Optional[Dict] = None) -> Dict[str, List]:
+        ...
+
+    @abstractmethod
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None,
+            include: Optional[List[str]] = None) -> Dict[str, List]:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None) -> None:
+        ...
+
+    @abstractmethod
+    def update(self, ids: Sequence[str], metadatas: Sequence[Dict]) -> None:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def guardar(self) -> None:
+        """Persiste el almacén (no hace nada si el backend persiste solo)."""
+
+    def optimizar(self) -> None:
+        """Compacta o reconstruye el índice (no hace nada si el backend no lo necesita)."""
+
+
+def _cumple_filtro(metadata: Dict, where: Optional[Dict]) -> bool:
+    """Evalúa el subconjunto de filtros `where` de Chroma que usa la aplicación."""
+    if not where:
+        return True
+    for campo, condicion in where.items():
+        if campo == "$and":
+            if not all(_cumple_filtro(metadata, c) for c in condicion):
+                return False
+            continue
+        if campo == "$or":
+            if not any(_cumple_filtro(metadata, c) for c in condicion):
+                return False
+            continue
+        valor = metadata.get(campo)
+        if isinstance(condicion, dict):
+            for operador, esperado in condicion.items():
+                if operador == "$in" and valor not in esperado:
+                    return False
+                if operador == "$nin" and valor in esperado:
+                    return False
+                if operador == "$eq" and valor != esperado:
+                    return False
+                if operador == "$ne" and valor == esperado:
+                    return False
+        elif valor != condicion:
+            return False
+    return True
+
+
+def _subcuantizadores(dimension: int, maximo: int) -> int:
+    """Mayor número de sub-cuantizadores PQ (hasta `maximo`) que divide la dimensión."""
+    return next(m for m in range(min(maximo, dimension), 0, -1) if dimension % m == 0)
+
+
+class FaissVectorStore(VectorStore):
+    """
+    Almacén vectorial en proceso sobre FAISS con índices flat (exacto), HNSW o
+    IVF-PQ (comprimido). Los vectores se normalizan y se busca por producto
+    interno, equivalente al coseno de la colección de Chroma. IVF-PQ usa hasta
+    `pq_m` sub-cuantizadores: el mayor número que divide la dimensión (las
+    dimensiones de PCA no siempre son múltiplos de 16).
+
+    Con `cuantizacion` "float16" o "int8" los índices flat y HNSW guardan los
+    vectores con un cuantizador escalar de FAISS (el de 8 bits aprende el rango de
+    cada dimensión), y la matriz en disco se guarda en float16.
+
+    Los documentos y metadatos viven en una base SQLite al lado del índice, y el
+    origen de cada fragmento se mantiene en memoria para filtrar sin consultarla.
+    Las eliminaciones marcan la posición como inactiva; `optimizar` compacta. Al
+    cargar, la matriz de vectores y el índice se abren como memoria mapeada.
+    """
+
+    def __init__(
+        self,
+        directorio: str,
+        tipo: str = "hnsw",
+        hnsw_m: int = 32,
+        hnsw_ef_search: int = 128,
+        ivf_nprobe: int = 16,
+        pq_m: int = 16,
+        cuantizacion: str = "float32"
+    ):
+        import faiss
+        if tipo not in TIPOS_INDICE_FAISS:
+            raise ValueError(f"Tipo de índice FAISS no soportado: {tipo}")
+        if cuantizacion not in CUANTIZACIONES:
+            raise ValueError(f"Cuantización no soportada: {cuantizacion}")
+        self._faiss = faiss
+        self.tipo = tipo
+        self.cuantizacion = cuantizacion
+        self._dtype_matriz = np.float32 if cuantizacion == "float32" else np.float16
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivf_nprobe = ivf_nprobe
+        self.pq_m = pq_m
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+
+        self._matriz: Optional[np.ndarray] = None
+        self._pendientes: List[np.ndarray] = []
+        self._indice = None
+        self._en_indice = 0  # Filas de la matriz ya agregadas al índice
+        self._indice_mapeado = False
+        self._ids: List[str] = []
+        self._posicion: Dict[str, int] = {}
+        self._origenes: List[str] = []
+        self._activos = np.zeros(0, dtype=bool)
+
+        self._db = sqlite3.connect(str(self.directorio / "metadatos.db"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fragmentos ("
+            "pos INTEGER PRIMARY KEY, id TEXT UNIQUE, origen TEXT, documento TEXT, metadata TEXT)"
+        )
+        self._cargar()
+
+    # --- Persistencia ---
+
+    @property
+    def _ruta_vectores(self) -> Path:
+        return self.directorio / "vectores.npy"
+
+    @property
+    def _ruta_indice(self) -> Path:
+        if self.cuantizacion == "float32" or self.tipo == "ivfpq":
+            return self.directorio / f"indice_{self.tipo}.faiss"
+        return self.directorio / f"indice_{self.tipo}_{self.cuantizacion}.faiss"
+
+    def bytes_en_disco(self) -> int:
+        """Tamaño de la matriz de vectores y del índice guardados."""
+        return sum(r.stat().st_size for r in (self._ruta_vectores, self._ruta_indice) if r.exists())
+
+    def _cargar(self):
+        filas = self._db.execute("SELECT pos, id, origen FROM fragmentos ORDER BY pos").fetchall()
+        if not filas or not self._ruta_vectores.exists():
+            return
+        self._matriz = np.load(self._ruta_vectores, mmap_mode="r")
+        if self._matriz.dtype != self._dtype_matriz:
+            self._matriz = np.asarray(self._matriz, dtype=self._dtype_matriz)
+        total = self._matriz.shape[0]
+        self._ids = [""] * total
+        self._origenes = [""] * total
+        self._activos = np.zeros(total, dtype=bool)
+        for pos, fragmento_id, origen in filas:
+            if pos < total:
+                self._ids[pos] = fragmento_id
+                self._origenes[pos] = origen
+                self._activos[pos] = True
+                self._posicion[fragmento_id] = pos
+        if self._ruta_indice.exists():
+            try:
+                self._indice = self._faiss.read_index(str(self._ruta_indice), self._faiss.IO_FLAG_MMAP)
+                self._indice_mapeado = True
+            except Exception:
+                self._indice = self._faiss.read_index(str(self._ruta_indice))
+            self._en_indice = self._indice.ntotal
+            self._configurar_busqueda()
+        logger.info(f"Almacén FAISS ({self.tipo}) cargado: {int(self._activos.sum())} fragmentos")
+
+    def guardar(self) -> None:
+        with self._lock:
+            self._consolidar()
+            self._asegurar_indice()
+            # Se escribe a un temporal y se reemplaza: la versión anterior puede estar mapeada
+            if self._matriz is not None:
+                temporal = self._ruta_vectores.with_suffix(".tmp.npy")
+                np.save(temporal, np.ascontiguousarray(self._matriz))
+                os.replace(temporal, self._ruta_vectores)
+            if self._indice is not None:
+                temporal = self._ruta_indice.with_suffix(".tmp")
+                self._faiss.write_index(self._indice, str(temporal))
+                os.replace(temporal, self._ruta_indice)
+            self._db.commit()
+
+    # --- Índice ---
+
+    def _consolidar(self):
+        """Une los vectores pendientes a la matriz principal."""
+        if not self._pendientes:
+            return
+        partes = ([np.asarray(self._matriz)] if self._matriz is not None else []) + self._pendientes
+        self._matriz = np.concatenate(partes).astype(self._dtype_matriz, copy=False)
+        self._pendientes = []
+
+    def _crear_indice(self, dimension: int, entrenamiento: np.ndarray):
+        faiss = self._faiss
+        entrenamiento = np.ascontiguousarray(entrenamiento, dtype=np.float32)
+        tipo_sq = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}.get(self.cuantizacion)
+        if self.tipo == "flat":
+            if tipo_sq is None:
+                return faiss.IndexFlatIP(dimension)
+            indice = faiss.IndexScalarQuantizer(dimension, tipo_sq, faiss.METRIC_INNER_PRODUCT)
+            indice.train(entrenamiento)
+            return indice
+        if self.tipo == "hnsw":
+            if tipo_sq is None:
+                indice = faiss.IndexHNSWFlat(dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            else:
+                indice = faiss.IndexHNSWSQ(dimension, tipo_sq, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+                indice.train(entrenamiento)
+            indice.hnsw.efConstruction = 200
+            return indice
+        nlist = max(1, min(int(4 * np.sqrt(len(entrenamiento))), len(entrenamiento) // 39))
+        pq_m = _subcuantizadores(dimension, self.pq_m)
+        if pq_m != self.pq_m:
+            logger.info(f"IVF-PQ con {pq_m} sub-cuantizadores: {self.pq_m} no divide la dimensión {dimension}")
+        cuantizador = faiss.IndexFlatIP(dimension)
+        indice = faiss.IndexIVFPQ(cuantizador, dimension, nlist, pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+        indice.train(entrenamiento)
+        return indice
+
+    def _configurar_busqueda(self):
+        if self.tipo == "hnsw":
+            self._indice.hnsw.efSearch = self.hnsw_ef_search
+        elif self.tipo == "ivfpq":
+            self._indice.nprobe = self.ivf_nprobe
+
+    def _asegurar_indice(self):
+        """Agrega al índice las filas nuevas; IVF-PQ se entrena cuando hay datos suficientes."""
+        self._consolidar()
+        if self._matriz is None:
+            return
+        if self._indice is None:
+            # Los sub-cuantizadores de 8 bits de IVF-PQ necesitan ~39 vectores por centroide
+            if self.tipo == "ivfpq" and len(self._matriz) < 39 * 256:
+                return
+            self._indice = self._crear_indice(self._matriz.shape[1], np.asarray(self._matriz))
+            self._en_indice = 0
+            self._configurar_busqueda()
+        if self._en_indice < len(self._matriz):
+            if self._indice_mapeado:
+                # Un índice mapeado es de solo lectura: se carga en memoria para ampliarlo
+                self._indice = self._faiss.read_index(str(self._ruta_indice))
+                self._configurar_busqueda()
+                self._indice_mapeado = False
+            self._indice.add(np.ascontiguousarray(self._matriz[self._en_indice:], dtype=np.float32))
+            self._en_indice = len(self._matriz)
+
+    # --- API de colección ---
+
+    @staticmethod
+    def _normalizar(vectores) -> np.ndarray:
+        matriz = np.atleast_2d(np.asarray(vectores, dtype=np.float32))
+        return matriz / np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+
+    def add(self, documents, embeddings, metadatas, ids) -> None:
+        """Agrega (o reemplaza) fragmentos; si un id se repite en el lote, vale el último."""
+        ids, documents, metadatas = list(ids), list(documents), list(metadatas)
+        ultimo = {fragmento_id: i for i, fragmento_id in enumerate(ids)}
+        if len(ultimo) < len(ids):
+            elegidos = [i for i, fragmento_id in enumerate(ids) if ultimo[fragmento_id] == i]
+            ids = [ids[i] for i in elegidos]
+            documents = [documents[i] for i in elegidos]
+            metadatas = [metadatas[i] for i in elegidos]
+            embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))[elegidos]
+        with self._lock:
+            inicio = len(self._ids)
+            filas = []
+            for i, (fragmento_id, documento, metadata) in enumerate(zip(ids, documents, metadatas)):
+                anterior = self._posicion.get(fragmento_id)
+                if anterior is not None:
+                    self._activos[anterior] = False
+                    self._db.execute("DELETE FROM fragmentos WHERE id = ?", (fragmento_id,))
+                posicion = inicio + i
+                origen = (metadata or {}).get("origen", "")
+                self._ids.append(fragmento_id)
+                self._origenes.append(origen)
+                self._posicion[fragmento_id] = posicion
+                filas.append((posicion, fragmento_id, origen, documento, json.dumps(metadata or {}, ensure_ascii=False)))
+            self._db.executemany("INSERT INTO fragmentos VALUES (?, ?, ?, ?, ?)", filas)
+            self._db.commit()
+            self._pendientes.append(self._normalizar(embeddings))
+            self._activos = np.concatenate([self._activos, np.ones(len(filas), dtype=bool)])
+
+    def _filas(self, posiciones: Sequence[int]) -> Dict[int, tuple]:
+        if not posiciones:
+            return {}
+        marcadores = ",".join("?" * len(posiciones))
+        consulta = f"SELECT pos, id, documento, metadata FROM fragmentos WHERE pos IN ({marcadores})"
+        return {
+            pos: (fragmento_id, documento, json.loads(metadata))
+            for pos, fragmento_id, documento, metadata in self._db.execute(consulta, [int(p) for p in posiciones])
+        }
+
+    def _permitidas(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Máscara de posiciones que cumplen el filtro, resuelta en memoria cuando es por origen."""
+        if not where:
+            return None
+        valores = self._origenes_de_condicion(where)
+        if valores is not None:
+            return np.isin(np.array(self._origenes, dtype=object), valores)
+        mascara = np.zeros(len(self._ids), dtype=bool)
+        for pos, metadata in self._db.execute("SELECT pos, metadata FROM fragmentos"):
+            if pos < len(mascara) and _cumple_filtro(json.loads(metadata), where):
+                mascara[pos] = True
+        return mascara
+
+    @staticmethod
+    def _origenes_de_condicion(where: Dict) -> Optional[List[str]]:
+        """Orígenes aceptados si el filtro es solo por origen (igualdad, `$eq` o `$in`); si no, None."""
+        if set(where) != {"origen"}:
+            return None
+        condicion = where["origen"]
+        if not isinstance(condicion, dict):
+            return [condicion]
+        if set(condicion) == {"$eq"}:
+            return [condicion["$eq"]]
+        if set(condicion) == {"$in"}:
+            return list(condicion["$in"])
+        return None
+
+    def _buscar(self, consulta: np.ndarray, k: int) -> tuple:
+        if self._indice is None:
+            # Sin índice entrenado todavía (IVF-PQ con pocos datos): búsqueda exacta
+            similitudes = np.asarray(self._matriz, dtype=np.float32) @ consulta[0]
+            k = min(k, len(similitudes))
+            orden = np.argpartition(-similitudes, k - 1)[:k]
+            orden = orden[np.argsort(-similitudes[orden])]
+            return similitudes[orden], orden
+        similitudes, posiciones = self._indice.search(consulta, k)
+        return similitudes[0], posiciones[0]
+
+    def query(self, query_embeddings, n_results=10, include=None, where=None) -> Dict[str, List]:
+        resultado = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            self._asegurar_indice()
+            if self._matriz is None or not self._activos.any():
+                return {clave: [[] for _ in query_embeddings] for clave in resultado}
+            permitidas = self._permitidas(where)
+            validas = self._activos if permitidas is None else (self._activos & permitidas)
+            total = len(self._matriz)
+            for consulta in self._normalizar(query_embeddings):
+                consulta = consulta[None, :]
+                # Se pide más de lo necesario para compensar filtros y eliminados
+                k = min(total, n_results * 4)
+                while True:
+                    similitudes, posiciones = self._buscar(consulta, k)
+                    elegidas = [
+                        (float(s), int(p)) for s, p in zip(similitudes, posiciones)
+                        if p >= 0 and validas[p]
+                    ][:n_results]
+                    if len(elegidas) >= n_results or k >= total:
+                        break
+                    k = min(total, k * 4)
+                filas = self._filas([p for _, p in elegidas])
+                resultado["ids"].append([filas[p][0] for _, p in elegidas])
+                resultado["documents"].append([filas[p][1] for _, p in elegidas])
+                resultado["metadatas"].append([filas[p][2] for _, p in elegidas])
+                resultado["distances"].append([1.0 - s for s, _ in elegidas])
+        return resultado
+
+    def get(self, ids=None, where=None, include=None) -> Dict[str, List]:
+        with self._lock:
+            if ids is not None:
+                posiciones = [self._posicion[i] for i in ids if i in self._posicion]
+            else:
+                validas = self._activos.copy()
+                permitidas = self._permitidas(where)
+                if permitidas is not None:
+                    validas &= permitidas
+                posiciones = np.flatnonzero(validas).tolist()
+            filas = self._filas(posiciones)
+            posiciones = [p for p in posiciones if p in filas]
+            resultado = {
+                "ids": [filas[p][0] for p in posiciones],
+                "documents": [filas[p][1] for p in posiciones],
+                "metadatas": [filas[p][2] for p in posiciones],
+            }
+            if include and "embeddings" in include:
+                self._consolidar()
+                resultado["embeddings"] = (
+                    np.asarray(self._matriz[posiciones], dtype=np.float32) if posiciones
+                    else np.zeros((0, 0), dtype=np.float32)
+                )
+        return resultado
+
+    def delete(self, ids=None, where=None) -> None:
+        with self._lock:
+            objetivo = self.get(ids=ids, where=where)["ids"] if where or ids is not None else list(self._posicion)
+            for fragmento_id in objetivo:
+                posicion = self._posicion.pop(fragmento_id, None)
+                if posicion is not None:
+                    self._activos[posicion] = False
+            self._db.executemany("DELETE FROM fragmentos WHERE id = ?", [(i,) for i in objetivo])
+            self._db.commit()
+
+    def update(self, ids, metadatas) -> None:
+        """Reemplaza la metadata de fragmentos existentes; los vectores no cambian."""
+        with self._lock:
+            filas = []
+            for fragmento_id, metadata in zip(ids, metadatas):
+                posicion = self._posicion.get(fragmento_id)
+                if posicion is None:
+                    continue
+                origen = metadata.get("origen", "")
+                self._origenes[posicion] = origen
+                filas.append((origen, json.dumps(metadata, ensure_ascii=False), fragmento_id))
+            self._db.executemany("UPDATE fragmentos SET origen = ?, metadata = ? WHERE id = ?", filas)
+            self._db.commit()
+
+    def count(self) -> int:
+        return int(self._activos.sum())
+
+    def optimizar(self) -> None:
+        """Descarta las posiciones eliminadas y reconstruye el índice desde cero."""
+        with self._lock:
+            self._consolidar()
+            if self._matriz is None:
+                return
+            vivas = np.flatnonzero(self._activos)
+            nueva = np.full(len(self._activos), -1, dtype=np.int64)
+            nueva[vivas] = np.arange(len(vivas))
+            self._matriz = np.ascontiguousarray(np.asarray(self._matriz)[vivas])
+            self._ids = [self._ids[p] for p in vivas]
+            self._origenes = [self._origenes[p] for p in vivas]
+            self._posicion = {fragmento_id: i for i, fragmento_id in enumerate(self._ids)}
+            self._activos = np.ones(len(vivas), dtype=bool)
+            self._db.executemany(
+                "UPDATE fragmentos SET pos = ? WHERE pos = ?",
+                [(int(nueva[p]), int(p)) for p in sorted(vivas)]
+            )
+            self._db.commit()
+            self._indice = None
+            self._indice_mapeado = False
+            self._en_indice = 0
+            self.guardar()
+            logger.info(f"Almacén FAISS ({self.tipo}) compactado: {len(vivas)} fragmentos")
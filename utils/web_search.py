@@ -1,34 +1,226 @@
-from transformers import pipeline
-import requests
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import quote_plus, unquote, urlparse
+
+import httpx
 from bs4 import BeautifulSoup
 
-qa_pipeline = pipeline(
-    "question-answering",
-    model="mrm8488/bert-base-spanish-wwm-cased-finetuned-spa-squad2-es",
-    tokenizer="mrm8488/bert-base-spanish-wwm-cased-finetuned-spa-squad2-es"
-)
+from utils.faq_qa import mejor_respuesta
+from utils.normativa_local import NormativaLocal, extraer_texto_html
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WebSearchConfig:
+    """Configuración de la búsqueda de normativa en MinTrabajo."""
+    # {consulta} se reemplaza por la pregunta codificada; se puede apuntar a un servidor local
+    url_busqueda: str = "https://www.google.com/search?q=site%3Awww.mintrabajo.gov.co+{consulta}"
+    dominio: str = "mintrabajo.gov.co"
+    max_paginas: int = 3
+    timeout_s: float = 8.0
+    ttl_seconds: int = 24 * 3600  # Tras el TTL la página se revalida con ETag/Last-Modified
+    cache_dir: str = ".normativa_cache"
+    user_agent: str = "Mozilla/5.0"
+    top_n_ventanas: int = 8
+    # En redes sin salida a internet solo se consulta el espejo local
+    usar_web: bool = field(default_factory=lambda: os.getenv("NORMATIVA_USAR_WEB", "1") == "1")
+    top_k_local: int = 3
+
+
+# Espejo local que se consulta cuando el llamador no indica otro; la aplicación
+# registra el suyo al iniciar (ver `establecer_normativa_local`)
+_normativa_local: Optional[NormativaLocal] = None
+
+
+def establecer_normativa_local(normativa_local: Optional[NormativaLocal]) -> None:
+    """Registra el espejo local de normativa que usan por defecto las búsquedas."""
+    global _normativa_local
+    _normativa_local = normativa_local
+
+
+class PageCache:
+    """
+    Caché en disco del texto limpio de cada página, un archivo JSON por URL con su
+    ETag y Last-Modified para revalidar con peticiones condicionales.
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    def _ruta(self, url: str) -> Path:
+        return self.directorio / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+    def obtener(self, url: str) -> Optional[Dict]:
+        ruta = self._ruta(url)
+        if not ruta.exists():
+            return None
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Entrada de caché web ilegible para {url}: {e}")
+            return None
+
+    def guardar(self, url: str, texto: str, etag: Optional[str], last_modified: Optional[str]) -> Dict:
+        entrada = {
+            "url": url,
+            "texto": texto,
+            "etag": etag,
+            "last_modified": last_modified,
+            "descargada": time.time(),
+        }
+        ruta = self._ruta(url)
+        temporal = ruta.with_suffix(".tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(entrada, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+        return entrada
+
+    def renovar(self, url: str, entrada: Dict) -> None:
+        """Marca como vigente una entrada que el servidor confirmó sin cambios (304)."""
+        self.guardar(url, entrada["texto"], entrada.get("etag"), entrada.get("last_modified"))
+
+
+def _extraer_enlaces(html: str, dominio: str, maximo: int) -> List[str]:
+    """Enlaces de resultados al dominio, tanto redirecciones de Google como directos."""
+    soup = BeautifulSoup(html, "html.parser")
+    enlaces = []
+    for a in soup.find_all("a", href=True):
+        href = a["href"]
+        if "/url?q=" in href:
+            href = unquote(href.split("/url?q=", 1)[1].split("&", 1)[0])
+        if not href.startswith("http"):
+            continue
+        # El dominio o un subdominio suyo; "mintrabajo.gov.co.evil.com" no cuenta
+        hostname = (urlparse(href).hostname or "").lower()
+        if hostname != dominio and not hostname.endswith("." + dominio):
+            continue
+        if href not in enlaces:
+            enlaces.append(href)
+        if len(enlaces) >= maximo:
+            break
+    return enlaces
 
-def buscar_normativa_web(pregunta):
+
+async def _obtener_pagina(cliente: httpx.AsyncClient, cache: PageCache, url: str, ttl: int) -> Optional[str]:
+    """Retorna el texto limpio de la página desde el caché o descargándola."""
+    entrada = cache.obtener(url)
+    if entrada and time.time() - entrada["descargada"] < ttl:
+        return entrada["texto"]
+
+    encabezados = {}
+    if entrada:
+        if entrada.get("etag"):
+            encabezados["If-None-Match"] = entrada["etag"]
+        if entrada.get("last_modified"):
+            encabezados["If-Modified-Since"] = entrada["last_modified"]
     try:
-        consulta = pregunta.replace(" ", "+")
-        url = f"https://www.google.com/search?q=site%3Awww.mintrabajo.gov.co+{consulta}"
-        headers = {"User-Agent": "Mozilla/5.0"}
-        r = requests.get(url, headers=headers)
-        soup = BeautifulSoup(r.text, "html.parser")
-
-        enlaces = [a['href'] for a in soup.find_all('a', href=True) if '/url?q=' in a['href']]
-        if not enlaces:
-            return "No encontré resultados relevantes en MinTrabajo.gov.co."
-
-        primer_url = enlaces[0].split('/url?q=')[1].split('&')[0]
-        r_doc = requests.get(primer_url, headers=headers)
-        soup_doc = BeautifulSoup(r_doc.text, "html.parser")
-        texto = " ".join([p.get_text() for p in soup_doc.find_all("p")])
-
-        if not texto.strip():
-            return f"Puedes revisar directamente: {primer_url}"
-
-        respuesta = qa_pipeline({"question": pregunta, "context": texto})
-        return f"🔎 Según MinTrabajo.gov.co:\n{respuesta['answer']}\nReferencia: {primer_url}"
+        respuesta = await cliente.get(url, headers=encabezados)
+        if respuesta.status_code == 304 and entrada:
+            cache.renovar(url, entrada)
+            return entrada["texto"]
+        respuesta.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning(f"No se pudo descargar {url}: {e}")
+        # Mejor una copia vencida que nada
+        return entrada["texto"] if entrada else None
+
+    texto = extraer_texto_html(respuesta.text)
+    cache.guardar(url, texto, respuesta.headers.get("ETag"), respuesta.headers.get("Last-Modified"))
+    return texto
+
+
+async def _responder_con_qa(pregunta: str, textos: Dict[str, str], top_n: int, preclasificados: bool = False):
+    # El QA es intensivo en CPU: no debe bloquear el event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, partial(mejor_respuesta, pregunta, textos, top_n=top_n, preclasificados=preclasificados)
+    )
+
+
+async def buscar_normativa_web_async(
+    pregunta: str,
+    config: Optional[WebSearchConfig] = None,
+    normativa_local: Optional[NormativaLocal] = None
+) -> str:
+    """
+    Busca la pregunta primero en el espejo local de normativa (el indicado o, si no,
+    el registrado con `establecer_normativa_local`) y, si no hay respuesta, en
+    MinTrabajo: descarga en paralelo las primeras páginas (con timeout por petición
+    y caché en disco) y responde con QA por lotes sobre las ventanas más relevantes
+    de esas páginas.
+    """
+    config = config or WebSearchConfig()
+    normativa_local = normativa_local or _normativa_local
+    try:
+        if normativa_local is not None:
+            # Embedding de la consulta y búsqueda en el índice fuera del event loop
+            loop = asyncio.get_running_loop()
+            fragmentos = await loop.run_in_executor(
+                None, partial(normativa_local.buscar, pregunta, top_k=config.top_k_local)
+            )
+            if fragmentos:
+                textos = {f"{f['origen']}#{f['id']}": f["texto"] for f in fragmentos}
+                mejor = await _responder_con_qa(pregunta, textos, config.top_n_ventanas, preclasificados=True)
+                if mejor:
+                    origen = mejor[0].split("#", 1)[0]
+                    return f"📚 Según la normativa local:\n{mejor[1]}\nReferencia: {origen}"
+
+        if not config.usar_web:
+            return "No encontré resultados relevantes en la normativa local."
+
+        cache = PageCache(config.cache_dir)
+        async with httpx.AsyncClient(
+            timeout=config.timeout_s,
+            headers={"User-Agent": config.user_agent},
+            follow_redirects=True
+        ) as cliente:
+            url = config.url_busqueda.format(consulta=quote_plus(pregunta))
+            r = await cliente.get(url)
+            r.raise_for_status()
+            enlaces = _extraer_enlaces(r.text, config.dominio, config.max_paginas)
+            if not enlaces:
+                return "No encontré resultados relevantes en MinTrabajo.gov.co."
+
+            textos = await asyncio.gather(*(
+                _obtener_pagina(cliente, cache, enlace, config.ttl_seconds) for enlace in enlaces
+            ))
+
+        paginas = {enlace: texto for enlace, texto in zip(enlaces, textos) if texto and texto.strip()}
+        if not paginas:
+            return f"Puedes revisar directamente: {enlaces[0]}"
+
+        mejor = await _responder_con_qa(pregunta, paginas, config.top_n_ventanas)
+        if not mejor:
+            return f"Puedes revisar directamente: {enlaces[0]}"
+
+        return f"🔎 Según MinTrabajo.gov.co:\n{mejor[1]}\nReferencia: {mejor[0]}"
     except Exception as e:
-        return f"Error al buscar normatividad en línea: {str(e)}"
\ No newline at end of file
+        return f"Error al buscar normatividad en línea: {str(e)}"
+
+
+def buscar_normativa_web(pregunta, config: Optional[WebSearchConfig] = None, normativa_local: Optional[NormativaLocal] = None):
+    """
+    Versión síncrona de `buscar_normativa_web_async`. Si se llama desde un hilo con
+    un event loop en marcha (un handler de NiceGUI, por ejemplo), la búsqueda corre
+    con su propio loop en un hilo aparte; desde código async es preferible hacer
+    `await buscar_normativa_web_async(...)`, que no bloquea el loop.
+    """
+    corrutina = buscar_normativa_web_async(pregunta, config, normativa_local)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(corrutina)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="normativa-web") as ejecutor:
+        return ejecutor.submit(asyncio.run, corrutina).result()